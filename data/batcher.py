@@ -0,0 +1,112 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError
+from typing import Any, Callable, Dict, List, Sequence
+
+
+class MicroBatcher:
+    """
+    Collects items submitted from many threads / requests and processes them together.
+    
+    A worker thread waits for the first pending item, then keeps gathering items for up to
+    `max_wait_ms` milliseconds or until `max_batch_size` items are pending, calls
+    `process(items)` once and resolves each caller's future with its own row of the result.
+    
+    Args:
+        process: function mapping a list of items to a sequence of results of the same length
+        max_batch_size: maximum number of items per call to `process`
+        max_wait_ms: how long the first item of a batch may wait for company
+    """
+    
+    def __init__(self,
+                 process: Callable[[List[Any]], Sequence[Any]],
+                 max_batch_size: int = 32,
+                 max_wait_ms: float = 5,
+                 name: str = 'micro-batcher',
+                 ):
+        self.process = process
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.largest_batch = 0
+        self.total_wait_ms = 0.0
+        self.total_process_ms = 0.0
+        
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+    
+    def submit(self, item) -> Future:
+        future = Future()
+        self._queue.put((item, future, time.monotonic()))
+        return future
+    
+    def __call__(self, item):
+        """Submit an item and block until its result is ready"""
+        return self.submit(item).result()
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait_ms,
+                'pending': self._queue.qsize(),
+                'batches': self.batches,
+                'items': self.items,
+                'largest_batch': self.largest_batch,
+                'mean_batch_size': self.items / self.batches if self.batches else 0.0,
+                'mean_wait_ms': self.total_wait_ms / self.items if self.items else 0.0,
+                'mean_process_ms': self.total_process_ms / self.batches if self.batches else 0.0,
+            }
+    
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait_ms / 1000
+        
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+    
+    def _run(self):
+        while True:
+            # Futures cancelled while waiting (e.g. the client went away) are dropped here;
+            # the others can no longer be cancelled once their batch is taken
+            batch = [entry for entry in self._collect() if entry[1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            started = time.monotonic()
+            items = [item for item, _, _ in batch]
+            
+            try:
+                results = self.process(items)
+                if len(results) != len(items):
+                    raise ValueError(f"Batch function returned {len(results)} results for {len(items)} items")
+            except Exception as e:
+                results = None
+                error = e
+            
+            for i, (_, future, _) in enumerate(batch):
+                try:
+                    if results is None:
+                        future.set_exception(error)
+                    else:
+                        future.set_result(results[i])
+                except InvalidStateError:
+                    # Never let one caller's future take the worker thread down
+                    pass
+            
+            finished = time.monotonic()
+            with self._stats_lock:
+                self.batches += 1
+                self.items += len(batch)
+                self.largest_batch = max(self.largest_batch, len(batch))
+                self.total_wait_ms += sum(started - submitted for _, _, submitted in batch) * 1000
+                self.total_process_ms += (finished - started) * 1000
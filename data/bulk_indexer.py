@@ -0,0 +1,397 @@
+"""
+Bulk (re)indexing of the product catalog as a streaming pipeline:
+
+    products (Postgres) -> fetch images (I/O threads) -> CLIP preprocessing (process pool)
+        -> image encoding (fixed-size batches) -> index upserts (batched)
+
+Stages are connected by bounded queues, so a slow stage makes the ones before it wait instead
+of buffering the catalog in memory. Products are checkpointed through the `recently_indexed`
+column once all their images are in the index, so an interrupted run resumes where it stopped.
+
+Usage:
+    python bulk_indexer.py --fetch-workers 32 --preprocess-workers 4 --encode-batch-size 64
+"""
+import argparse
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from models import SessionLocal
+from product_manager import ProductManager
+
+
+_DONE = object()
+
+_processor = None
+
+
+def _init_preprocess_worker(model_name):
+    global _processor
+    from transformers import CLIPProcessor
+    _processor = CLIPProcessor.from_pretrained(model_name)
+
+
+def _preprocess_images(images):
+    return _processor(images=images, return_tensors="np")['pixel_values']
+
+
+class Stage:
+    """
+    A pipeline stage: `workers` threads take up to `batch_size` items from the inbox, call
+    `process(items)` and put the returned items into the outbox.
+
+    A partial batch is processed once `flush_interval` seconds pass without a new item.
+    """
+
+    def __init__(self,
+                 name: str,
+                 process: Callable[[List[Any]], List[Any]],
+                 workers: int = 1,
+                 batch_size: int = 1,
+                 queue_size: int = 256,
+                 flush_interval: float = 0.5,
+                 ):
+        self.name = name
+        self.process = process
+        self.workers = workers
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.inbox: "queue.Queue[Any]" = queue.Queue(maxsize=queue_size)
+        self.outbox: Optional["queue.Queue[Any]"] = None
+
+        self.items = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self._lock = threading.Lock()
+        self._running = workers
+        self._threads: List[threading.Thread] = []
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"{self.name}-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def join(self):
+        for thread in self._threads:
+            thread.join()
+
+    def _collect(self):
+        """Return (batch, finished) where finished means the upstream stage is done"""
+        batch = []
+        while len(batch) < self.batch_size:
+            try:
+                item = self.inbox.get(timeout=self.flush_interval if batch else None)
+            except queue.Empty:
+                break
+            if item is _DONE:
+                # Leave the marker for the sibling workers
+                self.inbox.put(_DONE)
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        finished = False
+        while not finished:
+            batch, finished = self._collect()
+            if not batch:
+                continue
+
+            started = time.monotonic()
+            try:
+                outputs = self.process(batch)
+            except Exception as e:
+                print(f"[{self.name}] batch of {len(batch)} failed: {str(e)}")
+                outputs = []
+                with self._lock:
+                    self.errors += len(batch)
+
+            with self._lock:
+                self.items += len(batch)
+                self.busy_seconds += time.monotonic() - started
+
+            if self.outbox is not None:
+                for output in outputs:
+                    self.outbox.put(output)
+
+        with self._lock:
+            self._running -= 1
+            last = self._running == 0
+        if last and self.outbox is not None:
+            self.outbox.put(_DONE)
+
+
+class BulkIndexer:
+    """
+    Args:
+        index: vector index backend (see index.create_index)
+        encoder: Encoder used for the image tower
+        image_fetcher: ImageFetcher used to download images
+        embedding_cache: optional EmbeddingCache; hits skip preprocessing and encoding
+        fetch_workers: concurrent image downloads
+        preprocess_workers: processes running CLIPProcessor
+        preprocess_batch_size: images per preprocessing task
+        encode_batch_size: images per encoder forward pass
+        upsert_batch_size: vectors per index upsert
+        queue_size: capacity of the queues between stages
+        report_interval: seconds between throughput reports
+    """
+
+    def __init__(self,
+                 index,
+                 encoder,
+                 image_fetcher,
+                 embedding_cache=None,
+                 fetch_workers: int = 16,
+                 preprocess_workers: int = 2,
+                 preprocess_batch_size: int = 16,
+                 encode_batch_size: int = 64,
+                 upsert_batch_size: int = 200,
+                 queue_size: int = 512,
+                 report_interval: float = 10,
+                 ):
+        self.index = index
+        self.encoder = encoder
+        self.image_fetcher = image_fetcher
+        self.embedding_cache = embedding_cache
+        self.preprocess_workers = preprocess_workers
+        self.report_interval = report_interval
+
+        self._pending: Dict[str, int] = {}
+        self._failed = set()
+        self._pending_lock = threading.Lock()
+        self._checkpoint_lock = threading.Lock()
+        self._checkpoint_manager = ProductManager(SessionLocal())
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+        self.stages = [
+            Stage('fetch', self._fetch, workers=fetch_workers, queue_size=queue_size),
+            Stage('preprocess', self._preprocess, workers=preprocess_workers,
+                  batch_size=preprocess_batch_size, queue_size=queue_size),
+            Stage('encode', self._encode, batch_size=encode_batch_size, queue_size=queue_size),
+            Stage('upsert', self._upsert, batch_size=upsert_batch_size, queue_size=queue_size),
+        ]
+        for stage, next_stage in zip(self.stages, self.stages[1:]):
+            stage.outbox = next_stage.inbox
+
+        self.products = 0
+        self.indexed_products = 0
+
+    def run(self, limit: int = -1) -> None:
+        self._pool = ProcessPoolExecutor(max_workers=self.preprocess_workers,
+                                         initializer=_init_preprocess_worker,
+                                         initargs=(self.encoder.model_name,))
+        started = time.monotonic()
+        stop_reporting = threading.Event()
+        reporter = threading.Thread(target=self._report_loop, args=(started, stop_reporting), daemon=True)
+
+        try:
+            for stage in self.stages:
+                stage.start()
+            reporter.start()
+
+            self._produce(limit)
+
+            for stage in self.stages:
+                stage.join()
+        finally:
+            stop_reporting.set()
+            self._pool.shutdown()
+            self._checkpoint_manager.db.close()
+            self.index.save()
+
+        self._report(started)
+        print(f"Bulk indexing finished: {self.indexed_products}/{self.products} products indexed")
+
+    def _produce(self, limit):
+        """Feed the image jobs of every product that is not checkpointed yet into the fetch stage"""
+        with SessionLocal() as session:
+            for product in ProductManager(session).iter_products_to_index():
+                if limit >= 0 and self.products >= limit:
+                    break
+                self.products += 1
+
+                image_urls = product.image_urls or []
+                image_ids = [f"{product.id}#{image_url}" for image_url in image_urls]
+                existing_ids = self.index.get_by_id(image_ids) if image_ids else {}
+                jobs = [
+                    {'product_id': product.id, 'id': image_id, 'url': image_url, 'metadata': product.meta_data}
+                    for image_id, image_url in zip(image_ids, image_urls)
+                    if image_id not in existing_ids
+                ]
+
+                if not jobs:
+                    self._checkpoint([product.id])
+                    continue
+
+                with self._pending_lock:
+                    self._pending[product.id] = len(jobs)
+                for job in jobs:
+                    # Blocks while the fetch stage is saturated
+                    self.stages[0].inbox.put(job)
+
+        self.stages[0].inbox.put(_DONE)
+
+    def _fetch(self, jobs):
+        outputs = []
+        for job in jobs:
+            result = self.image_fetcher.fetch(job['url'])
+            if not result.ok:
+                self._finish(job['product_id'], failed=True)
+                continue
+            
+            embedding = self.embedding_cache.get(result.digest, result.image) if self.embedding_cache else None
+            if embedding is not None:
+                # Already encoded for another product: go straight to the upsert stage
+                job['embedding'] = embedding
+                self.stages[-1].inbox.put(job)
+                continue
+            
+            job['image'] = result.image
+            job['digest'] = result.digest
+            outputs.append(job)
+        return outputs
+
+    def _preprocess(self, jobs):
+        images = [job.pop('image') for job in jobs]
+        if self.embedding_cache and self.embedding_cache.perceptual:
+            # The perceptual hash is computed from the decoded image, which is dropped after this stage
+            for job, image in zip(jobs, images):
+                job['cache_image'] = image
+        
+        try:
+            pixel_values = self._pool.submit(_preprocess_images, images).result()
+        except Exception:
+            for job in jobs:
+                self._finish(job['product_id'], failed=True)
+            raise
+
+        for job, pixels in zip(jobs, pixel_values):
+            job['pixels'] = pixels
+        return jobs
+
+    def _encode(self, jobs):
+        try:
+            embeddings = self.encoder.encode_pixels(np.stack([job.pop('pixels') for job in jobs]))
+        except Exception:
+            for job in jobs:
+                self._finish(job['product_id'], failed=True)
+            raise
+
+        for job, embedding in zip(jobs, embeddings):
+            job['embedding'] = embedding
+            if self.embedding_cache:
+                self.embedding_cache.set(job.get('digest'), embedding, job.pop('cache_image', None))
+        return jobs
+
+    def _upsert(self, jobs):
+        try:
+            self.index.upsert_embeddings([
+                {'id': job['id'], 'embedding': job['embedding'], 'metadata': job['metadata']}
+                for job in jobs
+            ])
+        except Exception:
+            for job in jobs:
+                self._finish(job['product_id'], failed=True)
+            raise
+
+        done = [product_id for product_id in (job['product_id'] for job in jobs) if self._finish(product_id)]
+        self._checkpoint(done)
+        return []
+
+    def _finish(self, product_id, failed=False) -> bool:
+        """Count one image of the product as handled; True when the product is complete and clean"""
+        with self._pending_lock:
+            if failed:
+                self._failed.add(product_id)
+            self._pending[product_id] -= 1
+            if self._pending[product_id] > 0:
+                return False
+
+            del self._pending[product_id]
+            if product_id in self._failed:
+                # Left unchecked so the next run retries the missing images
+                self._failed.discard(product_id)
+                return False
+            return True
+
+    def _checkpoint(self, product_ids):
+        if not product_ids:
+            return
+        # Called from the producer and the upsert stage, which must not share the session concurrently
+        with self._checkpoint_lock:
+            self._checkpoint_manager.mark_indexed(product_ids)
+            self.indexed_products += len(product_ids)
+
+    def _report_loop(self, started, stop):
+        while not stop.wait(self.report_interval):
+            self._report(started)
+
+    def _report(self, started):
+        elapsed = max(time.monotonic() - started, 1e-9)
+        parts = []
+        for stage in self.stages:
+            # images/s over the wall clock, and per busy worker (the stage's own capacity)
+            capacity = stage.items / stage.busy_seconds * stage.workers if stage.busy_seconds else 0.0
+            parts.append(f"{stage.name}: {stage.items / elapsed:.1f} img/s "
+                         f"(capacity {capacity:.1f} img/s, queued {stage.inbox.qsize()}, errors {stage.errors})")
+        print(f"[{elapsed:.0f}s] products {self.indexed_products}/{self.products} | " + " | ".join(parts))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk index every product that is not checkpointed yet")
+    parser.add_argument('--fetch-workers', type=int, default=16)
+    parser.add_argument('--preprocess-workers', type=int, default=2)
+    parser.add_argument('--preprocess-batch-size', type=int, default=16)
+    parser.add_argument('--encode-batch-size', type=int, default=64)
+    parser.add_argument('--upsert-batch-size', type=int, default=200)
+    parser.add_argument('--queue-size', type=int, default=512)
+    parser.add_argument('--report-interval', type=float, default=10)
+    parser.add_argument('--limit', type=int, default=-1, help="maximum number of products to process")
+    args = parser.parse_args()
+
+    # Same index / encoder configuration as the data service
+    import server
+    from image_fetcher import ImageFetcher
+    from vector_store import StoreLockedError
+    # Products are checkpointed as indexed, so the vectors must outlive this process
+    if server.INDEX_BACKEND in ('hnsw', 'quantized') and not server.VECTOR_STORE_DIR:
+        raise SystemExit(f"INDEX_BACKEND={server.INDEX_BACKEND} without VECTOR_STORE_DIR only indexes in memory: "
+                         f"set VECTOR_STORE_DIR so the indexed products are persisted")
+    server.initialize_database()
+    # Only images are encoded here, so the text tower is never loaded
+    server.DEPLOYMENT_ROLE = 'index'
+    # Never fall back to read-only: the products indexed here must be written
+    server.VECTOR_STORE_MODE = 'write'
+    try:
+        server.initialize_service()
+    except StoreLockedError as e:
+        # The vector store (or embedding cache) has a single writer: stop the data service first
+        raise SystemExit(f"{e}; stop the data service before bulk indexing into it")
+
+    image_fetcher = ImageFetcher(max_workers=args.fetch_workers,
+                                 timeout=server.IMAGE_FETCH_TIMEOUT,
+                                 retries=server.IMAGE_FETCH_RETRIES,
+                                 max_bytes=server.IMAGE_MAX_BYTES)
+
+    BulkIndexer(server.index,
+                server.encoder,
+                image_fetcher,
+                embedding_cache=server.embedding_cache,
+                fetch_workers=args.fetch_workers,
+                preprocess_workers=args.preprocess_workers,
+                preprocess_batch_size=args.preprocess_batch_size,
+                encode_batch_size=args.encode_batch_size,
+                upsert_batch_size=args.upsert_batch_size,
+                queue_size=args.queue_size,
+                report_interval=args.report_interval,
+                ).run(limit=args.limit)
+
+
+if __name__ == '__main__':
+    main()
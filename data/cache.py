@@ -0,0 +1,122 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+def normalize_query(query: str) -> str:
+    """Fold case and whitespace so equivalent queries share a cache entry"""
+    return " ".join(query.lower().split())
+
+
+def canonical_filters(filters: Optional[Dict]) -> str:
+    """Stable string form of a filter dict: keys sorted, and list values sorted since they mean any-of"""
+    def canonical(value):
+        if isinstance(value, dict):
+            return {key: canonical(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple, set)):
+            return sorted((canonical(item) for item in value), key=lambda item: json.dumps(item, sort_keys=True))
+        return value
+    
+    return json.dumps(canonical(filters or {}), sort_keys=True, separators=(',', ':'), default=str)
+
+
+class LRUCache:
+    """
+    Thread-safe LRU cache with an optional TTL and a memory ceiling.
+    
+    Args:
+        max_entries: maximum number of entries (None for no limit)
+        max_bytes: maximum total size of the entries as reported by `size_of` (None for no limit)
+        ttl: seconds an entry stays valid (None for no expiry)
+        size_of: function returning the size in bytes of a value
+    """
+    
+    def __init__(self,
+                 max_entries: Optional[int] = None,
+                 max_bytes: Optional[int] = None,
+                 ttl: Optional[float] = None,
+                 size_of: Callable[[Any], int] = lambda value: 1,
+                 ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size_of = size_of
+        
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    def __contains__(self, key):
+        return self.get(key, count=False) is not None
+    
+    def get(self, key, default=None, count=True):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] is not None and entry[1] < time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            
+            if entry is None:
+                if count:
+                    self.misses += 1
+                return default
+            
+            self._entries.move_to_end(key)
+            if count:
+                self.hits += 1
+            return entry[0]
+    
+    def set(self, key, value) -> None:
+        size = self.size_of(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, expires_at, size)
+            self._bytes += size
+            
+            while self._entries and (
+                (self.max_entries is not None and len(self._entries) > self.max_entries)
+                or (self.max_bytes is not None and self._bytes > self.max_bytes)
+            ):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+    
+    def delete(self, key) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+    
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+    
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'bytes': self._bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+    
+    def _remove(self, key):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
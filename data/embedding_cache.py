@@ -0,0 +1,113 @@
+import threading
+from typing import Optional
+
+import numpy as np
+from PIL import Image
+
+from vector_store import open_vector_store
+
+
+def perceptual_hash(image: Image.Image) -> int:
+    """64-bit difference hash: robust to re-encoding, resizing and small colour shifts"""
+    pixels = np.asarray(image.convert('L').resize((9, 8), Image.BILINEAR), dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int(np.packbits(bits).view('>u8')[0])
+
+
+class EmbeddingCache:
+    """
+    On-disk cache of image embeddings keyed by the sha256 of the image bytes, so identical
+    images shared by several products (colour variants, resellers) are encoded once.
+    
+    With `perceptual=True`, an image whose bytes differ but whose perceptual hash is within
+    `max_distance` bits of a cached one also reuses that embedding.
+    
+    `mode` is passed to `open_vector_store`; a cache opened read-only serves lookups and
+    ignores `set`.
+    """
+    
+    def __init__(self, path, dimension=512, perceptual=False, max_distance=4, mode='auto'):
+        self.store = open_vector_store(path, dimension, mode=mode)
+        self.perceptual = perceptual
+        self.max_distance = max_distance
+        
+        self._lock = threading.Lock()
+        self._hash_digests = []
+        self._hashes = np.zeros(0, dtype=np.uint64)
+        self.hits = 0
+        self.perceptual_hits = 0
+        self.misses = 0
+        
+        if perceptual:
+            digests, hashes = [], []
+            for digest, _, metadata in self.store.items():
+                if metadata.get('phash') is not None:
+                    digests.append(digest)
+                    hashes.append(metadata['phash'])
+            self._hash_digests = digests
+            self._hashes = np.array(hashes, dtype=np.uint64)
+    
+    def get(self, digest: Optional[str], image: Optional[Image.Image] = None) -> Optional[np.ndarray]:
+        if digest is not None:
+            record = self.store.get([digest]).get(digest)
+            if record is not None:
+                with self._lock:
+                    self.hits += 1
+                return record['values']
+        
+        if self.perceptual and image is not None:
+            near = self._nearest(perceptual_hash(image))
+            if near is not None:
+                record = self.store.get([near]).get(near)
+                if record is not None:
+                    with self._lock:
+                        self.perceptual_hits += 1
+                    return record['values']
+        
+        with self._lock:
+            self.misses += 1
+        return None
+    
+    def set(self, digest: Optional[str], embedding, image: Optional[Image.Image] = None) -> None:
+        if digest is None or self.store.read_only or digest in self.store:
+            return
+        
+        # Hashed outside the lock, it is the expensive part
+        metadata = {}
+        if self.perceptual and image is not None:
+            metadata['phash'] = perceptual_hash(image)
+        
+        # Checked again under the lock so concurrent workers never append the same digest twice
+        with self._lock:
+            if digest in self.store:
+                return
+            self.store.upsert([{'id': digest, 'embedding': embedding, 'metadata': metadata}])
+            
+            if 'phash' in metadata:
+                self._hash_digests.append(digest)
+                self._hashes = np.append(self._hashes, np.uint64(metadata['phash']))
+    
+    def stats(self):
+        with self._lock:
+            hits, perceptual_hits, misses = self.hits, self.perceptual_hits, self.misses
+        lookups = hits + perceptual_hits + misses
+        return {
+            'entries': len(self.store),
+            'hits': hits,
+            'perceptual_hits': perceptual_hits,
+            'misses': misses,
+            'hit_rate': (hits + perceptual_hits) / lookups if lookups else 0.0,
+        }
+    
+    def _nearest(self, phash):
+        with self._lock:
+            hashes = self._hashes
+            digests = self._hash_digests
+        if len(hashes) == 0:
+            return None
+        
+        # Hamming distance to every cached hash at once
+        xor = np.bitwise_xor(hashes, np.uint64(phash))
+        distances = np.unpackbits(xor.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+        best = int(np.argmin(distances))
+        return digests[best] if distances[best] <= self.max_distance else None
@@ -1,43 +1,179 @@
-from transformers import CLIPProcessor, CLIPModel
-import torch
+from transformers import CLIPImageProcessor, CLIPTextModelWithProjection, CLIPTokenizerFast, CLIPVisionModelWithProjection
+from concurrent.futures import Future
+from typing import List, Optional
+import threading
+import numpy as np
 import torch
+from cache import LRUCache, normalize_query
+from batcher import MicroBatcher
+
+ROLES = ('query', 'index', 'both')
+
 
 class Encoder:
+    """
+    CLIP text and image encoder. The text and vision towers are loaded independently, on first
+    use; `role` decides which of them are loaded up front: 'query' (text only), 'index' (vision
+    only) or 'both'.
+    """
+    
     def __init__(self,
                  device=None,
-                 model_name="openai/clip-vit-base-patch32"):
+                 model_name="openai/clip-vit-base-patch32",
+                 text_cache: Optional[LRUCache] = None,
+                 text_batch_size: int = 1,
+                 text_batch_wait_ms: float = 5,
+                 text_runtime: str = 'eager',
+                 onnx_model_dir: Optional[str] = None,
+                 onnx_quantized: bool = True,
+                 onnx_threads: int = 0,
+                 role: str = 'both'):
         if device is None:
             device = "cuda" if torch.cuda.is_available() else "cpu"
         
+        if role not in ROLES:
+            raise ValueError(f"Unknown encoder role: {role} (expected one of {', '.join(ROLES)})")
+        
         self.device = device
-        self.model = CLIPModel.from_pretrained(model_name)
-        self.model.to(self.device)
-        self.preprocess = CLIPProcessor.from_pretrained(model_name)
+        self.model_name = model_name
+        self.role = role
+        self._load_lock = threading.Lock()
+        self._text_model = None
+        self._tokenizer = None
+        self._vision_model = None
+        self._image_processor = None
+        # 'eager' runs the text tower of the PyTorch model, 'onnx' an exported copy on ONNX Runtime (CPU)
+        self.text_runtime = text_runtime
+        self.onnx_text_encoder = None
+        if text_runtime == 'onnx':
+            from onnx_text_encoder import OnnxTextEncoder
+            self.onnx_text_encoder = OnnxTextEncoder(onnx_model_dir, quantized=onnx_quantized, intra_op_threads=onnx_threads)
+        elif text_runtime != 'eager':
+            raise ValueError(f"Unknown text encoder runtime: {text_runtime} (expected 'eager' or 'onnx')")
+        
+        if role in ('query', 'both') and self.onnx_text_encoder is None:
+            self._load_text_tower()
+        if role in ('index', 'both'):
+            self._load_vision_tower()
+        
+        # Query embeddings keyed on the normalized query, stored as float32 arrays
+        self.text_cache = text_cache
+        # Concurrent query encodings are merged into one forward pass when text_batch_size > 1
+        self.text_batcher = None
+        if text_batch_size > 1:
+            self.text_batcher = MicroBatcher(self._encode_text_batch,
+                                             max_batch_size=text_batch_size,
+                                             max_wait_ms=text_batch_wait_ms,
+                                             name='text-encoder-batcher')
+    
+    
+    def _load_text_tower(self):
+        if self._text_model is not None:
+            return self._text_model, self._tokenizer
+        with self._load_lock:
+            if self._text_model is None:
+                self._tokenizer = CLIPTokenizerFast.from_pretrained(self.model_name)
+                self._text_model = CLIPTextModelWithProjection.from_pretrained(self.model_name).to(self.device).eval()
+                print(f"Text tower of {self.model_name} loaded")
+        return self._text_model, self._tokenizer
     
+    def _load_vision_tower(self):
+        if self._vision_model is not None:
+            return self._vision_model, self._image_processor
+        with self._load_lock:
+            if self._vision_model is None:
+                self._image_processor = CLIPImageProcessor.from_pretrained(self.model_name)
+                self._vision_model = CLIPVisionModelWithProjection.from_pretrained(self.model_name).to(self.device).eval()
+                print(f"Vision tower of {self.model_name} loaded")
+        return self._vision_model, self._image_processor
     
     def encode_image(self, images):
-                    
-        inputs = self.preprocess(images=images, return_tensors="pt", padding=True).to(self.device)
+        vision_model, image_processor = self._load_vision_tower()
+        
+        inputs = image_processor(images=images, return_tensors="pt")
         inputs = {key: value.to(self.device) for key, value in inputs.items()}
         
         with torch.no_grad():
-            image_features = self.model.get_image_features(**inputs)
+            image_features = vision_model(**inputs).image_embeds
+        
+        image_features /= image_features.norm(p=2, dim=-1, keepdim=True)
+
+        return image_features.cpu().numpy()
+    
+    def encode_pixels(self, pixel_values):
+        """Encode images that were already run through the CLIP processor"""
+        vision_model, _ = self._load_vision_tower()
+        pixel_values = torch.as_tensor(pixel_values).to(self.device)
+        
+        with torch.no_grad():
+            image_features = vision_model(pixel_values=pixel_values).image_embeds
         
         image_features /= image_features.norm(p=2, dim=-1, keepdim=True)
 
         return image_features.cpu().numpy()
     
     def encode_text(self, text):
-        inputs = self.preprocess(text=text, return_tensors="pt", padding=True)
+        if not isinstance(text, str):
+            return self._encode_text(text)
         
-        inputs = {key: value.to(self.device) for key, value in inputs.items()}
+        return self.submit_text(text).result()
+    
+    def submit_text(self, text: str) -> Future:
+        """
+        Encode a single query asynchronously. Cache hits resolve immediately; misses join the
+        next micro-batch when batching is enabled, otherwise they are encoded right away on the
+        calling thread, which must then not be the event loop.
+        """
+        key = normalize_query(text)
         
-        with torch.no_grad():
-            text_features = self.model.get_text_features(**inputs)
+        if self.text_cache is not None:
+            cached = self.text_cache.get(key)
+            if cached is not None:
+                future = Future()
+                future.set_result(torch.from_numpy(cached.copy()))
+                return future
         
-        text_features /= text_features.norm(p=2, dim=-1, keepdim=True)
+        if self.text_batcher is not None:
+            return self.text_batcher.submit(key)
+        
+        future = Future()
+        try:
+            future.set_result(self._encode_text_batch([key])[0])
+        except Exception as e:
+            future.set_exception(e)
+        return future
+    
+    def _encode_text_batch(self, texts: List[str]):
+        """One padded forward pass over the queries, returning one embedding row per query"""
+        text_features = self._text_features(texts)
+        
+        if self.text_cache is not None:
+            for key, features in zip(texts, text_features):
+                self.text_cache.set(key, features.cpu().numpy().astype(np.float32))
+        
+        return list(text_features)
+    
+    def _encode_text(self, text):
+        text_features = self._text_features(text)
         
         if len(text_features.size()) > 1:
             text_features = text_features.squeeze(0)
         
         return text_features
+    
+    def _text_features(self, text):
+        if self.onnx_text_encoder is not None:
+            # Already normalized by the exported graph
+            return torch.from_numpy(self.onnx_text_encoder.encode([text] if isinstance(text, str) else list(text)))
+        
+        text_model, tokenizer = self._load_text_tower()
+        inputs = tokenizer(text, return_tensors="pt", padding=True)
+        
+        inputs = {key: value.to(self.device) for key, value in inputs.items()}
+        
+        with torch.no_grad():
+            text_features = text_model(**inputs).text_embeds
+        
+        text_features /= text_features.norm(p=2, dim=-1, keepdim=True)
+        
+        return text_features
@@ -0,0 +1,95 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+
+class BlockingRunner:
+    """
+    Runs blocking calls from async endpoints without stalling the event loop.
+
+    Model inference runs on its own executor so encoding never waits behind slow I/O (and
+    vice versa); everything else (index, database, Meilisearch, image downloads) shares a
+    bounded I/O thread pool. Each resource additionally has its own concurrency limit, so a
+    burst of work on one resource cannot take every I/O thread.
+
+    Args:
+        inference_workers: threads of the inference executor
+        io_workers: threads of the shared I/O executor
+        limits: maximum number of concurrent calls per resource name
+    """
+
+    INFERENCE = 'inference'
+
+    def __init__(self,
+                 inference_workers: int = 1,
+                 io_workers: int = 32,
+                 limits: Optional[Dict[str, int]] = None,
+                 ):
+        self.inference_executor = ThreadPoolExecutor(max_workers=inference_workers, thread_name_prefix='inference')
+        self.io_executor = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix='blocking-io')
+        self.limits = dict(limits or {})
+        self.limits.setdefault(self.INFERENCE, inference_workers)
+
+        # asyncio semaphores are bound to a loop on creation, so they are made on first use
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._lock = threading.Lock()
+        self.running: Dict[str, int] = {}
+        self.waiting: Dict[str, int] = {}
+        self.calls: Dict[str, int] = {}
+
+    def _executor(self, resource: str) -> Executor:
+        return self.inference_executor if resource == self.INFERENCE else self.io_executor
+
+    def _semaphore(self, resource: str) -> Optional[asyncio.Semaphore]:
+        limit = self.limits.get(resource)
+        if not limit:
+            return None
+        semaphore = self._semaphores.get(resource)
+        if semaphore is None:
+            semaphore = self._semaphores[resource] = asyncio.Semaphore(limit)
+        return semaphore
+
+    def _count(self, counter: Dict[str, int], resource: str, delta: int) -> None:
+        with self._lock:
+            counter[resource] = counter.get(resource, 0) + delta
+
+    async def run(self, resource: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Await fn(*args, **kwargs) run on the executor of `resource`, within its concurrency limit"""
+        loop = asyncio.get_running_loop()
+        call = functools.partial(fn, *args, **kwargs)
+        semaphore = self._semaphore(resource)
+
+        self._count(self.calls, resource, 1)
+        self._count(self.waiting, resource, 1)
+        try:
+            if semaphore is not None:
+                await semaphore.acquire()
+        finally:
+            self._count(self.waiting, resource, -1)
+
+        self._count(self.running, resource, 1)
+        try:
+            return await loop.run_in_executor(self._executor(resource), call)
+        finally:
+            self._count(self.running, resource, -1)
+            if semaphore is not None:
+                semaphore.release()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            resources = set(self.limits) | set(self.calls)
+            return {
+                resource: {
+                    'limit': self.limits.get(resource),
+                    'running': self.running.get(resource, 0),
+                    'waiting': self.waiting.get(resource, 0),
+                    'calls': self.calls.get(resource, 0),
+                }
+                for resource in sorted(resources)
+            }
+
+    def shutdown(self) -> None:
+        self.inference_executor.shutdown(wait=False)
+        self.io_executor.shutdown(wait=False)
@@ -0,0 +1,74 @@
+import threading
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+
+# Product metadata fields whose distinct values (with product counts) are served by /enums
+FACET_FIELDS = ['category_name', 'currency', 'shop_name', 'region']
+
+
+def facet_values(meta_data: Optional[Dict]) -> Dict[str, str]:
+    """The facet values of a product, skipping missing / empty ones like the DISTINCT scan did"""
+    values = {}
+    for field in FACET_FIELDS:
+        value = (meta_data or {}).get(field)
+        if value is None or value == '' or value == 'null':
+            continue
+        values[field] = str(value)
+    return values
+
+
+def facet_delta(old_meta_data: Optional[Dict], new_meta_data: Optional[Dict]) -> Dict[tuple, int]:
+    """Count changes per (field, value) when a product goes from old to new meta_data"""
+    delta = defaultdict(int)
+    for field, value in facet_values(old_meta_data).items():
+        delta[(field, value)] -= 1
+    for field, value in facet_values(new_meta_data).items():
+        delta[(field, value)] += 1
+    return {key: change for key, change in delta.items() if change}
+
+
+class FacetStore:
+    """
+    Per-process cache of the facets table, tagged with the database facet version
+    ("{epoch}.{revision}" of the facet_revision row, see models.FacetRevisionModel).
+    
+    The version is shared by all worker processes and changes with every facet write, so it
+    can be used as an ETag; a worker reloads the counts only when it sees a new version.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot: Optional[Dict] = None
+    
+    @property
+    def version(self) -> Optional[str]:
+        snapshot = self._snapshot
+        return snapshot['version'] if snapshot is not None else None
+    
+    def load(self, rows, version: str) -> None:
+        """Replace the counts with (field, value, count) rows read at the given version"""
+        counts = {field: {} for field in FACET_FIELDS}
+        for field, value, count in rows:
+            if field in counts and count > 0:
+                counts[field][value] = count
+        
+        snapshot = {
+            'values': {field: sorted(values) for field, values in counts.items()},
+            'counts': {field: dict(sorted(values.items())) for field, values in counts.items()},
+            'version': version,
+        }
+        with self._lock:
+            self._snapshot = snapshot
+    
+    def snapshot(self) -> Optional[Dict]:
+        """{'values': {field: sorted values}, 'counts': {field: {value: count}}, 'version': str}, None before a load"""
+        with self._lock:
+            return self._snapshot
+    
+    def values(self, field: str) -> List[str]:
+        snapshot = self.snapshot()
+        return snapshot['values'].get(field, []) if snapshot is not None else []
+
+
+facet_store = FacetStore()
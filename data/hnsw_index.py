@@ -0,0 +1,365 @@
+import os
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from index import BaseIndex
+from metadata_store import MetadataStore
+
+
+# Files written next to the VectorStore segments: the hnswlib graph and the id of each node
+GRAPH_FILE = 'hnsw-graph.bin'
+GRAPH_IDS_FILE = 'hnsw-ids.npz'
+
+
+def to_vector(embedding, dimension=None):
+    """Convert a torch tensor / list / array embedding into a normalized float32 vector"""
+    if hasattr(embedding, 'detach'):
+        embedding = embedding.detach().cpu().numpy()
+    
+    vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+    if dimension is not None and vector.shape[0] != dimension:
+        raise ValueError(f"Expected a vector of dimension {dimension}, got {vector.shape[0]}")
+    
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+class HNSWIndex(BaseIndex):
+    """
+    In-process approximate nearest neighbour index (Hierarchical Navigable Small World graph)
+    over normalized vectors, scored by cosine similarity.
+    
+    The graph is an hnswlib index in inner product space: insertion and search run in C++, and
+    batches are inserted on several threads. Node n of the graph is the n-th id; the ids, the
+    metadata filter columns and the persistence next to a VectorStore are kept here.
+    
+    Writes are serialized by a writer lock and hnswlib runs them concurrently with searches.
+    A node is added to the graph before its id and filter row are published, and searches
+    drop nodes past the size they read under the state lock. Growing the graph is the one
+    operation hnswlib cannot run next to searches: it waits for the running ones and holds
+    new ones back meanwhile.
+    
+    With a store, `save` writes the graph and its ids there. On startup the saved graph is
+    loaded as is; only vectors stored after it was saved are inserted.
+    
+    Args:
+        M: number of links per node on the upper layers (2 * M on the bottom layer)
+        ef_construction: size of the candidate list used while inserting
+        ef_search: size of the candidate list used while querying (at least top_k)
+        brute_force_ratio: filtered queries matching at most this fraction of the rows
+            are answered by an exact scan over the matching rows instead of the graph
+        store: optional VectorStore; upserts are persisted to it and the graph is saved
+            in its directory
+    """
+    
+    def __init__(self,
+                 index_name,
+                 dimension=512,
+                 M=16,
+                 ef_construction=200,
+                 ef_search=64,
+                 brute_force_ratio=0.05,
+                 initial_capacity=1024,
+                 seed=None,
+                 store=None,
+                 ):
+        import hnswlib
+        
+        self.index_name = index_name
+        self.dimension = dimension
+        self.M = M
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.brute_force_ratio = brute_force_ratio
+        self.seed = 100 if seed is None else seed
+        
+        self._hnswlib = hnswlib
+        self._lock = threading.RLock()
+        self._write_lock = threading.Lock()
+        # Searches running in the graph, and whether a resize is holding new ones back
+        self._searches = 0
+        self._resizing = False
+        self._searches_changed = threading.Condition(self._lock)
+        # Bumped by every write, so `save` skips an unchanged graph
+        self._version = 0
+        self._saved_version = 0
+        
+        self._ids: List[str] = []
+        self._columns = MetadataStore(initial_capacity)
+        self._id_to_node: Dict[str, int] = {}
+        self._graph = self._new_graph(initial_capacity)
+        
+        self.store = store
+        if store is None:
+            self._metadata: Optional[List[Dict]] = []
+        else:
+            # Payloads are read from the store, only the filter columns stay in memory
+            self._metadata = None
+            self.graph_path = os.path.join(store.path, GRAPH_FILE)
+            self.graph_ids_path = os.path.join(store.path, GRAPH_IDS_FILE)
+            self._load_store()
+    
+    def __len__(self):
+        return len(self._ids)
+    
+    def get_by_id(self, ids):
+        if isinstance(ids, str):
+            ids = [ids]
+        
+        if self.store is not None:
+            with self._lock:
+                known = [record_id for record_id in ids if record_id in self._id_to_node]
+            return self.store.get(known)
+        
+        with self._lock:
+            found = [(record_id, self._id_to_node[record_id]) for record_id in ids if record_id in self._id_to_node]
+            metadata = [self._metadata[node] for _, node in found]
+        if not found:
+            return {}
+        
+        vectors = self._read_vectors([node for _, node in found])
+        return {
+            record_id: {'id': record_id, 'values': vector.tolist(), 'metadata': meta}
+            for (record_id, _), vector, meta in zip(found, vectors, metadata)
+        }
+    
+    def query(self, query_embedding, top_k, filters=None):
+        return [self._ids[node] for _, node in self.search(query_embedding, top_k, filters)]
+    
+    def query_with_scores(self, query_embedding, top_k, filters=None):
+        return [(self._ids[node], float(sim)) for sim, node in self.search(query_embedding, top_k, filters)]
+    
+    def search(self, query_embedding, top_k, filters=None):
+        """Return (similarity, node) pairs of the best matches, best first"""
+        if top_k <= 0:
+            return []
+        query = to_vector(query_embedding, self.dimension)
+        
+        with self._lock:
+            size = len(self._ids)
+            mask = self._columns.compile(filters)
+        if size == 0:
+            return []
+        
+        if mask is None:
+            try:
+                return self._knn(query, min(top_k, size), size)
+            except RuntimeError:
+                # Nodes still being linked by a concurrent insert can leave the beam short of k results
+                return self._exact_search(query, top_k, np.arange(size))
+        
+        matching = int(mask.sum())
+        if matching == 0:
+            return []
+        
+        if matching <= max(top_k, self.ef_search) or matching <= self.brute_force_ratio * len(mask):
+            return self._exact_search(query, top_k, np.flatnonzero(mask))
+        
+        try:
+            return self._knn(query, min(top_k, matching), size, mask)
+        except RuntimeError:
+            # The beam ran out of matching nodes before finding top_k of them
+            return self._exact_search(query, top_k, np.flatnonzero(mask))
+    
+    def _knn(self, query, k, size, mask=None):
+        """Graph search; with a mask, nodes it excludes are walked through but never returned"""
+        node_filter = None if mask is None else (lambda node: node < size and mask[node])
+        with self._searching():
+            nodes, distances = self._graph.knn_query(query, k=k, num_threads=1, filter=node_filter)
+        
+        # Inner product space: distance = 1 - similarity. Nodes inserted after `size` was read are dropped
+        return [(1.0 - distance, node) for distance, node in zip(distances[0].tolist(), nodes[0].tolist())
+                if node < size]
+    
+    def _exact_search(self, query, top_k, rows):
+        """Vectorized brute-force scan over the given rows"""
+        sims = self._read_vectors(rows) @ query
+        if len(rows) > top_k:
+            best = np.argpartition(-sims, top_k - 1)[:top_k]
+        else:
+            best = np.arange(len(rows))
+        best = best[np.argsort(-sims[best])]
+        return [(float(sims[i]), int(rows[i])) for i in best]
+    
+    def _read_vectors(self, nodes):
+        with self._searching():
+            return self._graph.get_items(np.asarray(nodes, dtype=np.int64), return_type='numpy')
+    
+    def upsert_embeddings(self, elements):
+        if self.store is not None:
+            self.store.upsert(elements)
+        self._add(elements)
+    
+    def save(self):
+        """Write the graph next to the store, so the next startup loads it instead of rebuilding it"""
+        # Only the process writing the store owns its files
+        if self.store is None or self.store.read_only:
+            return
+        
+        # hnswlib cannot write the graph while nodes are inserted; searches keep running
+        with self._write_lock:
+            if self._version == self._saved_version and os.path.exists(self.graph_ids_path):
+                return
+            
+            tmp_path = self.graph_path + '.tmp'
+            self._graph.save_index(tmp_path)
+            os.replace(tmp_path, self.graph_path)
+            
+            # The ids go last: a graph whose ids do not match it is rebuilt on the next startup
+            encoded = [record_id.encode('utf-8') for record_id in self._ids]
+            id_offsets = np.concatenate([[0], np.cumsum([len(record_id) for record_id in encoded], dtype=np.int64)])
+            tmp_path = self.graph_ids_path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                np.savez(f,
+                         dimension=self.dimension,
+                         M=self.M,
+                         ids=np.frombuffer(b''.join(encoded), dtype=np.uint8),
+                         id_offsets=id_offsets)
+            os.replace(tmp_path, self.graph_ids_path)
+            self._saved_version = self._version
+    
+    def start_persistence(self, interval=300):
+        """Run `save` every `interval` seconds on a daemon thread"""
+        stop = threading.Event()
+        
+        def run():
+            while not stop.wait(interval):
+                try:
+                    self.save()
+                except Exception as e:
+                    print(f"Saving the HNSW graph failed: {str(e)}")
+        
+        thread = threading.Thread(target=run, name='hnsw-persistence', daemon=True)
+        thread.start()
+        return stop
+    
+    def _new_graph(self, capacity):
+        graph = self._hnswlib.Index(space='ip', dim=self.dimension)
+        graph.init_index(max_elements=max(capacity, 1), M=self.M, ef_construction=self.ef_construction,
+                         random_seed=self.seed)
+        graph.set_ef(self.ef_search)
+        return graph
+    
+    def _load_store(self, batch_size=10000):
+        loaded = self._load_graph()
+        
+        pending = []
+        for record_id, metadata in self.store.records():
+            node = self._id_to_node.get(record_id)
+            if node is None:
+                pending.append(record_id)
+            else:
+                self._columns.set_row(node, metadata)
+        
+        for start in range(0, len(pending), batch_size):
+            records = self.store.get(pending[start:start + batch_size])
+            self._add([{'id': record_id, 'embedding': record['values'], 'metadata': record['metadata']}
+                       for record_id, record in records.items()])
+        
+        print(f"HNSW graph {'loaded' if loaded else 'rebuilt'}: {len(self._ids)} nodes, {len(pending)} inserted")
+        if pending or not loaded:
+            self.save()
+    
+    def _load_graph(self):
+        """Load the saved graph and its ids; False when there is none or it does not match the store"""
+        if not os.path.exists(self.graph_path) or not os.path.exists(self.graph_ids_path):
+            return False
+        
+        try:
+            with np.load(self.graph_ids_path) as saved:
+                if int(saved['dimension']) != self.dimension or int(saved['M']) != self.M:
+                    print("Saved HNSW graph was built with other parameters, rebuilding it")
+                    return False
+                blob = saved['ids'].tobytes()
+                id_offsets = saved['id_offsets'].tolist()
+            
+            size = len(id_offsets) - 1
+            graph = self._hnswlib.Index(space='ip', dim=self.dimension)
+            graph.load_index(self.graph_path, max_elements=max(size, len(self.store), 1))
+        except Exception as e:
+            print(f"Saved HNSW graph is unreadable, rebuilding it: {str(e)}")
+            return False
+        
+        ids = [blob[id_offsets[i]:id_offsets[i + 1]].decode('utf-8') for i in range(size)]
+        if graph.get_current_count() != size or any(record_id not in self.store for record_id in ids):
+            print("Saved HNSW graph does not match the vector store, rebuilding it")
+            return False
+        
+        graph.set_ef(self.ef_search)
+        self._graph = graph
+        self._ids = ids
+        self._id_to_node = {record_id: node for node, record_id in enumerate(ids)}
+        self._columns.allocate(size)
+        return True
+    
+    def _add(self, elements):
+        with self._write_lock:
+            updated = {}
+            new = {}
+            for el in elements:
+                vector = to_vector(el['embedding'], self.dimension)
+                node = self._id_to_node.get(el['id'])
+                # Repeated ids in a batch: the last copy wins
+                if node is None:
+                    new[el['id']] = (vector, el['metadata'])
+                else:
+                    updated[node] = (vector, el['metadata'])
+            
+            if updated:
+                # hnswlib replaces the vector of an existing node and repairs its links
+                self._graph.add_items(np.stack([vector for vector, _ in updated.values()]), list(updated))
+                with self._lock:
+                    for node, (_, metadata) in updated.items():
+                        if self._metadata is not None:
+                            self._metadata[node] = metadata
+                        self._columns.set_row(node, metadata)
+            
+            if new:
+                first = len(self._ids)
+                self._ensure_capacity(first + len(new))
+                self._graph.add_items(np.stack([vector for vector, _ in new.values()]),
+                                      np.arange(first, first + len(new)))
+                
+                # Published once they are in the graph, so a search never meets a node without its vector
+                with self._lock:
+                    for node, (record_id, (_, metadata)) in enumerate(new.items(), start=first):
+                        self._ids.append(record_id)
+                        if self._metadata is not None:
+                            self._metadata.append(metadata)
+                        self._columns.set_row(node, metadata)
+                        self._id_to_node[record_id] = node
+            
+            with self._lock:
+                self._version += 1
+    
+    def _ensure_capacity(self, size):
+        capacity = self._graph.get_max_elements()
+        if size <= capacity:
+            return
+        
+        with self._lock:
+            self._resizing = True
+            try:
+                while self._searches:
+                    self._searches_changed.wait()
+                self._graph.resize_index(max(size, capacity * 2))
+            finally:
+                self._resizing = False
+                self._searches_changed.notify_all()
+    
+    @contextmanager
+    def _searching(self):
+        """Register a search in the graph, waiting while it is being resized"""
+        with self._lock:
+            while self._resizing:
+                self._searches_changed.wait()
+            self._searches += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._searches -= 1
+                self._searches_changed.notify_all()
@@ -0,0 +1,106 @@
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import List, NamedTuple, Optional
+
+import requests # type: ignore
+from PIL import Image
+from requests.adapters import HTTPAdapter # type: ignore
+
+
+class _RetryableError(Exception):
+    pass
+
+
+class FetchResult(NamedTuple):
+    url: str
+    image: Optional[Image.Image] = None
+    error: Optional[str] = None
+    # sha256 of the downloaded bytes, used to recognize identical images
+    digest: Optional[str] = None
+    
+    @property
+    def ok(self):
+        return self.image is not None
+
+
+class ImageFetcher:
+    """
+    Downloads and decodes product images concurrently over pooled keep-alive connections.
+    
+    Args:
+        max_workers: number of downloads in flight at once
+        timeout: (connect, read) timeout in seconds for each request
+        retries: extra attempts for connection errors, timeouts and 5xx / 429 responses
+        backoff: base delay in seconds, doubled after every failed attempt
+        max_bytes: images larger than this are rejected without being fully downloaded
+    """
+    
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+    
+    def __init__(self,
+                 max_workers=8,
+                 timeout=(3.05, 10),
+                 retries=2,
+                 backoff=0.5,
+                 max_bytes=20 * 1024 * 1024,
+                 ):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_bytes = max_bytes
+        
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='image-fetcher')
+    
+    def fetch_all(self, urls: List[str]) -> List[FetchResult]:
+        """Fetch every url concurrently; results are returned in input order"""
+        return list(self.executor.map(self.fetch, urls))
+    
+    def fetch(self, url: str) -> FetchResult:
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            
+            try:
+                content = self._download(url)
+            except _RetryableError as e:
+                error = str(e)
+                continue
+            except Exception as e:
+                return FetchResult(url, error=str(e))
+            
+            try:
+                # Decode here so the caller never pays for it on its own thread
+                image = Image.open(BytesIO(content))
+                return FetchResult(url, image=image.convert('RGB'), digest=hashlib.sha256(content).hexdigest())
+            except Exception as e:
+                return FetchResult(url, error=f"Could not decode image: {str(e)}")
+        
+        return FetchResult(url, error=error)
+    
+    def _download(self, url):
+        try:
+            with self.session.get(url, timeout=self.timeout, stream=True) as response:
+                if response.status_code in self.RETRY_STATUSES:
+                    raise _RetryableError(f"HTTP {response.status_code}")
+                if response.status_code != 200:
+                    raise ValueError(f"HTTP {response.status_code}")
+                
+                length = response.headers.get('Content-Length')
+                if length and length.isdigit() and int(length) > self.max_bytes:
+                    raise ValueError(f"Image is larger than {self.max_bytes} bytes")
+                
+                buffer = BytesIO()
+                for chunk in response.iter_content(chunk_size=64 * 1024):
+                    buffer.write(chunk)
+                    if buffer.tell() > self.max_bytes:
+                        raise ValueError(f"Image is larger than {self.max_bytes} bytes")
+                return buffer.getvalue()
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise _RetryableError(str(e))
@@ -1,7 +1,30 @@
 from utils import init_pinecone
 
 
-class Index:
+class BaseIndex:
+    """Common surface of the vector index backends used by the data service"""
+
+    def get_by_id(self, ids):
+        """Return a dict of the stored records for the given ids, keyed by id"""
+        raise NotImplementedError
+
+    def query(self, query_embedding, top_k, filters=None):
+        """Return the ids of the top_k most similar vectors that satisfy the filters"""
+        return [record_id for record_id, _ in self.query_with_scores(query_embedding, top_k, filters)]
+
+    def query_with_scores(self, query_embedding, top_k, filters=None):
+        """Return (id, similarity) pairs of the top_k most similar vectors that satisfy the filters, best first"""
+        raise NotImplementedError
+
+    def upsert_embeddings(self, elements):
+        """Insert or replace elements of the form {'id', 'embedding', 'metadata'}"""
+        raise NotImplementedError
+
+    def save(self):
+        """Persist state kept in memory; nothing to do for backends that persist every write"""
+
+
+class PineconeIndex(BaseIndex):
     def __init__(self,
                  index_name,
                  dimension=512,
@@ -17,21 +40,21 @@ class Index:
         
         return response['vectors']
     
-    def query(self, query_embedding, top_k, filters=None):
-        print(filters)
+    def query_with_scores(self, query_embedding, top_k, filters=None):
         index = self.pc.Index(self.index_name)
         
         pinecone_filters = self._prepare_pinecone_filters(filters)
 
+        # Only ids and scores are used, so vectors and metadata are not sent back
         response = index.query(
             vector=query_embedding.tolist(),
             top_k=top_k,
-            include_values=True,
-            include_metadata=True,
+            include_values=False,
+            include_metadata=False,
             filter=pinecone_filters
         )['matches']
         
-        return [record['id'] for record in response]
+        return [(record['id'], record['score']) for record in response]
     
     def _prepare_pinecone_filters(self, filters):
         """Convert API filters to Pinecone filter format"""
@@ -119,4 +142,24 @@ class Index:
         index = self.pc.Index(self.index_name)
 
         index.upsert(vectors)
+
+
+Index = PineconeIndex
+
+
+def create_index(backend, index_name, dimension=512, **kwargs):
+    """Build the vector index backend selected by name ('pinecone', 'hnsw' or 'quantized')"""
+    backend = backend.lower()
+    
+    if backend == 'pinecone':
+        return PineconeIndex(index_name, dimension)
+    
+    if backend == 'hnsw':
+        from hnsw_index import HNSWIndex
+        return HNSWIndex(index_name, dimension, **kwargs)
+    
+    if backend == 'quantized':
+        from quantized_index import QuantizedIndex
+        return QuantizedIndex(index_name, dimension, **kwargs)
     
+    raise ValueError(f"Unknown index backend: {backend}")
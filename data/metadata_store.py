@@ -0,0 +1,142 @@
+import sys
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+# Metadata fields kept as dictionary-encoded columns (value -> int code, -1 when missing)
+CATEGORICAL_FIELDS = ['category_name', 'shop_name', 'region', 'currency', 'status', 'update_date']
+
+# Metadata fields kept as float columns (NaN when missing)
+NUMERIC_FIELDS = ['current_price', 'off_percent']
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+class MetadataStore:
+    """
+    Columnar copy of the product metadata attached to each vector, row-aligned with the index.
+    
+    Filters in the API format (the one `PineconeIndex._prepare_pinecone_filters` translates) are
+    compiled into a boolean bitmap over the rows with vectorized NumPy comparisons.
+    """
+    
+    def __init__(self, initial_capacity=1024):
+        self._size = 0
+        self._dictionaries: Dict[str, Dict[str, int]] = {field: {} for field in CATEGORICAL_FIELDS}
+        self._codes = {field: np.full(initial_capacity, -1, dtype=np.int32) for field in CATEGORICAL_FIELDS}
+        self._numbers = {field: np.full(initial_capacity, np.nan, dtype=np.float64) for field in NUMERIC_FIELDS}
+    
+    def __len__(self):
+        return self._size
+    
+    def set_row(self, row, metadata):
+        """Write the metadata of a row, appending it if row == len(self)"""
+        if row > self._size:
+            raise IndexError(f"Row {row} is past the end of the store ({self._size} rows)")
+        
+        if row == self._size:
+            self._ensure_capacity(row + 1)
+            self._size += 1
+        
+        metadata = metadata or {}
+        for field in CATEGORICAL_FIELDS:
+            self._codes[field][row] = self._encode(field, metadata.get(field))
+        for field in NUMERIC_FIELDS:
+            self._numbers[field][row] = _to_float(metadata.get(field))
+    
+    def memory_bytes(self):
+        """Bytes held by the columns (at their allocated capacity) and the value dictionaries"""
+        total = sum(column.nbytes for column in self._codes.values())
+        total += sum(column.nbytes for column in self._numbers.values())
+        for dictionary in self._dictionaries.values():
+            total += sys.getsizeof(dictionary) + sum(sys.getsizeof(value) + sys.getsizeof(code) for value, code in dictionary.items())
+        return total
+    
+    def allocate(self, size):
+        """Grow the store to `size` rows with every value missing, so rows can then be set in any order"""
+        self._ensure_capacity(size)
+        self._size = max(self._size, size)
+    
+    def compile(self, filters) -> Optional[np.ndarray]:
+        """Return a bitmap of the rows matching the filters, or None when there is nothing to filter on"""
+        if not filters:
+            return None
+        
+        mask = np.ones(self._size, dtype=bool)
+        
+        if 'category' in filters:
+            mask &= self._in('category_name', filters['category'])
+        
+        if 'price' in filters:
+            price = self._numbers['current_price'][:self._size]
+            mask &= self._eq('currency', filters['price']['currency'])
+            mask &= ~np.isnan(price)
+            if 'min' in filters['price']:
+                mask &= price >= float(filters['price']['min'])
+            if 'max' in filters['price']:
+                mask &= price <= float(filters['price']['max'])
+        
+        if 'update_date' in filters:
+            mask &= self._eq('update_date', filters['update_date'])
+        
+        if 'shop' in filters:
+            mask &= self._in('shop_name', filters['shop'])
+        
+        if 'status' in filters:
+            mask &= self._eq('status', filters['status'])
+        
+        if 'region' in filters:
+            mask &= self._eq('region', filters['region'])
+        
+        if 'discount' in filters:
+            # NaN compares False, so rows without off_percent drop out like with $exists
+            mask &= self._numbers['off_percent'][:self._size] <= float(filters['discount'])
+        
+        return mask
+    
+    def _encode(self, field, value):
+        if value is None or value == '':
+            return -1
+        
+        dictionary = self._dictionaries[field]
+        value = str(value)
+        if value not in dictionary:
+            dictionary[value] = len(dictionary)
+        return dictionary[value]
+    
+    def _eq(self, field, value):
+        code = self._dictionaries[field].get(str(value))
+        if code is None:
+            return np.zeros(self._size, dtype=bool)
+        return self._codes[field][:self._size] == code
+    
+    def _in(self, field, values):
+        if isinstance(values, str):
+            values = [values]
+        
+        dictionary = self._dictionaries[field]
+        codes = [dictionary[str(v)] for v in values if str(v) in dictionary]
+        if not codes:
+            return np.zeros(self._size, dtype=bool)
+        return np.isin(self._codes[field][:self._size], codes)
+    
+    def _ensure_capacity(self, size):
+        capacity = len(self._codes[CATEGORICAL_FIELDS[0]])
+        if size <= capacity:
+            return
+        
+        new_capacity = max(size, capacity * 2)
+        for field, column in self._codes.items():
+            grown = np.full(new_capacity, -1, dtype=np.int32)
+            grown[:capacity] = column
+            self._codes[field] = grown
+        for field, column in self._numbers.items():
+            grown = np.full(new_capacity, np.nan, dtype=np.float64)
+            grown[:capacity] = column
+            self._numbers[field] = grown
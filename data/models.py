@@ -1,13 +1,53 @@
-from sqlalchemy import Column, String, JSON, Boolean
+from sqlalchemy import Column, String, JSON, Boolean, Integer, BigInteger, Float, DateTime, Index
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import create_engine
+from sqlalchemy import and_, create_engine, inspect, or_, select, text, update
 from sqlalchemy.orm import sessionmaker
+from datetime import datetime
 from dotenv import load_dotenv
 import os
 
 Base = declarative_base()
 
 
+def _parse_datetime(value):
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value).replace('Z', '+00:00')).replace(tzinfo=None)
+    except ValueError:
+        return None
+
+
+def _parse_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_string(value):
+    return str(value) if value is not None and value != '' else None
+
+
+# Hot meta_data fields mirrored into typed, indexed columns, with their parsers
+TYPED_FIELDS = {
+    'update_date': _parse_datetime,
+    'category_name': _parse_string,
+    'shop_name': _parse_string,
+    'region': _parse_string,
+    'currency': _parse_string,
+    'current_price': _parse_float,
+    'status': _parse_string,
+    'off_percent': _parse_float,
+}
+
+
+def typed_columns(meta_data):
+    """Values of the typed columns for a product's meta_data"""
+    meta_data = meta_data or {}
+    return {field: parse(meta_data.get(field)) for field, parse in TYPED_FIELDS.items()}
+
+
 class ProductModel(Base):
     __tablename__ = 'products'
     
@@ -16,6 +56,25 @@ class ProductModel(Base):
     meta_data = Column(JSON)
     recently_indexed = Column(Boolean, default=False)
     
+    # Copies of hot meta_data fields, kept in sync on every write
+    update_date = Column(DateTime)
+    category_name = Column(String, index=True)
+    shop_name = Column(String, index=True)
+    region = Column(String, index=True)
+    currency = Column(String, index=True)
+    current_price = Column(Float, index=True)
+    status = Column(String, index=True)
+    off_percent = Column(Float, index=True)
+    
+    __table_args__ = (
+        Index('ix_products_update_date_desc', update_date.desc()),
+    )
+    
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        for field, value in typed_columns(self.meta_data).items():
+            setattr(self, field, value)
+    
     def to_dict(self):
         return self.meta_data
     
@@ -24,6 +83,38 @@ class ProductModel(Base):
         self.image_urls = data.get('images', self.image_urls)
         self.meta_data = data
         self.recently_indexed = False
+        for field, value in typed_columns(data).items():
+            setattr(self, field, value)
+
+
+class FacetModel(Base):
+    """Number of products per value of each facet field (see facets.FACET_FIELDS)"""
+    __tablename__ = 'facets'
+    
+    field = Column(String, primary_key=True)
+    value = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+
+class FacetRevisionModel(Base):
+    """
+    Single row bumped in every transaction that changes the facets table, so every worker
+    process sees the same facet version. `epoch` is set when the row is created, keeping
+    versions unique if the database is recreated.
+    """
+    __tablename__ = 'facet_revision'
+    
+    id = Column(Integer, primary_key=True)
+    epoch = Column(BigInteger, nullable=False)
+    revision = Column(BigInteger, nullable=False)
+
+
+class SearchSyncModel(Base):
+    """Content hash of each product as last pushed to the text search index"""
+    __tablename__ = 'search_sync'
+    
+    id = Column(String, primary_key=True)
+    content_hash = Column(String, nullable=False)
 
 
 load_dotenv()
@@ -35,6 +126,61 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 def init_db():
     Base.metadata.create_all(bind=engine)
+    migrate_db()
+
+def migrate_db(batch_size=1000):
+    """
+    Bring an existing products table up to date: add the typed columns and their indexes,
+    then backfill them from meta_data
+    """
+    existing_columns = {column['name'] for column in inspect(engine).get_columns('products')}
+    missing_columns = [column for column in ProductModel.__table__.columns if column.name not in existing_columns]
+    
+    with engine.begin() as connection:
+        for column in missing_columns:
+            column_type = column.type.compile(dialect=engine.dialect)
+            connection.execute(text(f'ALTER TABLE products ADD COLUMN "{column.name}" {column_type}'))
+    
+    for index in ProductModel.__table__.indexes:
+        index.create(bind=engine, checkfirst=True)
+    
+    backfill_typed_columns(batch_size)
+
+def backfill_typed_columns(batch_size=1000):
+    """
+    Fill the typed columns still NULL although meta_data has a value for them.
+    
+    Runs on every startup: each batch is committed on its own, so an interrupted backfill
+    resumes where it stopped and a complete one costs a single scan. Values that do not
+    parse stay NULL; the id keyset makes sure they are only visited once per run.
+    """
+    pending = or_(*[
+        and_(getattr(ProductModel, field).is_(None), ProductModel.meta_data[field].as_string().isnot(None))
+        for field in TYPED_FIELDS
+    ])
+    
+    filled = 0
+    last_id = ''
+    with SessionLocal() as session:
+        while True:
+            chunk = session.execute(
+                select(ProductModel.id, ProductModel.meta_data)
+                .where(pending, ProductModel.id > last_id)
+                .order_by(ProductModel.id)
+                .limit(batch_size)
+            ).all()
+            if not chunk:
+                break
+            
+            session.execute(update(ProductModel), [
+                {'id': product_id, **typed_columns(meta_data)} for product_id, meta_data in chunk
+            ])
+            session.commit()
+            filled += len(chunk)
+            last_id = chunk[-1][0]
+    
+    if filled:
+        print(f"Typed column backfill: {filled} products with unfilled columns updated from meta_data")
 
 def get_db():
     db = SessionLocal()
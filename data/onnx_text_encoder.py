@@ -0,0 +1,197 @@
+"""
+CPU serving of the CLIP text tower through ONNX Runtime, optionally with int8 dynamic quantization.
+
+Usage:
+    # Export the text tower (fp32 and int8 models) next to its tokenizer
+    python onnx_text_encoder.py export --output text_encoder_onnx
+
+    # Cosine agreement and latency of the exported model against the eager fp32 encoder
+    python onnx_text_encoder.py parity --model-dir text_encoder_onnx
+"""
+import argparse
+import os
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+FP32_MODEL = 'text_encoder.onnx'
+INT8_MODEL = 'text_encoder.int8.onnx'
+# CLIP's text tower has 77 positions
+MAX_LENGTH = 77
+
+PARITY_QUERIES = [
+    "red running shoes",
+    "black leather handbag with gold chain",
+    "men's slim fit denim jeans",
+    "summer floral dress",
+    "wireless noise cancelling headphones",
+    "kids winter jacket with hood",
+    "stainless steel kitchen knife set",
+    "vintage round sunglasses",
+    "cotton t-shirt white",
+    "gaming laptop 16 inch",
+    "wooden dining table for six",
+    "women's waterproof hiking boots",
+]
+
+
+def export_text_encoder(model_name: str, output_dir: str, quantize: bool = True, opset: int = 17) -> None:
+    """Export the text tower (with projection and L2 normalization) to ONNX, plus an int8 copy"""
+    import torch
+    from transformers import CLIPTextModelWithProjection, CLIPTokenizerFast
+
+    class TextTower(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask):
+            embeds = self.model(input_ids=input_ids, attention_mask=attention_mask).text_embeds
+            return embeds / embeds.norm(p=2, dim=-1, keepdim=True)
+
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer = CLIPTokenizerFast.from_pretrained(model_name)
+    tokenizer.save_pretrained(output_dir)
+
+    model = CLIPTextModelWithProjection.from_pretrained(model_name).eval()
+    inputs = tokenizer(PARITY_QUERIES[:2], padding=True, return_tensors='pt')
+    fp32_path = os.path.join(output_dir, FP32_MODEL)
+
+    with torch.no_grad():
+        torch.onnx.export(TextTower(model),
+                          (inputs['input_ids'], inputs['attention_mask']),
+                          fp32_path,
+                          input_names=['input_ids', 'attention_mask'],
+                          output_names=['text_embeds'],
+                          dynamic_axes={'input_ids': {0: 'batch', 1: 'sequence'},
+                                        'attention_mask': {0: 'batch', 1: 'sequence'},
+                                        'text_embeds': {0: 'batch'}},
+                          opset_version=opset,
+                          do_constant_folding=True)
+    print(f"Exported {fp32_path} ({os.path.getsize(fp32_path) / 2 ** 20:.0f} MiB)")
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        int8_path = os.path.join(output_dir, INT8_MODEL)
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+        print(f"Quantized {int8_path} ({os.path.getsize(int8_path) / 2 ** 20:.0f} MiB)")
+
+
+class OnnxTextEncoder:
+    """
+    Text tower exported by export_text_encoder, run by ONNX Runtime on CPU.
+
+    Args:
+        model_dir: export directory (ONNX models and tokenizer)
+        quantized: serve the int8 model instead of the fp32 one
+        intra_op_threads: threads used inside one forward pass (0 lets ONNX Runtime pick the
+            number of physical cores)
+    """
+
+    def __init__(self, model_dir: str, quantized: bool = True, intra_op_threads: int = 0):
+        import onnxruntime as ort
+        from transformers import CLIPTokenizerFast
+
+        self.model_path = os.path.join(model_dir, INT8_MODEL if quantized else FP32_MODEL)
+        if not os.path.exists(self.model_path):
+            raise FileNotFoundError(f"{self.model_path} not found, run `python onnx_text_encoder.py export` first")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.intra_op_num_threads = intra_op_threads
+        # Queries are batched by the caller, so there is one graph run at a time
+        options.inter_op_num_threads = 1
+
+        self.session = ort.InferenceSession(self.model_path, options, providers=['CPUExecutionProvider'])
+        self.tokenizer = CLIPTokenizerFast.from_pretrained(model_dir)
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Normalized float32 embeddings, one row per text"""
+        inputs = self.tokenizer(texts, padding=True, truncation=True, max_length=MAX_LENGTH, return_tensors='np')
+        (embeddings,) = self.session.run(None, {
+            'input_ids': inputs['input_ids'].astype(np.int64),
+            'attention_mask': inputs['attention_mask'].astype(np.int64),
+        })
+        return embeddings.astype(np.float32)
+
+
+def parity_check(model_name: str, model_dir: str, texts: List[str],
+                 quantized: bool = True, intra_op_threads: int = 0, repeat: int = 5) -> Dict:
+    """Cosine agreement and per-query latency of the ONNX encoder against the eager fp32 text tower"""
+    import torch
+    from transformers import CLIPTextModelWithProjection, CLIPTokenizerFast
+
+    tokenizer = CLIPTokenizerFast.from_pretrained(model_name)
+    model = CLIPTextModelWithProjection.from_pretrained(model_name).eval()
+
+    def eager(batch):
+        inputs = tokenizer(batch, padding=True, truncation=True, max_length=MAX_LENGTH, return_tensors='pt')
+        with torch.no_grad():
+            embeds = model(**inputs).text_embeds
+        return (embeds / embeds.norm(p=2, dim=-1, keepdim=True)).numpy()
+
+    onnx_encoder = OnnxTextEncoder(model_dir, quantized=quantized, intra_op_threads=intra_op_threads)
+
+    reference = eager(texts)
+    candidate = onnx_encoder.encode(texts)
+    cosines = (reference * candidate).sum(axis=1)
+
+    def latency_ms(encode):
+        started = time.monotonic()
+        for _ in range(repeat):
+            for text in texts:
+                encode([text])
+        return (time.monotonic() - started) * 1000 / (repeat * len(texts))
+
+    return {
+        'model': onnx_encoder.model_path,
+        'model_mib': os.path.getsize(onnx_encoder.model_path) / 2 ** 20,
+        'queries': len(texts),
+        'mean_cosine': float(cosines.mean()),
+        'min_cosine': float(cosines.min()),
+        'eager_ms': latency_ms(eager),
+        'onnx_ms': latency_ms(onnx_encoder.encode),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export and check the ONNX CLIP text encoder")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export = subparsers.add_parser('export', help="export the text tower to ONNX (fp32 and int8)")
+    export.add_argument('--model-name', default="openai/clip-vit-base-patch32")
+    export.add_argument('--output', default='text_encoder_onnx')
+    export.add_argument('--no-quantize', action='store_true')
+    export.add_argument('--opset', type=int, default=17)
+
+    parity = subparsers.add_parser('parity', help="compare the exported model with the eager fp32 encoder")
+    parity.add_argument('--model-name', default="openai/clip-vit-base-patch32")
+    parity.add_argument('--model-dir', default='text_encoder_onnx')
+    parity.add_argument('--fp32', action='store_true', help="check the fp32 export instead of the int8 one")
+    parity.add_argument('--threads', type=int, default=0)
+    parity.add_argument('--queries-file', help="one query per line (default: built-in sample queries)")
+    parity.add_argument('--min-cosine', type=float, default=0.98, help="exit with an error below this agreement")
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        export_text_encoder(args.model_name, args.output, quantize=not args.no_quantize, opset=args.opset)
+        return
+
+    texts = PARITY_QUERIES
+    if args.queries_file:
+        with open(args.queries_file) as f:
+            texts = [line.strip() for line in f if line.strip()]
+
+    report = parity_check(args.model_name, args.model_dir, texts, quantized=not args.fp32, intra_op_threads=args.threads)
+    print(f"{report['model']} ({report['model_mib']:.0f} MiB), {report['queries']} queries: "
+          f"cosine mean {report['mean_cosine']:.4f} / min {report['min_cosine']:.4f}, "
+          f"{report['eager_ms']:.1f} ms/query eager fp32 vs {report['onnx_ms']:.1f} ms/query ONNX")
+    if report['min_cosine'] < args.min_cosine:
+        raise SystemExit(f"Parity check failed: min cosine {report['min_cosine']:.4f} < {args.min_cosine}")
+
+
+if __name__ == '__main__':
+    main()
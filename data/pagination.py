@@ -0,0 +1,52 @@
+import base64
+import json
+import secrets
+from typing import Dict, List, Optional
+
+from cache import LRUCache
+
+
+def encode_cursor(position: Dict) -> str:
+    """Opaque, URL-safe cursor for a position in a result list"""
+    raw = json.dumps(position, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Dict:
+    """Inverse of encode_cursor; raises ValueError for a malformed cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        position = json.loads(raw)
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(position, dict) or not isinstance(position.get('o'), int) or position['o'] < 0:
+        raise ValueError("Invalid cursor")
+    return position
+
+
+class SnapshotStore:
+    """
+    Short-lived server-side snapshots of ranked product id lists.
+
+    The first page of a paginated search stores its full ranking here; the cursors of the
+    following pages point into the snapshot, so they only cost hydration and always page
+    through the same ranking, even if the index changes meanwhile.
+
+    Args:
+        max_snapshots: number of snapshots kept (least recently used are dropped first)
+        ttl: seconds a snapshot stays valid
+    """
+
+    def __init__(self, max_snapshots: int = 10000, ttl: float = 300):
+        self._snapshots = LRUCache(max_entries=max_snapshots, ttl=ttl)
+
+    def create(self, product_ids: List[str]) -> str:
+        snapshot_id = secrets.token_urlsafe(12)
+        self._snapshots.set(snapshot_id, list(product_ids))
+        return snapshot_id
+
+    def get(self, snapshot_id: str) -> Optional[List[str]]:
+        return self._snapshots.get(snapshot_id)
+
+    def stats(self) -> Dict:
+        return self._snapshots.stats()
@@ -0,0 +1,97 @@
+import os
+import threading
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from cache import LRUCache
+from models import ProductModel, SessionLocal
+
+
+class ProductCache:
+    """
+    Hydrates ranked product ids into product payloads (their meta_data), in the requested order.
+
+    Payloads of recently served products are kept in an LRU, so hot products cost a dict lookup;
+    the misses are read together in one id / meta_data query, without building ORM objects.
+    Writers invalidate the products they change. The cache is per process, so the TTL bounds how
+    long another worker's write can go unnoticed. Payloads are shared: callers must not mutate them.
+
+    Args:
+        max_entries: number of cached products (0 disables caching)
+        ttl: seconds a payload stays cached (None for no expiry)
+    """
+
+    def __init__(self, max_entries: int = 50000, ttl: Optional[float] = 600):
+        self.cache = LRUCache(max_entries=max_entries, ttl=ttl) if max_entries > 0 else None
+        self._lock = threading.Lock()
+        # Bumped by every invalidation so a read that raced a write does not cache the old payload
+        self._invalidations = 0
+        self.queries = 0
+
+    def get_many(self, session: Session, product_ids: List[str]) -> List[Dict]:
+        payloads, misses = self.lookup(product_ids)
+        if misses:
+            payloads.update(self.load(session, misses))
+        return [payloads[product_id] for product_id in product_ids if product_id in payloads]
+
+    def lookup(self, product_ids: List[str]):
+        """Cache-only lookup: ({product_id: payload} of the cached products, ids of the misses)"""
+        payloads = {}
+        misses = []
+        for product_id in dict.fromkeys(product_ids):
+            payload = self.cache.get(product_id) if self.cache is not None else None
+            if payload is None:
+                misses.append(product_id)
+            else:
+                payloads[product_id] = payload
+        return payloads, misses
+
+    def load(self, session: Session, product_ids: List[str]) -> Dict[str, Dict]:
+        """Read the given products from Postgres in one query and cache them; {product_id: payload}"""
+        invalidations = self._invalidations
+        rows = session.execute(
+            select(ProductModel.id, ProductModel.meta_data).where(ProductModel.id.in_(product_ids))
+        ).all()
+        self.queries += 1
+
+        payloads = {}
+        with self._lock:
+            cacheable = self.cache is not None and invalidations == self._invalidations
+            for product_id, meta_data in rows:
+                payloads[product_id] = meta_data
+                if cacheable:
+                    self.cache.set(product_id, meta_data)
+        return payloads
+
+    def prefetch(self, product_ids: List[str]) -> None:
+        """Warm the cache with the given products, on a session of its own (e.g. from a background task)"""
+        if self.cache is None:
+            return
+        with SessionLocal() as session:
+            self.get_many(session, product_ids)
+
+    def invalidate(self, product_ids: Iterable[str]) -> None:
+        with self._lock:
+            self._invalidations += 1
+            if self.cache is not None:
+                for product_id in product_ids:
+                    self.cache.delete(str(product_id))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._invalidations += 1
+            if self.cache is not None:
+                self.cache.clear()
+
+    def stats(self) -> Dict:
+        stats = self.cache.stats() if self.cache is not None else {}
+        stats['queries'] = self.queries
+        return stats
+
+
+product_cache = ProductCache(
+    max_entries=int(os.environ.get('PRODUCT_CACHE_SIZE', '50000')),
+    ttl=float(os.environ.get('PRODUCT_CACHE_TTL', '600')) or None,
+)
@@ -1,34 +1,161 @@
 from sqlalchemy.orm import Session
-from typing import List, Dict, Set, Optional
-from sqlalchemy import desc, cast, DateTime
+from typing import List, Dict, Set, Optional, Iterator, Tuple
+from sqlalchemy import desc, cast, case, Date
+from sqlalchemy.dialects.postgresql import JSONB, insert
 from collections import defaultdict
 import json
-from models import ProductModel, SessionLocal
+import re
+import time
+from models import ProductModel, FacetModel, FacetRevisionModel, SearchSyncModel, SessionLocal, TYPED_FIELDS, typed_columns
+from facets import FACET_FIELDS, facet_delta, facet_store
+from product_cache import product_cache
 from sqlalchemy import distinct, text
 from product import Product
 from sqlalchemy.exc import SQLAlchemyError
 
-def load_products_data(file_path: str) -> List[Dict]:
+_WHITESPACE = re.compile(r'\s*')
+# pg_advisory_xact_lock key serializing facet rebuilds across worker processes
+FACET_REBUILD_LOCK = 0x66616365
+
+def iter_products_data(file_path: str, chunk_size: int = 1024 * 1024) -> Iterator[Dict]:
+    """
+    Incrementally parse a JSON array of products, yielding one product at a time
+    (with None values dropped) so memory stays constant regardless of the file size
+    """
+    decoder = json.JSONDecoder()
+    
     with open(file_path, 'r', encoding='utf-8') as f:
-        products_data = json.load(f)
-        return [{k: v for k, v in p.items() if v is not None} for p in products_data]
+        buffer = ''
+        pos = 0
+        eof = False
+        # What comes next: '[' (start), a product or ']' (first), a product (value),
+        # ',' or ']' (separator), nothing but whitespace (end)
+        expect = 'start'
+        
+        while True:
+            pos = _WHITESPACE.match(buffer, pos).end()
+            if pos == len(buffer) and not eof:
+                chunk = f.read(chunk_size)
+                eof = not chunk
+                buffer, pos = buffer[pos:] + chunk, 0
+                continue
+            
+            if expect == 'end':
+                if pos < len(buffer):
+                    raise ValueError(f"{file_path} has data after the end of the JSON array")
+                return
+            if pos == len(buffer):
+                raise ValueError(f"{file_path} ends before the end of the JSON array")
+            
+            char = buffer[pos]
+            if expect == 'start':
+                if char != '[':
+                    raise ValueError(f"{file_path} does not contain a JSON array")
+                pos += 1
+                expect = 'first'
+            elif char == ']' and expect in ('first', 'separator'):
+                pos += 1
+                expect = 'end'
+            elif expect == 'separator':
+                if char != ',':
+                    raise ValueError(f"{file_path}: expected ',' or ']' after a product")
+                pos += 1
+                expect = 'value'
+            else:
+                try:
+                    product, end = decoder.raw_decode(buffer, pos)
+                    # A value reaching the end of the buffer may be cut (e.g. a number)
+                    complete = eof or end < len(buffer)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                    complete = False
+                if not complete:
+                    # The next product is cut by the chunk boundary
+                    chunk = f.read(chunk_size)
+                    eof = not chunk
+                    buffer, pos = buffer[pos:] + chunk, 0
+                    continue
+                
+                pos = end
+                expect = 'separator'
+                if isinstance(product, dict):
+                    yield {k: v for k, v in product.items() if v is not None}
+
+
+def load_products_data(file_path: str) -> List[Dict]:
+    return list(iter_products_data(file_path))
 
 class ProductManager:
-    def __init__(self, db: Session, products_file: Optional[str] = None):
+    def __init__(self, db: Session, products_file: Optional[str] = None, batch_size: int = 1000):
         self.db = db
+        self.batch_size = batch_size
         if products_file:
             self._load_initial_data(products_file)
 
     def _load_initial_data(self, products_file: str) -> None:
-        products_data = load_products_data(products_file)
+        batch = []
+        for product_data in iter_products_data(products_file):
+            batch.append(product_data)
+            if len(batch) >= self.batch_size:
+                self._upsert_batch(batch)
+                batch = []
+        self._upsert_batch(batch)
+    
+    def _upsert_statement(self, rows: List[Dict]):
+        statement = insert(ProductModel).values(rows)
+        excluded = statement.excluded
+        return statement.on_conflict_do_update(
+            index_elements=[ProductModel.id],
+            set_={
+                'image_urls': excluded.image_urls,
+                'meta_data': excluded.meta_data,
+                **{field: excluded[field] for field in TYPED_FIELDS},
+                # Only products whose data changed have to be indexed again
+                'recently_indexed': case(
+                    (cast(ProductModel.meta_data, JSONB) == cast(excluded.meta_data, JSONB),
+                     ProductModel.recently_indexed),
+                    else_=False,
+                ),
+            },
+        )
+    
+    def _upsert_batch(self, products_data: List[Dict]) -> None:
+        """Upsert a chunk of products in one statement; on failure retry row by row to isolate bad rows"""
+        rows = {}
         for product_data in products_data:
-            # Create a new session for each product
-            with SessionLocal() as session:
+            if 'id' not in product_data:
+                print(f"Failed to load product without id: {product_data}")
+                continue
+            # A chunk may not touch the same row twice, the last occurrence wins
+            rows[str(product_data['id'])] = {
+                'id': str(product_data['id']),
+                'image_urls': product_data.get('images', []),
+                'meta_data': product_data,
+                'recently_indexed': False,
+                **typed_columns(product_data),
+            }
+        if not rows:
+            return
+        
+        with SessionLocal() as session:
+            try:
+                session.execute(self._upsert_statement(list(rows.values())))
+                session.commit()
+                product_cache.invalidate(rows)
+                return
+            except SQLAlchemyError as e:
+                session.rollback()
+                print(f"Failed to load a chunk of {len(rows)} products, retrying one by one: {str(e)}")
+            
+            for row in rows.values():
                 try:
-                    self.add_product(product_dict=product_data, session=session)
-                except Exception as e:
-                    print(f"Failed to load product {product_data.get('id')}: {str(e)}")
+                    session.execute(self._upsert_statement([row]))
+                    session.commit()
+                    product_cache.invalidate([row['id']])
+                except SQLAlchemyError as e:
                     session.rollback()
+                    print(f"Failed to load product {row['id']}: {str(e)}")
     
     
     def get_enum_values(self, enum_name: str) -> List[str]:
@@ -54,13 +181,14 @@ class ProductManager:
             return []
 
 
-    def get_top_k_recent_products(self, k: int, session: Optional[Session] = None) -> List[ProductModel]:
+    def get_top_k_recent_products(self, k: int, session: Optional[Session] = None, filters: Optional[Dict] = None) -> List[ProductModel]:
         """
-        Retrieve the top K products with the most recent update_date from meta_data
+        Retrieve the top K products with the most recent update_date
         
         Args:
-            db_session: SQLAlchemy database session
-            k (int): Number of products to retrieve (default: 10)
+            k (int): Number of products to retrieve
+            session: SQLAlchemy database session (defaults to self.db)
+            filters: optional API filters, evaluated on the typed columns
             
         Returns:
             List[ProductModel]: List of K most recently updated products
@@ -68,26 +196,50 @@ class ProductManager:
         
         db_session = session or self.db
         
-        # Method 1: Using raw SQL (most efficient for PostgreSQL)
-        #query = text("""
-        #    SELECT *
-        #    FROM products
-        #    WHERE meta_data->>'update_date' IS NOT NULL
-        #    ORDER BY (meta_data->>'update_date')::timestamp DESC
-        #    LIMIT :k
-        #""")
-        
-        #result = db_session.execute(query, {'k': k})
-        #products = [ProductModel(**dict(row)) for row in result]
-        
-        # Method 2: Using SQLAlchemy ORM
-        products = db_session.query(ProductModel)\
-            .filter(ProductModel.meta_data['update_date'].isnot(None))\
-            .order_by(desc(cast(ProductModel.meta_data['update_date'].astext, DateTime)))\
+        # Served by the descending index on the typed update_date column
+        query = db_session.query(ProductModel)\
+            .filter(ProductModel.update_date.isnot(None))
+        query = self.apply_filters(query, filters)
+        
+        return query.order_by(desc(ProductModel.update_date))\
             .limit(k)\
             .all()
+
+    @staticmethod
+    def apply_filters(query, filters: Optional[Dict]):
+        """Translate API filters (same format as the vector index filters) into typed column predicates"""
+        if not filters:
+            return query
+        
+        if 'category' in filters:
+            query = query.filter(ProductModel.category_name.in_(filters['category']))
         
-        return products
+        if 'price' in filters:
+            query = query.filter(ProductModel.currency == filters['price']['currency'],
+                                 ProductModel.current_price.isnot(None))
+            if 'min' in filters['price']:
+                query = query.filter(ProductModel.current_price >= filters['price']['min'])
+            if 'max' in filters['price']:
+                query = query.filter(ProductModel.current_price <= filters['price']['max'])
+        
+        if 'update_date' in filters:
+            # The filter holds a day, the column a timestamp
+            day = cast(ProductModel.update_date, Date)
+            query = query.filter(day == filters['update_date'])
+        
+        if 'shop' in filters:
+            query = query.filter(ProductModel.shop_name.in_(filters['shop']))
+        
+        if 'status' in filters:
+            query = query.filter(ProductModel.status == filters['status'])
+        
+        if 'region' in filters:
+            query = query.filter(ProductModel.region == filters['region'])
+        
+        if 'discount' in filters:
+            query = query.filter(ProductModel.off_percent <= filters['discount'])
+        
+        return query
         
     def add_product(self, product: Optional[Product] = None, product_dict: Optional[Dict] = None, session: Optional[Session] = None) -> None:
         """Add or update a product in the database"""
@@ -107,9 +259,11 @@ class ProductManager:
             ).first()
 
             if existing_product:
+                old_meta_data = existing_product.meta_data
                 # Update existing product
                 existing_product.update_from_dict(product_dict)
             else:
+                old_meta_data = None
                 # Create new product
                 db_product = ProductModel(
                     id=product_dict['id'],
@@ -119,7 +273,11 @@ class ProductManager:
                 )
                 db_session.add(db_product)
 
+            delta = facet_delta(old_meta_data, product_dict)
+            self._apply_facet_delta(db_session, delta)
+            
             db_session.commit()
+            product_cache.invalidate([str(product_dict['id'])])
             
         except SQLAlchemyError as e:
             db_session.rollback()
@@ -128,13 +286,199 @@ class ProductManager:
             db_session.rollback()
             raise Exception(f"Error adding/updating product: {str(e)}")
 
+    def _apply_facet_delta(self, db_session: Session, delta: Dict[tuple, int]) -> None:
+        """Adjust the facet counts inside the caller's transaction"""
+        if not delta:
+            return
+        
+        statement = insert(FacetModel).values([
+            {'field': field, 'value': value, 'count': change} for (field, value), change in delta.items()
+        ])
+        statement = statement.on_conflict_do_update(
+            index_elements=[FacetModel.field, FacetModel.value],
+            set_={'count': FacetModel.count + statement.excluded.count},
+        )
+        db_session.execute(statement)
+        db_session.query(FacetModel).filter(FacetModel.count <= 0).delete(synchronize_session=False)
+        self._bump_facet_revision(db_session)
+
+    @staticmethod
+    def _bump_facet_revision(db_session: Session) -> None:
+        """Advance the shared facet version inside the caller's transaction (creating it on first use)"""
+        statement = insert(FacetRevisionModel).values(id=1, epoch=int(time.time()), revision=1)
+        statement = statement.on_conflict_do_update(
+            index_elements=[FacetRevisionModel.id],
+            set_={'revision': FacetRevisionModel.revision + 1},
+        )
+        db_session.execute(statement)
+
+    def rebuild_facets(self) -> None:
+        """
+        Recount the facets table from scratch (one grouped scan) and reload the in-memory copy.
+        
+        Runs in every worker on startup: the transaction-level advisory lock makes concurrent
+        rebuilds take turns instead of interleaving their DELETE and INSERT.
+        """
+        query = text("""
+            INSERT INTO facets (field, value, count)
+            SELECT f.field, p.meta_data->>f.field, count(*)
+            FROM products p
+            CROSS JOIN unnest(CAST(:fields AS text[])) AS f(field)
+            WHERE p.meta_data->>f.field IS NOT NULL
+              AND p.meta_data->>f.field != 'null'
+              AND p.meta_data->>f.field != ''
+            GROUP BY 1, 2
+        """)
+        
+        try:
+            self.db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": FACET_REBUILD_LOCK})
+            self.db.query(FacetModel).delete(synchronize_session=False)
+            self.db.execute(query, {"fields": FACET_FIELDS})
+            self._bump_facet_revision(self.db)
+            self.db.commit()
+        except SQLAlchemyError as e:
+            self.db.rollback()
+            raise Exception(f"Database error: {str(e)}")
+        
+        self.load_facets()
+
+    def load_facets(self) -> None:
+        """Refresh the in-memory copy of the facets if another process (or this one) changed them"""
+        with SessionLocal() as session:
+            # The version is read before the counts: counts newer than their version only
+            # cause one more reload, never an old copy served under a new ETag
+            revision = session.query(FacetRevisionModel.epoch, FacetRevisionModel.revision)\
+                .filter(FacetRevisionModel.id == 1).first()
+            version = f"{revision[0]}.{revision[1]}" if revision is not None else "0.0"
+            if version == facet_store.version:
+                return
+            rows = session.query(FacetModel.field, FacetModel.value, FacetModel.count).all()
+        facet_store.load(rows, version)
+
+    def get_facets(self) -> Dict:
+        """All facet values and their product counts; one version lookup, the counts are reloaded only when it changed"""
+        self.load_facets()
+        return facet_store.snapshot()
+
     def get_all_products(self) -> List[ProductModel]:
         return self.db.query(ProductModel).all()
 
+    def iter_products_to_index(self, batch_size: int = 500) -> Iterator[ProductModel]:
+        """Stream the products not yet marked as indexed through a server-side cursor"""
+        query = self.db.query(ProductModel)\
+            .filter(ProductModel.recently_indexed.isnot(True))\
+            .execution_options(stream_results=True)\
+            .yield_per(batch_size)
+        
+        for product in query:
+            yield product
+
+    def mark_indexed(self, product_ids: List[str]) -> None:
+        """Checkpoint products whose images are all in the vector index"""
+        if not product_ids:
+            return
+        
+        try:
+            self.db.query(ProductModel)\
+                .filter(ProductModel.id.in_(product_ids))\
+                .update({ProductModel.recently_indexed: True}, synchronize_session=False)
+            self.db.commit()
+        except SQLAlchemyError as e:
+            self.db.rollback()
+            raise Exception(f"Database error: {str(e)}")
+
+    def iter_search_sync_changes(self, batch_size: int = 1000) -> Iterator[List[Tuple[Dict, str]]]:
+        """
+        Stream, in chunks, the (meta_data, content_hash) of products that were added or changed
+        since they were last pushed to the text search index
+        """
+        # jsonb normalizes key order and whitespace, so the hash only changes with the content
+        query = text("""
+            SELECT p.meta_data, md5(p.meta_data::jsonb::text) AS content_hash
+            FROM products p
+            LEFT JOIN search_sync s ON s.id = p.id
+            WHERE s.content_hash IS DISTINCT FROM md5(p.meta_data::jsonb::text)
+        """)
+        
+        with SessionLocal() as session:
+            result = session.execute(query, execution_options={'stream_results': True, 'yield_per': batch_size})
+            for rows in result.partitions(batch_size):
+                yield [(row[0], row[1]) for row in rows]
+
+    def iter_search_sync_deletions(self, batch_size: int = 1000) -> Iterator[List[str]]:
+        """Stream, in chunks, the ids pushed to the text search index whose product no longer exists"""
+        query = text("""
+            SELECT s.id
+            FROM search_sync s
+            LEFT JOIN products p ON p.id = s.id
+            WHERE p.id IS NULL
+        """)
+        
+        with SessionLocal() as session:
+            result = session.execute(query, execution_options={'stream_results': True, 'yield_per': batch_size})
+            for rows in result.partitions(batch_size):
+                yield [row[0] for row in rows]
+
+    def mark_search_synced(self, synced: List[Tuple[str, str]]) -> None:
+        """Record the content hashes that are now in the text search index"""
+        if not synced:
+            return
+        
+        statement = insert(SearchSyncModel).values([
+            {'id': product_id, 'content_hash': content_hash} for product_id, content_hash in synced
+        ])
+        statement = statement.on_conflict_do_update(
+            index_elements=[SearchSyncModel.id],
+            set_={'content_hash': statement.excluded.content_hash},
+        )
+        try:
+            self.db.execute(statement)
+            self.db.commit()
+        except SQLAlchemyError as e:
+            self.db.rollback()
+            raise Exception(f"Database error: {str(e)}")
+
+    def unmark_search_synced(self, product_ids: List[str]) -> None:
+        if not product_ids:
+            return
+        
+        try:
+            self.db.query(SearchSyncModel)\
+                .filter(SearchSyncModel.id.in_(product_ids))\
+                .delete(synchronize_session=False)
+            self.db.commit()
+        except SQLAlchemyError as e:
+            self.db.rollback()
+            raise Exception(f"Database error: {str(e)}")
+
+    def count_search_synced(self) -> int:
+        """Number of products recorded as present in the text search index"""
+        return self.db.query(SearchSyncModel).count()
+
+    def clear_search_synced(self) -> None:
+        """Forget what was pushed to the text search index, so the next sync pushes every product"""
+        try:
+            self.db.query(SearchSyncModel).delete(synchronize_session=False)
+            self.db.commit()
+        except SQLAlchemyError as e:
+            self.db.rollback()
+            raise Exception(f"Database error: {str(e)}")
+
     def get_products_by_id(self, products_id: List[str]) -> List[ProductModel]:
+        """Products in the order of the given ids (the ranking order); unknown ids are skipped"""
         if not isinstance(products_id, list):
             products_id = [products_id]
-        return self.db.query(ProductModel).filter(ProductModel.id.in_(products_id)).all()
+        by_id = {product.id: product
+                 for product in self.db.query(ProductModel).filter(ProductModel.id.in_(products_id)).all()}
+        return [by_id[product_id] for product_id in products_id if product_id in by_id]
+
+    def get_product_payloads(self, product_ids: List[str]) -> List[Dict]:
+        """Product payloads (as returned by to_dict) in the order of the given ids, served from the product cache"""
+        return product_cache.get_many(self.db, product_ids)
+
+    def load_product_payloads(self, product_ids: List[str]) -> Dict[str, Dict]:
+        """Payloads of the given products read from Postgres (the product cache misses), by id"""
+        return product_cache.load(self.db, product_ids)
 
     def product_exists(self, product_id: str) -> bool:
         return self.db.query(ProductModel).filter(ProductModel.id == str(product_id)).first() is not None
@@ -0,0 +1,292 @@
+"""
+Compact codes for normalized embeddings, searched by asymmetric distance (full-precision query
+against quantized database vectors) with NumPy:
+
+    sq8: scalar quantization, one byte per dimension (4x smaller than float32)
+    pq:  product quantization, one byte per subspace (dimension * 4 / subspaces times smaller,
+         32x for 512-d vectors and 64 subspaces)
+
+Usage (recall@K of both quantizers on the vectors of a VectorStore):
+    python quantization.py --store vector_store --k 10 --queries 200
+"""
+import argparse
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+# Rows scored per step, so scoring never materializes a float copy of every code at once
+SCORE_CHUNK_ROWS = 65536
+
+
+class ScalarQuantizer:
+    """
+    Maps each dimension linearly onto 0..255 between its 0.1th and 99.9th percentile in the
+    training sample (values outside are clipped).
+    """
+
+    kind = 'sq8'
+
+    def __init__(self, dimension: int):
+        self.dimension = dimension
+        self.low: Optional[np.ndarray] = None
+        self.step: Optional[np.ndarray] = None
+
+    @property
+    def trained(self) -> bool:
+        return self.low is not None
+
+    @property
+    def code_size(self) -> int:
+        return self.dimension
+
+    def train(self, sample: np.ndarray, seed=None) -> None:
+        sample = np.asarray(sample, dtype=np.float32)
+        low = np.percentile(sample, 0.1, axis=0)
+        high = np.percentile(sample, 99.9, axis=0)
+        self.low = low.astype(np.float32)
+        self.step = (np.maximum(high - low, 1e-6) / 255).astype(np.float32)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        codes = np.rint((np.asarray(vectors, dtype=np.float32) - self.low) / self.step)
+        return np.clip(codes, 0, 255).astype(np.uint8)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return self.low + codes.astype(np.float32) * self.step
+
+    def scores(self, query: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """Approximate inner products of the query with the encoded vectors"""
+        # q . (low + code * step) = q . low + (q * step) . code
+        weights = query * self.step
+        offset = float(query @ self.low)
+        out = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), SCORE_CHUNK_ROWS):
+            chunk = codes[start:start + SCORE_CHUNK_ROWS]
+            out[start:start + len(chunk)] = chunk.astype(np.float32) @ weights + offset
+        return out
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {'low': self.low, 'step': self.step}
+
+    def load_state(self, state) -> None:
+        self.low = np.asarray(state['low'], dtype=np.float32)
+        self.step = np.asarray(state['step'], dtype=np.float32)
+
+
+class ProductQuantizer:
+    """
+    Splits vectors into `subspaces` contiguous blocks and replaces each block by the index of
+    its nearest of 256 k-means centroids, trained per block.
+    """
+
+    kind = 'pq'
+
+    def __init__(self, dimension: int, subspaces: int = 64, iterations: int = 20):
+        if dimension % subspaces:
+            raise ValueError(f"The dimension ({dimension}) must be a multiple of the number of subspaces ({subspaces})")
+        self.dimension = dimension
+        self.subspaces = subspaces
+        self.sub_dimension = dimension // subspaces
+        self.iterations = iterations
+        # (subspaces, 256, sub_dimension)
+        self.centroids: Optional[np.ndarray] = None
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    @property
+    def code_size(self) -> int:
+        return self.subspaces
+
+    def _split(self, vectors: np.ndarray) -> np.ndarray:
+        """(n, dimension) -> (subspaces, n, sub_dimension)"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        return vectors.reshape(len(vectors), self.subspaces, self.sub_dimension).transpose(1, 0, 2)
+
+    def train(self, sample: np.ndarray, seed=None) -> None:
+        rng = np.random.default_rng(seed)
+        blocks = self._split(sample)
+        n = blocks.shape[1]
+        # With fewer training vectors than centroids, some centroids are repeated
+        init = rng.choice(n, 256, replace=n < 256)
+
+        centroids = np.empty((self.subspaces, 256, self.sub_dimension), dtype=np.float32)
+        for j, block in enumerate(blocks):
+            centroids[j] = self._kmeans(block, block[init].copy(), rng)
+        self.centroids = centroids
+
+    def _kmeans(self, points: np.ndarray, centroids: np.ndarray, rng) -> np.ndarray:
+        for _ in range(self.iterations):
+            assignment = self._nearest(points, centroids)
+            counts = np.bincount(assignment, minlength=len(centroids))
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, points)
+
+            empty = counts == 0
+            centroids[~empty] = sums[~empty] / counts[~empty, None]
+            # Re-seed empty clusters on random points so all 256 codes stay in use
+            if empty.any():
+                centroids[empty] = points[rng.choice(len(points), int(empty.sum()))]
+        return centroids
+
+    @staticmethod
+    def _nearest(points: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        distances = (centroids ** 2).sum(axis=1) - 2 * points @ centroids.T
+        return np.argmin(distances, axis=1)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        blocks = self._split(vectors)
+        codes = np.empty((blocks.shape[1], self.subspaces), dtype=np.uint8)
+        for j, block in enumerate(blocks):
+            codes[:, j] = self._nearest(block, self.centroids[j])
+        return codes
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        parts = [self.centroids[j][codes[:, j]] for j in range(self.subspaces)]
+        return np.concatenate(parts, axis=1)
+
+    def scores(self, query: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """Approximate inner products of the query with the encoded vectors"""
+        # One table of (subspace, code) -> partial inner product, then a lookup and sum per vector
+        table = np.einsum('jkd,jd->jk', self.centroids, query.reshape(self.subspaces, self.sub_dimension))
+        subspace = np.arange(self.subspaces)
+        out = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), SCORE_CHUNK_ROWS):
+            chunk = codes[start:start + SCORE_CHUNK_ROWS]
+            out[start:start + len(chunk)] = table[subspace, chunk].sum(axis=1)
+        return out
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {'centroids': self.centroids}
+
+    def load_state(self, state) -> None:
+        self.centroids = np.asarray(state['centroids'], dtype=np.float32)
+
+
+def create_quantizer(kind: str, dimension: int, pq_subspaces: int = 64):
+    if kind == 'sq8':
+        return ScalarQuantizer(dimension)
+    if kind == 'pq':
+        return ProductQuantizer(dimension, subspaces=pq_subspaces)
+    raise ValueError(f"Unknown quantization: {kind} (expected 'sq8' or 'pq')")
+
+
+def save_quantizer(quantizer, path: str) -> None:
+    subspaces = getattr(quantizer, 'subspaces', 0)
+    with open(path, 'wb') as f:
+        np.savez(f, kind=quantizer.kind, dimension=quantizer.dimension, subspaces=subspaces, **quantizer.state())
+
+
+def load_quantizer(path: str):
+    with np.load(path) as state:
+        quantizer = create_quantizer(str(state['kind']), int(state['dimension']), int(state['subspaces']) or 64)
+        quantizer.load_state(state)
+    return quantizer
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1)
+
+
+def top_rows(scores: np.ndarray, k: int) -> np.ndarray:
+    """Positions of the k highest scores, best first"""
+    if len(scores) > k:
+        best = np.argpartition(-scores, k - 1)[:k]
+    else:
+        best = np.arange(len(scores))
+    return best[np.argsort(-scores[best], kind='stable')]
+
+
+def evaluate(vectors: np.ndarray,
+             kinds: List[str],
+             k: int = 10,
+             queries: int = 200,
+             train_size: int = 20000,
+             rescore_factor: int = 4,
+             pq_subspaces: int = 64,
+             seed=None) -> List[Dict]:
+    """
+    recall@k of ADC alone and of ADC followed by exact rescoring, against an exact scan.
+
+    `queries` vectors are held out of the database and used as queries.
+    """
+    rng = np.random.default_rng(seed)
+    vectors = normalize_rows(vectors)
+    order = rng.permutation(len(vectors))
+    query_vectors = vectors[order[:queries]]
+    base = vectors[order[queries:]]
+    sample = base[rng.choice(len(base), min(train_size, len(base)), replace=False)]
+
+    truth = [set(top_rows(base @ query, k).tolist()) for query in query_vectors]
+    reports = []
+    for kind in kinds:
+        quantizer = create_quantizer(kind, base.shape[1], pq_subspaces)
+        started = time.monotonic()
+        quantizer.train(sample, seed=seed)
+        train_seconds = time.monotonic() - started
+        codes = quantizer.encode(base)
+
+        adc_hits = rescored_hits = 0
+        started = time.monotonic()
+        for query, expected in zip(query_vectors, truth):
+            approx = quantizer.scores(query, codes)
+            adc_hits += len(expected & set(top_rows(approx, k).tolist()))
+
+            candidates = top_rows(approx, k * rescore_factor)
+            exact = base[candidates] @ query
+            rescored_hits += len(expected & set(candidates[top_rows(exact, k)].tolist()))
+        query_ms = (time.monotonic() - started) * 1000 / max(len(query_vectors), 1)
+
+        reports.append({
+            'kind': kind,
+            'bytes_per_vector': quantizer.code_size,
+            'compression': base.shape[1] * 4 / quantizer.code_size,
+            f'recall@{k}_adc': adc_hits / (k * len(query_vectors)),
+            f'recall@{k}_rescored': rescored_hits / (k * len(query_vectors)),
+            'train_seconds': train_seconds,
+            'query_ms': query_ms,
+        })
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report recall@K of the quantizers on the vectors of a VectorStore")
+    parser.add_argument('--store', required=True, help="VectorStore directory (e.g. VECTOR_STORE_DIR)")
+    parser.add_argument('--dimension', type=int, default=512)
+    parser.add_argument('--kind', choices=['sq8', 'pq', 'all'], default='all')
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--train-size', type=int, default=20000)
+    parser.add_argument('--rescore-factor', type=int, default=4)
+    parser.add_argument('--pq-subspaces', type=int, default=64)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    from vector_store import VectorStore
+    # Read-only, so it runs next to the service that writes the store
+    store = VectorStore(args.store, args.dimension, read_only=True)
+    vectors = np.array([vector for _, vector, _ in store.items()], dtype=np.float32).reshape(-1, args.dimension)
+    if len(vectors) <= args.queries:
+        raise SystemExit(f"Need more than {args.queries} vectors, the store holds {len(vectors)}")
+
+    kinds = ['sq8', 'pq'] if args.kind == 'all' else [args.kind]
+    print(f"{len(vectors) - args.queries} vectors, {args.queries} held-out queries")
+    for report in evaluate(vectors, kinds,
+                           k=args.k,
+                           queries=args.queries,
+                           train_size=args.train_size,
+                           rescore_factor=args.rescore_factor,
+                           pq_subspaces=args.pq_subspaces,
+                           seed=args.seed):
+        print(f"{report['kind']}: {report['bytes_per_vector']} B/vector ({report['compression']:.0f}x smaller), "
+              f"recall@{args.k} {report[f'recall@{args.k}_adc']:.3f} (ADC) / "
+              f"{report[f'recall@{args.k}_rescored']:.3f} (rescored x{args.rescore_factor}), "
+              f"{report['query_ms']:.2f} ms/query, trained in {report['train_seconds']:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
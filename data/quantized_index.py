@@ -0,0 +1,246 @@
+import os
+import sys
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from hnsw_index import to_vector
+from index import BaseIndex
+from metadata_store import MetadataStore
+from quantization import create_quantizer, load_quantizer, normalize_rows, save_quantizer, top_rows
+
+
+class QuantizedIndex(BaseIndex):
+    """
+    Flat index holding only compressed codes in memory (see quantization.py), backed by a
+    VectorStore with the full-precision vectors on disk.
+
+    A query scores every (filter-matching) code by asymmetric distance, then rescores the best
+    `rescore_factor * top_k` candidates exactly against their vectors read from the store.
+
+    The quantizer is trained on a random sample of `train_size` stored vectors and saved next to
+    the store. Until enough vectors exist to train it, rows are kept in full precision and
+    searched exactly.
+
+    Args:
+        store: VectorStore with the full-precision vectors (required)
+        kind: 'sq8' (4x smaller) or 'pq' (dimension * 4 / pq_subspaces times smaller)
+        pq_subspaces: number of product quantization subspaces (bytes per vector)
+        train_size: number of vectors the quantizer is trained on
+        rescore_factor: candidates rescored per requested result
+    """
+
+    def __init__(self,
+                 index_name,
+                 dimension=512,
+                 store=None,
+                 kind='sq8',
+                 pq_subspaces=64,
+                 train_size=20000,
+                 rescore_factor=4,
+                 initial_capacity=1024,
+                 seed=None,
+                 ):
+        if store is None:
+            raise ValueError("QuantizedIndex needs a VectorStore holding the full-precision vectors")
+
+        self.index_name = index_name
+        self.dimension = dimension
+        self.store = store
+        self.kind = kind
+        self.pq_subspaces = pq_subspaces
+        self.train_size = train_size
+        self.rescore_factor = rescore_factor
+        self.seed = seed
+        self.quantizer_path = os.path.join(store.path, f'quantizer-{kind}.npz')
+
+        self._lock = threading.RLock()
+        self._ids: List[str] = []
+        self._id_to_row: Dict[str, int] = {}
+        self._columns = MetadataStore(initial_capacity)
+        self.quantizer = None
+        self._codes: Optional[np.ndarray] = None
+        # Full-precision rows, only until the quantizer is trained
+        self._raw: Optional[np.ndarray] = np.zeros((initial_capacity, dimension), dtype=np.float32)
+        # Rows written while the quantizer is being trained, None when no training is running
+        self._changed: Optional[set] = None
+
+        if os.path.exists(self.quantizer_path):
+            self.quantizer = load_quantizer(self.quantizer_path)
+            self._codes = np.zeros((initial_capacity, self.quantizer.code_size), dtype=np.uint8)
+            self._raw = None
+        elif len(store) >= train_size:
+            self._train(self._sample_store())
+
+        self._load_store()
+
+    def __len__(self):
+        return len(self._ids)
+
+    def memory_bytes(self) -> int:
+        """
+        Estimated resident bytes: the allocated code (or, before training, full-precision)
+        array, the id list and map, the filter columns and the in-memory tables of the store.
+        Vectors and metadata payloads stay on disk and are not counted.
+        """
+        with self._lock:
+            rows = self._codes if self.quantizer is not None else self._raw
+            # Id strings are shared with the store, which counts them
+            total = rows.nbytes + sys.getsizeof(self._ids) + sys.getsizeof(self._id_to_row)
+            total += len(self._id_to_row) * sys.getsizeof(2 ** 20)
+            total += self._columns.memory_bytes()
+        return total + self.store.memory_bytes()
+
+    def get_by_id(self, ids):
+        if isinstance(ids, str):
+            ids = [ids]
+        with self._lock:
+            known = [record_id for record_id in ids if record_id in self._id_to_row]
+        return self.store.get(known)
+
+    def query_with_scores(self, query_embedding, top_k, filters=None):
+        return [(self._ids[row], sim) for sim, row in self.search(query_embedding, top_k, filters)]
+
+    def search(self, query_embedding, top_k, filters=None):
+        """Return (similarity, row) pairs of the best matches, best first"""
+        with self._lock:
+            n = len(self._ids)
+            quantizer, codes, raw = self.quantizer, self._codes, self._raw
+            mask = self._columns.compile(filters)
+        if n == 0 or top_k <= 0:
+            return []
+
+        query = to_vector(query_embedding, self.dimension)
+        rows = None if mask is None else np.flatnonzero(mask[:n])
+        if rows is not None and len(rows) == 0:
+            return []
+
+        if quantizer is None:
+            sims = raw[:n] @ query if rows is None else raw[rows] @ query
+            best = top_rows(sims, top_k)
+            positions = best if rows is None else rows[best]
+            return [(float(sims[i]), int(row)) for i, row in zip(best, positions)]
+
+        approx = quantizer.scores(query, codes[:n] if rows is None else codes[rows])
+        best = top_rows(approx, top_k * self.rescore_factor)
+        candidates = best if rows is None else rows[best]
+        return self._rescore(query, candidates, top_k)
+
+    def _rescore(self, query, candidates, top_k):
+        """Exact similarities of the candidates, from their full-precision vectors on disk"""
+        ids = [self._ids[row] for row in candidates]
+        vectors = self.store.get_vectors(ids)
+        kept = [(row, vectors[record_id]) for row, record_id in zip(candidates, ids) if record_id in vectors]
+        if not kept:
+            return []
+
+        sims = normalize_rows(np.stack([vector for _, vector in kept])) @ query
+        return [(float(sims[i]), int(kept[i][0])) for i in top_rows(sims, top_k)]
+
+    def upsert_embeddings(self, elements):
+        self.store.upsert(elements)
+        self._add(elements)
+
+        if self.quantizer is None and len(self._ids) >= self.train_size:
+            self._train()
+
+    def _sample_store(self) -> np.ndarray:
+        """Reservoir sample of train_size stored vectors"""
+        rng = np.random.default_rng(self.seed)
+        sample = np.empty((self.train_size, self.dimension), dtype=np.float32)
+        for i, (_, vector, _) in enumerate(self.store.items()):
+            if i < self.train_size:
+                sample[i] = vector
+            else:
+                j = rng.integers(0, i + 1)
+                if j < self.train_size:
+                    sample[j] = vector
+        return normalize_rows(sample[:min(i + 1, self.train_size)])
+
+    def _train(self, vectors: Optional[np.ndarray] = None) -> None:
+        """
+        Train the quantizer on `vectors` (default: the rows indexed so far) and switch to codes.
+        Training and encoding run on a copy outside the lock, so searches and upserts go on in
+        full precision meanwhile; rows written in the meantime are encoded again at the swap.
+        """
+        with self._lock:
+            # Already trained, or being trained by another upsert
+            if self.quantizer is not None or self._changed is not None:
+                return
+            n = len(self._ids)
+            raw = self._raw[:n].copy()
+            self._changed = set()
+
+        try:
+            if vectors is None:
+                vectors = raw
+            rng = np.random.default_rng(self.seed)
+            if len(vectors) > self.train_size:
+                vectors = vectors[rng.choice(len(vectors), self.train_size, replace=False)]
+
+            quantizer = create_quantizer(self.kind, self.dimension, self.pq_subspaces)
+            quantizer.train(vectors, seed=self.seed)
+            if not self.store.read_only:
+                save_quantizer(quantizer, self.quantizer_path)
+            print(f"Trained {self.kind} quantizer on {len(vectors)} vectors ({quantizer.code_size} bytes per vector)")
+            encoded = quantizer.encode(raw) if n else None
+
+            with self._lock:
+                codes = np.zeros((len(self._raw), quantizer.code_size), dtype=np.uint8)
+                if n:
+                    codes[:n] = encoded
+                changed = sorted(self._changed)
+                if changed:
+                    codes[changed] = quantizer.encode(self._raw[changed])
+                self._codes = codes
+                self.quantizer = quantizer
+                self._raw = None
+        finally:
+            with self._lock:
+                self._changed = None
+
+    def _load_store(self, batch_size=10000):
+        batch = []
+        for record_id, vector, metadata in self.store.items():
+            batch.append({'id': record_id, 'embedding': vector, 'metadata': metadata})
+            if len(batch) >= batch_size:
+                self._add(batch)
+                batch = []
+        self._add(batch)
+
+    def _add(self, elements):
+        if not elements:
+            return
+        vectors = normalize_rows(np.stack([to_vector(el['embedding'], self.dimension) for el in elements]))
+
+        with self._lock:
+            encoded = self.quantizer.encode(vectors) if self.quantizer is not None else vectors
+            for el, row_data in zip(elements, encoded):
+                row = self._id_to_row.get(el['id'])
+                if row is None:
+                    row = len(self._ids)
+                    self._ensure_capacity(row + 1)
+                    self._ids.append(el['id'])
+                    self._id_to_row[el['id']] = row
+
+                if self.quantizer is not None:
+                    self._codes[row] = row_data
+                else:
+                    self._raw[row] = row_data
+                    if self._changed is not None:
+                        self._changed.add(row)
+                self._columns.set_row(row, el['metadata'])
+
+    def _ensure_capacity(self, size):
+        rows = self._codes if self.quantizer is not None else self._raw
+        capacity = rows.shape[0]
+        if size <= capacity:
+            return
+
+        grown = np.zeros((max(size, capacity * 2), rows.shape[1]), dtype=rows.dtype)
+        grown[:capacity] = rows
+        if self.quantizer is not None:
+            self._codes = grown
+        else:
+            self._raw = grown
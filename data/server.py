@@ -1,18 +1,27 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
 from typing import Dict, List, Optional
 from pydantic import BaseModel
+import asyncio
 import os
 from dotenv import load_dotenv
 from text_search_manager import TextSearchManager
-from models import init_db, get_db
+from models import SessionLocal, init_db, get_db
 from database import init_database
 from product import Product
 from product_manager import ProductManager
-from index import Index
+from index import BaseIndex, create_index
 from encoder import Encoder
-from utils import rank_products
+from vector_store import open_vector_store
+from cache import LRUCache, canonical_filters, normalize_query
+from image_fetcher import ImageFetcher
+from single_flight import SingleFlight
+from product_cache import product_cache
+from pagination import SnapshotStore, decode_cursor, encode_cursor
+from executors import BlockingRunner
+from embedding_cache import EmbeddingCache
+from utils import aggregate_product_scores, fuse_rankings
 import os
 
 # Load environment variables
@@ -22,11 +31,67 @@ load_dotenv()
 INDEX_NAME = os.getenv('INDEX_NAME', 'products-index')
 INITIAL_INDEX = os.getenv('INITIAL_INDEX', 'false').lower() == 'true'
 DIMENSION = int(os.getenv('DIMENSION', '512'))
-TOP_K = int(os.getenv('DIMENSION', '30'))
+TOP_K = int(os.getenv('TOP_K', '30'))
 HYBRID_SEARCH = os.getenv('HYBRID_SEARCH', 'true').lower() == 'true'
 PRODUCTS_FILE = os.getenv('PRODUCTS_FILE', 'products.json')
 LIMIT = int(os.getenv('LIMIT', '-1'))
+LOAD_BATCH_SIZE = int(os.getenv('LOAD_BATCH_SIZE', '1000'))
+SEARCH_SYNC_CHUNK_SIZE = int(os.getenv('SEARCH_SYNC_CHUNK_SIZE', '1000'))
 VERBOSE = os.getenv('VERBOSE', 'false').lower() == 'true'
+INDEX_BACKEND = os.getenv('INDEX_BACKEND', 'pinecone').lower()
+HNSW_M = int(os.getenv('HNSW_M', '16'))
+HNSW_EF_CONSTRUCTION = int(os.getenv('HNSW_EF_CONSTRUCTION', '200'))
+HNSW_EF_SEARCH = int(os.getenv('HNSW_EF_SEARCH', '64'))
+HNSW_BRUTE_FORCE_RATIO = float(os.getenv('HNSW_BRUTE_FORCE_RATIO', '0.05'))
+HNSW_SAVE_INTERVAL = int(os.getenv('HNSW_SAVE_INTERVAL', '300'))
+QUANTIZATION = os.getenv('QUANTIZATION', 'sq8').lower()
+PQ_SUBSPACES = int(os.getenv('PQ_SUBSPACES', '64'))
+QUANTIZATION_TRAIN_SIZE = int(os.getenv('QUANTIZATION_TRAIN_SIZE', '20000'))
+RESCORE_FACTOR = int(os.getenv('RESCORE_FACTOR', '4'))
+VECTOR_STORE_DIR = os.getenv('VECTOR_STORE_DIR', '')
+VECTOR_STORE_DTYPE = os.getenv('VECTOR_STORE_DTYPE', 'float32')
+VECTOR_STORE_COMPACTION_INTERVAL = int(os.getenv('VECTOR_STORE_COMPACTION_INTERVAL', '600'))
+# 'auto': the first worker writes the vector store and embedding cache, later ones open them read-only
+VECTOR_STORE_MODE = os.getenv('VECTOR_STORE_MODE', 'auto').lower()
+TEXT_CACHE_MAX_BYTES = int(os.getenv('TEXT_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+TEXT_CACHE_TTL = float(os.getenv('TEXT_CACHE_TTL', '3600'))
+RESULT_CACHE_SIZE = int(os.getenv('RESULT_CACHE_SIZE', '10000'))
+RESULT_CACHE_TTL = float(os.getenv('RESULT_CACHE_TTL', '300'))
+TEXT_BATCH_SIZE = int(os.getenv('TEXT_BATCH_SIZE', '16'))
+TEXT_BATCH_WAIT_MS = float(os.getenv('TEXT_BATCH_WAIT_MS', '5'))
+# Which CLIP towers load at startup: 'query' (text), 'index' (vision) or 'both'; the other loads on first use
+DEPLOYMENT_ROLE = os.getenv('DEPLOYMENT_ROLE', 'both').lower()
+TEXT_ENCODER_RUNTIME = os.getenv('TEXT_ENCODER_RUNTIME', 'eager').lower()
+TEXT_ENCODER_ONNX_DIR = os.getenv('TEXT_ENCODER_ONNX_DIR', 'text_encoder_onnx')
+TEXT_ENCODER_ONNX_QUANTIZED = os.getenv('TEXT_ENCODER_ONNX_QUANTIZED', 'true').lower() == 'true'
+TEXT_ENCODER_THREADS = int(os.getenv('TEXT_ENCODER_THREADS', '0'))
+IMAGE_FETCH_WORKERS = int(os.getenv('IMAGE_FETCH_WORKERS', '8'))
+IMAGE_FETCH_TIMEOUT = float(os.getenv('IMAGE_FETCH_TIMEOUT', '10'))
+IMAGE_FETCH_RETRIES = int(os.getenv('IMAGE_FETCH_RETRIES', '2'))
+IMAGE_MAX_BYTES = int(os.getenv('IMAGE_MAX_BYTES', str(20 * 1024 * 1024)))
+EMBEDDING_CACHE_DIR = os.getenv('EMBEDDING_CACHE_DIR', '')
+EMBEDDING_CACHE_PERCEPTUAL = os.getenv('EMBEDDING_CACHE_PERCEPTUAL', 'false').lower() == 'true'
+EMBEDDING_CACHE_MAX_DISTANCE = int(os.getenv('EMBEDDING_CACHE_MAX_DISTANCE', '4'))
+SCORE_AGGREGATION = os.getenv('SCORE_AGGREGATION', 'max').lower()
+SCORE_SOFTMAX_TEMPERATURE = float(os.getenv('SCORE_SOFTMAX_TEMPERATURE', '0.05'))
+OVERFETCH_FACTOR = int(os.getenv('OVERFETCH_FACTOR', '3'))
+MAX_FETCH = int(os.getenv('MAX_FETCH', '1000'))
+PAGE_MAX_LIMIT = int(os.getenv('PAGE_MAX_LIMIT', '100'))
+PAGINATION_MAX_RESULTS = int(os.getenv('PAGINATION_MAX_RESULTS', '300'))
+SNAPSHOT_TTL = float(os.getenv('SNAPSHOT_TTL', '300'))
+SNAPSHOT_MAX = int(os.getenv('SNAPSHOT_MAX', '10000'))
+PAGINATION_PREFETCH = os.getenv('PAGINATION_PREFETCH', 'true').lower() == 'true'
+HYBRID_SEMANTIC_TIMEOUT_MS = float(os.getenv('HYBRID_SEMANTIC_TIMEOUT_MS', '1500'))
+HYBRID_KEYWORD_TIMEOUT_MS = float(os.getenv('HYBRID_KEYWORD_TIMEOUT_MS', '500'))
+HYBRID_SEMANTIC_WEIGHT = float(os.getenv('HYBRID_SEMANTIC_WEIGHT', '1.0'))
+HYBRID_KEYWORD_WEIGHT = float(os.getenv('HYBRID_KEYWORD_WEIGHT', '1.0'))
+HYBRID_RRF_K = int(os.getenv('HYBRID_RRF_K', '60'))
+INFERENCE_WORKERS = int(os.getenv('INFERENCE_WORKERS', '1'))
+IO_WORKERS = int(os.getenv('IO_WORKERS', '32'))
+INDEX_CONCURRENCY = int(os.getenv('INDEX_CONCURRENCY', '16'))
+DB_CONCURRENCY = int(os.getenv('DB_CONCURRENCY', '10'))
+TEXT_SEARCH_CONCURRENCY = int(os.getenv('TEXT_SEARCH_CONCURRENCY', '16'))
+IMAGE_FETCH_CONCURRENCY = int(os.getenv('IMAGE_FETCH_CONCURRENCY', '4'))
 TARGET_ENUMS = [("categories", "category_name"),
                 ("currencies", "currency"),
                 ("shops", "shop_name"),
@@ -46,19 +111,40 @@ app.add_middleware(
 )
 
 # Global variables
-index: Optional[Index] = None
+index: Optional[BaseIndex] = None
 encoder: Optional[Encoder] = None
 product_manager: Optional[ProductManager] = None
 text_search_manager: Optional[TextSearchManager] = None
+image_fetcher: Optional[ImageFetcher] = None
+embedding_cache: Optional[EmbeddingCache] = None
+# Ranked product ids of recent semantic searches, keyed on (query, filters, index generation)
+result_cache: Optional[LRUCache] = LRUCache(max_entries=RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL or None) if RESULT_CACHE_SIZE > 0 else None
+search_flight = SingleFlight()
+# Ranked product ids of paginated semantic searches, referenced by their cursors
+snapshots = SnapshotStore(max_snapshots=SNAPSHOT_MAX, ttl=SNAPSHOT_TTL)
+# Blocking calls made from the endpoints run here, never on the event loop
+blocking = BlockingRunner(inference_workers=INFERENCE_WORKERS,
+                          io_workers=IO_WORKERS,
+                          limits={'index': INDEX_CONCURRENCY,
+                                  'db': DB_CONCURRENCY,
+                                  'text_search': TEXT_SEARCH_CONCURRENCY,
+                                  'images': IMAGE_FETCH_CONCURRENCY})
+# Bumped on every write to the index so cached results of older generations are never served
+index_generation = 0
 
 # Pydantic models
 class QueryRequest(BaseModel):
     query: str
     filters: Dict = {}
+    # Pagination: set limit (and the cursor of the previous page) to get {"results", "next_cursor"}
+    limit: Optional[int] = None
+    cursor: Optional[str] = None
     
 class KeywordRequest(BaseModel):
     keyword: str
     filters: Dict = {}
+    limit: Optional[int] = None
+    cursor: Optional[str] = None
 
 class ProductData(BaseModel):
     id: str
@@ -70,13 +156,12 @@ class ProductData(BaseModel):
 def initialize_product_manager():
     global product_manager, text_search_manager
     db = next(get_db())
-    product_manager = ProductManager(db, PRODUCTS_FILE)
+    product_manager = ProductManager(db, PRODUCTS_FILE, batch_size=LOAD_BATCH_SIZE)
+    product_manager.rebuild_facets()
     
-    
-    
-    all_products = [Product(product.to_dict()) for product in product_manager.get_all_products()]
-    
-    text_search_manager.index_products(all_products)
+    # Only products added, changed or deleted since the last boot are pushed to Meilisearch
+    synced = text_search_manager.sync_products(product_manager, SEARCH_SYNC_CHUNK_SIZE)
+    print(f"Text search index synced: {synced['pushed']} products pushed, {synced['deleted']} deleted")
 
   
 def initialize_search_manager():
@@ -92,52 +177,133 @@ def initialize_database():
   
 
 def initialize_service():
-    global index, encoder
+    global index, encoder, image_fetcher, embedding_cache
+    
+    if INDEX_BACKEND == 'hnsw':
+        store = None
+        if VECTOR_STORE_DIR:
+            store = open_vector_store(VECTOR_STORE_DIR, DIMENSION, VECTOR_STORE_DTYPE, VECTOR_STORE_MODE)
+            if not store.read_only:
+                store.start_compaction(VECTOR_STORE_COMPACTION_INTERVAL)
+            print(f"Vector store loaded from {VECTOR_STORE_DIR} ({len(store)} vectors{', read-only' if store.read_only else ''})")
+        
+        index = create_index(INDEX_BACKEND, INDEX_NAME, DIMENSION,
+                             M=HNSW_M,
+                             ef_construction=HNSW_EF_CONSTRUCTION,
+                             ef_search=HNSW_EF_SEARCH,
+                             brute_force_ratio=HNSW_BRUTE_FORCE_RATIO,
+                             store=store)
+        if store is not None and not store.read_only:
+            index.start_persistence(HNSW_SAVE_INTERVAL)
+    elif INDEX_BACKEND == 'quantized':
+        if not VECTOR_STORE_DIR:
+            raise ValueError("INDEX_BACKEND=quantized rescores against full-precision vectors on disk: set VECTOR_STORE_DIR")
+        store = open_vector_store(VECTOR_STORE_DIR, DIMENSION, VECTOR_STORE_DTYPE, VECTOR_STORE_MODE)
+        if not store.read_only:
+            store.start_compaction(VECTOR_STORE_COMPACTION_INTERVAL)
+        
+        index = create_index(INDEX_BACKEND, INDEX_NAME, DIMENSION,
+                             store=store,
+                             kind=QUANTIZATION,
+                             pq_subspaces=PQ_SUBSPACES,
+                             train_size=QUANTIZATION_TRAIN_SIZE,
+                             rescore_factor=RESCORE_FACTOR)
+        print(f"Quantized index loaded from {VECTOR_STORE_DIR} ({len(index)} vectors, {index.memory_bytes()} bytes)")
+    else:
+        index = create_index(INDEX_BACKEND, INDEX_NAME, DIMENSION)
+    print(f"Index initialized ({INDEX_BACKEND})")
     
-    index = Index(INDEX_NAME, DIMENSION)
-    print("Index initialized")
+    text_cache = None
+    if TEXT_CACHE_MAX_BYTES > 0:
+        text_cache = LRUCache(max_bytes=TEXT_CACHE_MAX_BYTES,
+                              ttl=TEXT_CACHE_TTL or None,
+                              size_of=lambda vector: vector.nbytes)
     
-    encoder = Encoder()
-    print("Encoder initialized")
+    encoder = Encoder(text_cache=text_cache,
+                      text_batch_size=TEXT_BATCH_SIZE,
+                      text_batch_wait_ms=TEXT_BATCH_WAIT_MS,
+                      text_runtime=TEXT_ENCODER_RUNTIME,
+                      onnx_model_dir=TEXT_ENCODER_ONNX_DIR,
+                      onnx_quantized=TEXT_ENCODER_ONNX_QUANTIZED,
+                      onnx_threads=TEXT_ENCODER_THREADS,
+                      role=DEPLOYMENT_ROLE)
+    print(f"Encoder initialized (role: {DEPLOYMENT_ROLE}, text runtime: {TEXT_ENCODER_RUNTIME})")
+    
+    image_fetcher = ImageFetcher(max_workers=IMAGE_FETCH_WORKERS,
+                                 timeout=IMAGE_FETCH_TIMEOUT,
+                                 retries=IMAGE_FETCH_RETRIES,
+                                 max_bytes=IMAGE_MAX_BYTES)
+    
+    if EMBEDDING_CACHE_DIR:
+        embedding_cache = EmbeddingCache(EMBEDDING_CACHE_DIR, DIMENSION,
+                                         perceptual=EMBEDDING_CACHE_PERCEPTUAL,
+                                         max_distance=EMBEDDING_CACHE_MAX_DISTANCE,
+                                         mode=VECTOR_STORE_MODE)
+        print(f"Embedding cache loaded from {EMBEDDING_CACHE_DIR}")
     
 
-def index_single_product(product: Product) -> Dict:
+def lookup_embeddings(missing, fetched):
+    """Split fetched images into (cached embeddings, images to be encoded)"""
+    cached_embeddings = []
+    to_be_encoded = []
+    
+    for (image_id, _), result in zip(missing, fetched):
+        if not result.ok:
+            if VERBOSE:
+                print(f"Failed to fetch image from {result.url}: {result.error}")
+            continue
+        
+        # Identical (or near-identical) images of other products reuse their embedding
+        embedding = embedding_cache.get(result.digest, result.image) if embedding_cache else None
+        if embedding is not None:
+            cached_embeddings.append((image_id, embedding))
+        else:
+            to_be_encoded.append((image_id, result))
+    
+    return cached_embeddings, to_be_encoded
+
+async def index_single_product(product: Product) -> Dict:
     """Index a single product from its JSON data"""
-    global index, encoder, text_search_manager
+    global index, encoder, text_search_manager, image_fetcher, embedding_cache
     
     try:
         image_ids = [f"{product.id}#{image_url}" for image_url in product.image_urls]
-        existing_ids = index.get_by_id(image_ids)
+        existing_ids = await blocking.run('index', index.get_by_id, image_ids)
         
-        to_be_added_images = []
-        to_be_added_image_ids = []
+        missing = [(image_id, image_url) for image_id, image_url in zip(image_ids, product.image_urls)
+                   if image_id not in existing_ids]
         
-        for i, image_url in enumerate(product.image_urls):
-            if image_ids[i] in existing_ids:
-                continue
-            image = product.fetch_image(image_url)
-            to_be_added_images.append(image)
-            to_be_added_image_ids.append(image_ids[i])
-        
-        if len(to_be_added_images) == 0:
+        if len(missing) == 0:
             if VERBOSE:
                 print(f"Product {product.id} already exists in the index")
             return {"message": f"Product {product.id} already exists in the index"}
+        
+        # All images of the product are downloaded concurrently
+        fetched = await blocking.run('images', image_fetcher.fetch_all, [image_url for _, image_url in missing])
+        cached_embeddings, to_be_encoded = await blocking.run('images', lookup_embeddings, missing, fetched)
+        
+        if len(cached_embeddings) + len(to_be_encoded) == 0:
+            raise ValueError(f"None of the images of product {product.id} could be fetched")
 
-        embeddings = encoder.encode_image(to_be_added_images)
+        encoded_embeddings = []
+        if to_be_encoded:
+            embeddings = await blocking.run(BlockingRunner.INFERENCE, encoder.encode_image,
+                                            [result.image for _, result in to_be_encoded])
+            for (image_id, result), embedding in zip(to_be_encoded, embeddings):
+                if embedding_cache:
+                    await blocking.run('images', embedding_cache.set, result.digest, embedding, result.image)
+                encoded_embeddings.append((image_id, embedding))
+        
         embeddings_dict = [
             {
                 'id': image_id,
                 'embedding': embedding,
                 'metadata': product.meta_data
             }
-            for image_id, embedding in zip(to_be_added_image_ids, embeddings)
+            for image_id, embedding in cached_embeddings + encoded_embeddings
         ]
             
-        index.upsert_embeddings(embeddings_dict)
-        
-        if HYBRID_SEARCH:
-            text_search_manager.index_product(product.meta_data)
+        await blocking.run('index', index.upsert_embeddings, embeddings_dict)
         
         if VERBOSE:
             print(f"Product {product.id} added to the index")
@@ -154,32 +320,53 @@ async def startup_event():
     initialize_search_manager()
     initialize_product_manager()
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    blocking.shutdown()
+    if index is not None:
+        index.save()
+
 @app.get("/health")
 async def health_check():
     return {"message": "healthy"}
 
+@app.get("/metrics")
+async def metrics():
+    return {
+        "text_cache": encoder.text_cache.stats() if encoder and encoder.text_cache else None,
+        "text_batcher": encoder.text_batcher.stats() if encoder and encoder.text_batcher else None,
+        "embedding_cache": embedding_cache.stats() if embedding_cache else None,
+        "result_cache": result_cache.stats() if result_cache else None,
+        "product_cache": product_cache.stats(),
+        "snapshots": snapshots.stats(),
+        "index_generation": index_generation,
+        "single_flight": search_flight.stats(),
+        "blocking": blocking.stats(),
+    }
+
 @app.post("/index_product")
 async def index_product_endpoint(
     product_data: ProductData,
     db: Session = Depends(get_db)
 ):
-    global text_search_manager
+    global text_search_manager, index_generation
     product_manager = ProductManager(db)
     
     try:
-        new_product = Product(**product_data.dict())
+        new_product = Product(product_data.dict())
         
-        if product_manager.product_exists(new_product.id):
+        if await blocking.run('db', product_manager.product_exists, new_product.id):
             raise HTTPException(
                 status_code=400,
                 detail=f"Product with id {new_product.id} already exists"
             )
         
-        result = index_single_product(new_product)
-        product_manager.add_product(product=new_product)
+        result = await index_single_product(new_product)
+        await blocking.run('db', product_manager.add_product, product=new_product)
+        index_generation += 1
         
         if HYBRID_SEARCH:
-            text_search_manager.index_product(new_product)
+            await blocking.run('text_search', text_search_manager.index_product, new_product)
         
         return result
     
@@ -187,29 +374,231 @@ async def index_product_endpoint(
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/enums")
-async def get_enums(db: Session = Depends(get_db)):
-    product_manager = ProductManager(db)
+async def get_enums(request: Request, response: Response):
+    # One version lookup in Postgres; the counts are served from memory unless another write changed them
+    facets = await blocking.run('db', product_manager.get_facets)
+    etag = f'"{facets["version"]}"'
     
-    return {
-        e[0]: product_manager.get_enum_values(e[1]) for e in TARGET_ENUMS
+    # Clients holding the current version get an empty 304
+    if request.headers.get('if-none-match') == etag:
+        return Response(status_code=304, headers={'ETag': etag})
+    response.headers['ETag'] = etag
+    
+    enums = {
+        e[0]: facets['values'].get(e[1], []) for e in TARGET_ENUMS
     }
+    enums['counts'] = {e[0]: facets['counts'].get(e[1], {}) for e in TARGET_ENUMS}
+    enums['version'] = facets['version']
+    return enums
 
 @app.post("/keyword_search")
-def keyword_search(
+async def keyword_search(
     query_request: KeywordRequest,
-    db: Session = Depends(get_db)
 ):
+    paginated = query_request.limit is not None or query_request.cursor is not None
     try:
-        search_results = text_search_manager.search_products(
+        # Meilisearch pages natively, so the keyword cursor only carries the offset
+        offset = decode_cursor(query_request.cursor)['o'] if query_request.cursor else None
+        limit = page_limit(query_request.limit) if paginated else None
+        if paginated and offset is None:
+            offset = 0
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        # Identical searches in flight at the same time share one Meilisearch call
+        key = ('keyword', normalize_query(query_request.keyword), canonical_filters(query_request.filters), offset, limit)
+        search_results = await search_flight.do(key, lambda: blocking.run(
+            'text_search',
+            text_search_manager.search_products,
             keyword=query_request.keyword,
-            filters=query_request.filters
-        )
+            filters=query_request.filters,
+            offset=offset,
+            limit=limit
+        ))
+        
+        if not paginated:
+            return search_results['hits']
         
-        return search_results['hits']
+        total = search_results.get('estimatedTotalHits', offset + len(search_results['hits']) + 1)
+        has_more = len(search_results['hits']) == limit and offset + limit < total
+        return {
+            "results": search_results['hits'],
+            "next_cursor": encode_cursor({'o': offset + limit}) if has_more else None,
+        }
     except Exception as e:
         print(str(e))
         raise HTTPException(status_code=500, detail=str(e))
 
+def rank_by_product(query_embedding, k: int, filters: Dict) -> List[str]:
+    """
+    Ids of the k best products, ranked by their aggregated image similarities.
+    
+    Products with many images take several slots of an image-level top-k, so the query is
+    repeated with a growing top-k until k distinct products are found, the index has no more
+    matches, or MAX_FETCH images have been fetched.
+    """
+    fetch = min(max(k * OVERFETCH_FACTOR, k), MAX_FETCH)
+    while True:
+        matches = index.query_with_scores(query_embedding, fetch, filters)
+        products = aggregate_product_scores([image_id for image_id, _ in matches],
+                                            [score for _, score in matches],
+                                            method=SCORE_AGGREGATION,
+                                            temperature=SCORE_SOFTMAX_TEMPERATURE)
+        
+        if len(products) >= k or len(matches) < fetch or fetch >= MAX_FETCH:
+            return [product_id for product_id, _ in products[:k]]
+        fetch = min(fetch * 2, MAX_FETCH)
+
+async def semantic_ranked_ids(query: str, filters: Dict, k: int = TOP_K) -> List[str]:
+    """Ids of the k best products for the query, served from the result cache when possible"""
+    cache_key = (normalize_query(query), canonical_filters(filters), k, index_generation)
+    ranked_ids = result_cache.get(cache_key) if result_cache else None
+    
+    if ranked_ids is None:
+        if encoder.text_batcher is not None:
+            # Awaiting the future lets concurrent requests join the same encoding batch
+            query_embedding = await asyncio.wrap_future(encoder.submit_text(query))
+        else:
+            # Without a batcher a miss is encoded on the calling thread, so keep it off the event loop
+            query_embedding = await blocking.run(BlockingRunner.INFERENCE, encoder.encode_text, query)
+        ranked_ids = await blocking.run('index', rank_by_product, query_embedding, k, filters)
+        
+        if result_cache:
+            result_cache.set(cache_key, ranked_ids)
+    
+    return ranked_ids
+
+async def semantic_search(query: str, filters: Dict, product_manager: ProductManager) -> List[Dict]:
+    if query and query.strip() == "":
+        products = await blocking.run('db', product_manager.get_top_k_recent_products, TOP_K, filters=filters)
+        return [product.to_dict() for product in products]
+    
+    ranked_ids = await semantic_ranked_ids(query, filters)
+    return await hydrate(ranked_ids, product_manager)
+
+def page_limit(limit: Optional[int]) -> int:
+    if limit is None:
+        return TOP_K
+    if limit <= 0:
+        raise ValueError("limit must be positive")
+    return min(limit, PAGE_MAX_LIMIT)
+
+async def snapshot_ranking(query: str, filters: Dict, product_manager: ProductManager) -> List[str]:
+    """The full ranking a paginated search pages through (up to PAGINATION_MAX_RESULTS products)"""
+    if query and query.strip() == "":
+        products = await blocking.run('db', product_manager.get_top_k_recent_products, PAGINATION_MAX_RESULTS, filters=filters)
+        return [product.id for product in products]
+    return await semantic_ranked_ids(query, filters, PAGINATION_MAX_RESULTS)
+
+def prefetch_page(product_ids: List[str]) -> None:
+    """Hydrate the next page in the background so following it costs cache lookups"""
+    if not PAGINATION_PREFETCH or not product_ids or product_cache.cache is None:
+        return
+    task = asyncio.ensure_future(blocking.run('db', product_cache.prefetch, product_ids))
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+async def coalesced_search(key, search):
+    """
+    Await `search(product_manager)`, run once for all identical requests in flight. The shared
+    run opens its own session: the one of the request that started it is closed as soon as that
+    request returns or is cancelled, while the others may still be waiting on the result.
+    """
+    async def run():
+        db = SessionLocal()
+        try:
+            return await search(ProductManager(db))
+        finally:
+            db.close()
+    
+    return await search_flight.do(key, run)
+
+async def paginated_semantic_search(query_request: QueryRequest, product_manager: ProductManager) -> Dict:
+    """
+    One page of a semantic search. The first page snapshots the ranking server-side; the
+    cursors of the next pages point into that snapshot, so they cost hydration only.
+    """
+    try:
+        limit = page_limit(query_request.limit)
+        position = decode_cursor(query_request.cursor) if query_request.cursor else None
+        if position is not None and not isinstance(position.get('s'), str):
+            raise ValueError("Invalid cursor")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if position is not None:
+        ranked_ids = snapshots.get(position.get('s'))
+        if ranked_ids is None:
+            raise HTTPException(status_code=410, detail="Cursor expired, run the search again without a cursor")
+        snapshot_id, offset = position['s'], position['o']
+    else:
+        query, filters = query_request.query, query_request.filters
+        key = ('snapshot', query if query and query.strip() == "" else normalize_query(query),
+               canonical_filters(filters), index_generation)
+        ranked_ids = await coalesced_search(key, lambda manager: snapshot_ranking(query, filters, manager))
+        snapshot_id, offset = snapshots.create(ranked_ids), 0
+    
+    next_offset = offset + limit
+    has_more = next_offset < len(ranked_ids)
+    if has_more:
+        prefetch_page(ranked_ids[next_offset:next_offset + limit])
+    
+    return {
+        "results": await hydrate(ranked_ids[offset:next_offset], product_manager),
+        "next_cursor": encode_cursor({'s': snapshot_id, 'o': next_offset}) if has_more else None,
+    }
+
+async def hydrate(product_ids: List[str], product_manager: ProductManager) -> List[Dict]:
+    """Payloads of the products in ranked order; only products missing from the product cache hit Postgres"""
+    # Cache hits are dictionary lookups on the event loop; whatever missed (even if evicted
+    # since the ranking was computed) is read in the I/O executor, never on the loop
+    payloads, misses = product_cache.lookup(product_ids)
+    if misses:
+        payloads.update(await blocking.run('db', product_manager.load_product_payloads, misses))
+    return [payloads[product_id] for product_id in product_ids if product_id in payloads]
+
+async def within_deadline(name: str, task: asyncio.Future, timeout_ms: float):
+    """
+    Result of a search leg, or None when it fails or misses its deadline.
+    
+    A late leg keeps running in the background (filling the caches) instead of being cancelled.
+    """
+    try:
+        return await asyncio.wait_for(asyncio.shield(task), timeout_ms / 1000), 'ok'
+    except asyncio.TimeoutError:
+        # Retrieve the late outcome so a failure is not reported as never retrieved
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        print(f"Hybrid search: {name} leg missed its {timeout_ms:.0f} ms deadline")
+        return None, 'timeout'
+    except Exception as e:
+        print(f"Hybrid search: {name} leg failed: {str(e)}")
+        return None, 'error'
+
+async def hybrid_search(query: str, filters: Dict, product_manager: ProductManager) -> Dict:
+    # Both legs run concurrently, so the latency is that of the slower one (bounded by its deadline)
+    semantic = asyncio.ensure_future(semantic_ranked_ids(query, filters))
+    legs = [within_deadline('semantic', semantic, HYBRID_SEMANTIC_TIMEOUT_MS)]
+    if HYBRID_SEARCH:
+        keyword = asyncio.ensure_future(blocking.run('text_search', text_search_manager.search_ids, query, filters, TOP_K))
+        legs.append(within_deadline('keyword', keyword, HYBRID_KEYWORD_TIMEOUT_MS))
+    
+    (semantic_ids, semantic_status), *keyword_leg = await asyncio.gather(*legs)
+    keyword_ids, keyword_status = keyword_leg[0] if keyword_leg else (None, 'disabled')
+    
+    if semantic_ids is None and keyword_ids is None:
+        raise HTTPException(status_code=503, detail="Both semantic and keyword search failed")
+    
+    fused = fuse_rankings([semantic_ids, keyword_ids],
+                          weights=[HYBRID_SEMANTIC_WEIGHT, HYBRID_KEYWORD_WEIGHT],
+                          k=HYBRID_RRF_K)
+    top_ids = [product_id for product_id, _ in fused[:TOP_K]]
+    
+    # Only the fused top-K is hydrated, once, in fused order
+    return {
+        "results": await hydrate(top_ids, product_manager),
+        "legs": {"semantic": semantic_status, "keyword": keyword_status},
+    }
+
 @app.post("/semantic_search")
 async def query_endpoint(
     query_request: QueryRequest,
@@ -217,18 +606,15 @@ async def query_endpoint(
 ):
     product_manager = ProductManager(db)
     query = query_request.query
+    
+    if query_request.limit is not None or query_request.cursor is not None:
+        return await paginated_semantic_search(query_request, product_manager)
+    
     try:
-        
-        if query and query.strip() == "":
-            products = product_manager.get_top_k_recent_products(TOP_K)
-        else:
-            query_embedding = encoder.encode_text(query_request.query)
-            top_image_ids = index.query(query_embedding, TOP_K, query_request.filters)
-            top_ids = [image_id.split('#')[0] for image_id in top_image_ids]
-            ranked_ids = rank_products(top_ids)
-            
-            products = product_manager.get_products_by_id(ranked_ids)
-        response = [product.to_dict() for product in products]
+        # Identical searches in flight at the same time share one encoding, vector query and hydration
+        key = ('semantic', query if query and query.strip() == "" else normalize_query(query),
+               canonical_filters(query_request.filters), index_generation)
+        response = await coalesced_search(key, lambda manager: semantic_search(query, query_request.filters, manager))
         
         return {"results": response}
     
@@ -236,6 +622,27 @@ async def query_endpoint(
         raise(e)
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/hybrid_search")
+async def hybrid_search_endpoint(
+    query_request: QueryRequest,
+    db: Session = Depends(get_db)
+):
+    product_manager = ProductManager(db)
+    query = query_request.query
+    
+    if not query or query.strip() == "":
+        # Nothing to match on: same recent products as the semantic search
+        return {"results": await semantic_search(query, query_request.filters, product_manager)}
+    
+    try:
+        key = ('hybrid', normalize_query(query), canonical_filters(query_request.filters), index_generation)
+        return await coalesced_search(key, lambda manager: hybrid_search(query, query_request.filters, manager))
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 if __name__ == '__main__':
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=5000)
\ No newline at end of file
@@ -0,0 +1,41 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller starts the computation and
+    every caller that arrives while it is in flight awaits that same result (or exception).
+    
+    The computation runs as its own task, so a caller that goes away does not cancel it for
+    the others. Nothing is cached once it finishes.
+    """
+    
+    def __init__(self):
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+        self.calls = 0
+        self.executions = 0
+    
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        self.calls += 1
+        
+        task = self._in_flight.get(key)
+        if task is None:
+            self.executions += 1
+            task = asyncio.ensure_future(fn())
+            self._in_flight[key] = task
+            
+            def forget(_):
+                if self._in_flight.get(key) is task:
+                    del self._in_flight[key]
+            task.add_done_callback(forget)
+        
+        return await asyncio.shield(task)
+    
+    def stats(self) -> Dict[str, int]:
+        return {
+            'calls': self.calls,
+            'executions': self.executions,
+            'coalesced': self.calls - self.executions,
+            'in_flight': len(self._in_flight),
+        }
@@ -0,0 +1,95 @@
+import threading
+import unittest
+from concurrent.futures import CancelledError
+
+from batcher import MicroBatcher
+
+
+class BlockingProcess:
+    """Batch function that records its batches and holds the first one until released"""
+
+    def __init__(self):
+        self.batches = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self, items):
+        self.batches.append(list(items))
+        self.started.set()
+        self.release.wait(5)
+        return [item * 2 for item in items]
+
+
+class MicroBatcherTest(unittest.TestCase):
+    def test_results_per_item(self):
+        """Test each caller gets its own row of the batch result"""
+        batcher = MicroBatcher(lambda items: [item * 2 for item in items], max_wait_ms=1)
+        self.assertEqual(batcher(21), 42)
+
+    def test_batch_splitting(self):
+        """Test pending items are processed together, at most max_batch_size at a time"""
+        process = BlockingProcess()
+        batcher = MicroBatcher(process, max_batch_size=4, max_wait_ms=50)
+        first = batcher.submit(0)
+        self.assertTrue(process.started.wait(5))
+
+        futures = [batcher.submit(i) for i in range(1, 11)]
+        process.release.set()
+
+        self.assertEqual(first.result(5), 0)
+        self.assertEqual([future.result(5) for future in futures], [i * 2 for i in range(1, 11)])
+        self.assertEqual(process.batches, [[0], [1, 2, 3, 4], [5, 6, 7, 8], [9, 10]])
+
+        stats = batcher.stats()
+        self.assertEqual(stats['batches'], 4)
+        self.assertEqual(stats['items'], 11)
+        self.assertEqual(stats['largest_batch'], 4)
+
+    def test_cancelled_items_are_skipped(self):
+        """Test items cancelled while pending never reach the batch function"""
+        process = BlockingProcess()
+        batcher = MicroBatcher(process, max_batch_size=8, max_wait_ms=20)
+        batcher.submit(0)
+        self.assertTrue(process.started.wait(5))
+
+        cancelled = batcher.submit(1)
+        kept = batcher.submit(2)
+        self.assertTrue(cancelled.cancel())
+        process.release.set()
+
+        self.assertEqual(kept.result(5), 4)
+        with self.assertRaises(CancelledError):
+            cancelled.result()
+        self.assertEqual(process.batches, [[0], [2]])
+
+    def test_running_items_cannot_be_cancelled(self):
+        """Test an item already in a running batch still gets its result"""
+        process = BlockingProcess()
+        batcher = MicroBatcher(process, max_wait_ms=1)
+        future = batcher.submit(3)
+        self.assertTrue(process.started.wait(5))
+        self.assertFalse(future.cancel())
+        process.release.set()
+        self.assertEqual(future.result(5), 6)
+
+    def test_errors_reach_every_caller(self):
+        """Test a failing batch fails each of its futures and the worker keeps running"""
+        def process(items):
+            if 'bad' in items:
+                raise RuntimeError('boom')
+            return items
+
+        batcher = MicroBatcher(process, max_wait_ms=1)
+        with self.assertRaises(RuntimeError):
+            batcher('bad')
+        self.assertEqual(batcher('good'), 'good')
+
+    def test_result_length_mismatch(self):
+        """Test a batch function returning the wrong number of results is reported"""
+        batcher = MicroBatcher(lambda items: [], max_wait_ms=1)
+        with self.assertRaises(ValueError):
+            batcher(1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import time
+import unittest
+
+from cache import LRUCache, canonical_filters, normalize_query
+
+
+class LRUCacheTest(unittest.TestCase):
+    def test_lru_eviction(self):
+        """Test the least recently used entry is evicted first"""
+        cache = LRUCache(max_entries=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_max_bytes(self):
+        """Test the memory ceiling evicts old entries and skips values larger than it"""
+        cache = LRUCache(max_bytes=10, size_of=len)
+        cache.set('a', 'x' * 6)
+        cache.set('b', 'y' * 6)
+        self.assertNotIn('a', cache)
+        self.assertIn('b', cache)
+        cache.set('c', 'z' * 11)
+        self.assertNotIn('c', cache)
+        self.assertEqual(cache.stats()['bytes'], 6)
+
+    def test_replace_keeps_bytes_accurate(self):
+        """Test overwriting an entry replaces its size"""
+        cache = LRUCache(size_of=len)
+        cache.set('a', 'xx')
+        cache.set('a', 'xxxx')
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.stats()['bytes'], 4)
+        cache.delete('a')
+        self.assertEqual(cache.stats()['bytes'], 0)
+
+    def test_ttl(self):
+        """Test entries expire after the TTL"""
+        cache = LRUCache(ttl=0.05)
+        cache.set('a', 1)
+        self.assertEqual(cache.get('a'), 1)
+        time.sleep(0.1)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.stats()['expirations'], 1)
+
+    def test_stats(self):
+        """Test hits and misses are counted, membership tests are not"""
+        cache = LRUCache()
+        cache.set('a', 1)
+        cache.get('a')
+        cache.get('b')
+        self.assertIn('a', cache)
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['hit_rate']), (1, 1, 0.5))
+
+
+class CacheKeyTest(unittest.TestCase):
+    def test_normalize_query(self):
+        """Test queries differing only in case and whitespace share a key"""
+        self.assertEqual(normalize_query('  Blue   JEANS '), 'blue jeans')
+
+    def test_canonical_filters(self):
+        """Test key order and any-of list order do not change the key"""
+        a = {'category': ['Shoes', 'Bags'], 'price': {'min': 1, 'currency': 'USD'}}
+        b = {'price': {'currency': 'USD', 'min': 1}, 'category': ['Bags', 'Shoes']}
+        self.assertEqual(canonical_filters(a), canonical_filters(b))
+        self.assertNotEqual(canonical_filters(a), canonical_filters({'category': ['Shoes']}))
+        self.assertEqual(canonical_filters(None), canonical_filters({}))
+
+
+if __name__ == '__main__':
+    unittest.main()
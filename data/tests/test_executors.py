@@ -0,0 +1,65 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from executors import BlockingRunner
+
+
+class BlockingRunnerTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.runner = BlockingRunner(inference_workers=1, io_workers=8, limits={'db': 2})
+        self._lock = threading.Lock()
+        self.active = 0
+        self.peak = 0
+
+    def tearDown(self):
+        self.runner.shutdown()
+
+    def work(self, value=None):
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(0.02)
+        with self._lock:
+            self.active -= 1
+        return threading.current_thread().name, value
+
+    async def test_resource_limit(self):
+        """Test no more calls of a resource run at once than its limit"""
+        results = await asyncio.gather(*(self.runner.run('db', self.work, i) for i in range(6)))
+        self.assertEqual([value for _, value in results], list(range(6)))
+        self.assertEqual(self.peak, 2)
+
+        stats = self.runner.stats()['db']
+        self.assertEqual(stats, {'limit': 2, 'running': 0, 'waiting': 0, 'calls': 6})
+
+    async def test_unlimited_resource_uses_io_pool(self):
+        """Test a resource without a limit runs concurrently on the shared I/O threads"""
+        results = await asyncio.gather(*(self.runner.run('images', self.work) for _ in range(4)))
+        self.assertEqual(self.peak, 4)
+        self.assertTrue(all(name.startswith('blocking-io') for name, _ in results))
+        self.assertIsNone(self.runner.stats()['images']['limit'])
+
+    async def test_inference_runs_on_its_own_executor(self):
+        """Test inference is limited to its workers and never takes an I/O thread"""
+        results = await asyncio.gather(*(self.runner.run(BlockingRunner.INFERENCE, self.work) for _ in range(3)),
+                                       self.runner.run('db', self.work))
+        self.assertTrue(all(name.startswith('inference') for name, _ in results[:3]))
+        self.assertTrue(results[3][0].startswith('blocking-io'))
+        self.assertEqual(self.runner.stats()[BlockingRunner.INFERENCE]['limit'], 1)
+
+    async def test_exception_releases_the_slot(self):
+        """Test a failing call propagates its exception and frees its slot"""
+        def fail():
+            raise ValueError('boom')
+
+        for _ in range(3):
+            with self.assertRaises(ValueError):
+                await self.runner.run('db', fail)
+        self.assertEqual(await self.runner.run('db', lambda: 'ok'), 'ok')
+        self.assertEqual(self.runner.stats()['db']['running'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+
+from facets import FacetStore, facet_delta, facet_values
+
+
+class FacetDeltaTest(unittest.TestCase):
+    def test_insert_and_delete(self):
+        """Test a new product adds one to each of its facet values and a deleted one removes it"""
+        meta_data = {'category_name': 'Shoes', 'currency': 'EUR', 'shop_name': 'A', 'region': 'EU', 'title': 'x'}
+        expected = {('category_name', 'Shoes'): 1, ('currency', 'EUR'): 1, ('shop_name', 'A'): 1, ('region', 'EU'): 1}
+        self.assertEqual(facet_delta(None, meta_data), expected)
+        self.assertEqual(facet_delta(meta_data, None), {key: -1 for key in expected})
+
+    def test_update(self):
+        """Test only the fields whose value changed appear in the delta"""
+        old = {'category_name': 'Shoes', 'currency': 'EUR', 'shop_name': 'A'}
+        new = {'category_name': 'Bags', 'currency': 'EUR', 'shop_name': 'A', 'price': 3}
+        self.assertEqual(facet_delta(old, new), {('category_name', 'Shoes'): -1, ('category_name', 'Bags'): 1})
+        self.assertEqual(facet_delta(old, dict(old)), {})
+
+    def test_empty_values_are_skipped(self):
+        """Test missing, empty and 'null' values are not counted, and values are compared as strings"""
+        self.assertEqual(facet_values({'category_name': '', 'currency': None, 'shop_name': 'null', 'region': 1}),
+                         {'region': '1'})
+        self.assertEqual(facet_delta({'region': 1}, {'region': '1', 'shop_name': ''}), {})
+
+
+class FacetStoreTest(unittest.TestCase):
+    def test_load(self):
+        """Test loaded rows are served sorted per field, without zero counts or unknown fields"""
+        store = FacetStore()
+        self.assertIsNone(store.version)
+        self.assertEqual(store.values('region'), [])
+
+        store.load([('region', 'US', 2), ('region', 'EU', 5), ('region', 'APAC', 0), ('color', 'red', 1)], '1.7')
+        self.assertEqual(store.version, '1.7')
+        self.assertEqual(store.values('region'), ['EU', 'US'])
+        self.assertEqual(store.snapshot()['counts']['region'], {'EU': 5, 'US': 2})
+        self.assertNotIn('color', store.snapshot()['values'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,161 @@
+import shutil
+import tempfile
+import threading
+import unittest
+
+import numpy as np
+
+from hnsw_index import HNSWIndex
+from vector_store import VectorStore
+
+
+DIMENSION = 32
+
+
+def make_elements(vectors, start=0):
+    return [{
+        'id': f'p{i}#img',
+        'embedding': vectors[i],
+        'metadata': {'region': 'US' if i % 3 == 0 else 'EU', 'current_price': str(i), 'currency': 'USD'},
+    } for i in range(start, len(vectors))]
+
+
+class HNSWIndexTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        rng = np.random.default_rng(0)
+        cls.vectors = rng.normal(size=(1000, DIMENSION)).astype(np.float32)
+        cls.normalized = cls.vectors / np.linalg.norm(cls.vectors, axis=1, keepdims=True)
+        cls.queries = cls.normalized[:50] + rng.normal(scale=0.05, size=(50, DIMENSION)).astype(np.float32)
+        cls.index = HNSWIndex('test', DIMENSION, ef_construction=100, seed=1)
+        cls.index.upsert_embeddings(make_elements(cls.vectors))
+
+    def exact_ids(self, query, k, rows=None):
+        rows = np.arange(len(self.normalized)) if rows is None else rows
+        best = rows[np.argsort(-(self.normalized[rows] @ query))[:k]]
+        return {f'p{i}#img' for i in best}
+
+    def recall(self, index, k=10, filters=None, rows=None):
+        hits = sum(len(self.exact_ids(query, k, rows) & set(index.query(query, k, filters))) for query in self.queries)
+        return hits / (k * len(self.queries))
+
+    def test_recall(self):
+        """Test the graph finds nearly all of the exact nearest neighbours"""
+        self.assertGreaterEqual(self.recall(self.index), 0.95)
+
+    def test_scores_are_sorted_cosine_similarities(self):
+        """Test query_with_scores returns cosine similarities, best first"""
+        results = self.index.query_with_scores(self.queries[0], 5)
+        scores = [score for _, score in results]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+        record_id, score = results[0]
+        row = int(record_id[1:].split('#')[0])
+        query = self.queries[0] / np.linalg.norm(self.queries[0])
+        self.assertAlmostEqual(score, float(self.normalized[row] @ query), places=5)
+
+    def test_filtered_search(self):
+        """Test filtered searches only return matching rows and keep their recall"""
+        us_rows = np.arange(0, len(self.vectors), 3)
+        for query in self.queries[:10]:
+            for record_id in self.index.query(query, 10, {'region': 'US'}):
+                self.assertEqual(int(record_id[1:].split('#')[0]) % 3, 0)
+        self.assertGreaterEqual(self.recall(self.index, filters={'region': 'US'}, rows=us_rows), 0.95)
+
+    def test_selective_filter_is_exact(self):
+        """Test a filter matching few rows is answered exactly"""
+        rows = np.arange(100, 121)
+        filters = {'price': {'currency': 'USD', 'min': 100, 'max': 120}}
+        for query in self.queries[:5]:
+            self.assertEqual(set(self.index.query(query, 5, filters)), self.exact_ids(query, 5, rows))
+
+    def test_no_match(self):
+        """Test a filter matching nothing returns no results"""
+        self.assertEqual(self.index.query(self.queries[0], 10, {'region': 'Mars'}), [])
+
+    def test_upsert_replaces_vector(self):
+        """Test upserting an existing id replaces its vector and metadata"""
+        index = HNSWIndex('test', DIMENSION, ef_construction=100, seed=1)
+        index.upsert_embeddings(make_elements(self.vectors[:200]))
+        index.upsert_embeddings([{'id': 'p0#img', 'embedding': self.vectors[150], 'metadata': {'region': 'APAC'}}])
+        self.assertEqual(len(index), 200)
+        self.assertEqual(index.get_by_id('p0#img')['p0#img']['metadata'], {'region': 'APAC'})
+        self.assertEqual(index.query(self.vectors[150], 2, {'region': 'APAC'}), ['p0#img'])
+
+
+    def test_search_while_inserting(self):
+        """Test searches running next to inserts that grow the graph neither fail nor return unpublished nodes"""
+        index = HNSWIndex('test', DIMENSION, ef_construction=100, initial_capacity=16, seed=1)
+        elements = make_elements(self.vectors)
+        index.upsert_embeddings(elements[:50])
+        errors = []
+
+        def write():
+            for start in range(50, len(elements), 50):
+                index.upsert_embeddings(elements[start:start + 50])
+
+        def read():
+            try:
+                while writer.is_alive():
+                    for record_id in index.query(self.queries[0], 10) + index.query(self.queries[1], 10, {'region': 'US'}):
+                        self.assertIn(record_id, index._id_to_node)
+            except Exception as e:
+                errors.append(e)
+
+        writer = threading.Thread(target=write)
+        readers = [threading.Thread(target=read) for _ in range(3)]
+        writer.start()
+        for reader in readers:
+            reader.start()
+        writer.join()
+        for reader in readers:
+            reader.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(index), len(elements))
+        self.assertGreaterEqual(self.recall(index), 0.95)
+
+class HNSWPersistenceTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.vectors = np.random.default_rng(1).normal(size=(600, DIMENSION)).astype(np.float32)
+
+    def tearDown(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def test_save_and_reload(self):
+        """Test a saved graph is reloaded as is and vectors stored after the save are inserted"""
+        store = VectorStore(self.path, DIMENSION)
+        index = HNSWIndex('test', DIMENSION, ef_construction=100, store=store, seed=1)
+        elements = make_elements(self.vectors)
+        index.upsert_embeddings(elements[:500])
+        index.save()
+        index.upsert_embeddings(elements[500:])
+        expected = [index.query(query, 10) for query in self.vectors[:20]]
+        store.close()
+
+        store = VectorStore(self.path, DIMENSION)
+        try:
+            reloaded = HNSWIndex('test', DIMENSION, ef_construction=100, store=store, seed=1)
+            self.assertEqual(len(reloaded), 600)
+            self.assertEqual(reloaded._graph.get_current_count(), 600)
+            self.assertEqual(reloaded.query(self.vectors[550], 1), ['p550#img'])
+            overlap = sum(len(set(a) & set(reloaded.query(query, 10))) for a, query in zip(expected, self.vectors[:20]))
+            self.assertGreaterEqual(overlap / 200, 0.95)
+            self.assertEqual(reloaded.get_by_id(['p3#img', 'missing']).keys(), {'p3#img'})
+        finally:
+            store.close()
+
+    def test_rebuild_without_saved_graph(self):
+        """Test an index over a store without a saved graph is rebuilt from the stored vectors"""
+        store = VectorStore(self.path, DIMENSION)
+        store.upsert(make_elements(self.vectors[:100]))
+        try:
+            index = HNSWIndex('test', DIMENSION, ef_construction=100, store=store, seed=1)
+            self.assertEqual(len(index), 100)
+            self.assertEqual(index.query(self.vectors[42], 1), ['p42#img'])
+        finally:
+            store.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
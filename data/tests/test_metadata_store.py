@@ -0,0 +1,72 @@
+import unittest
+
+import numpy as np
+
+from metadata_store import MetadataStore
+
+
+ROWS = [
+    {'category_name': 'Shoes', 'shop_name': 'A', 'region': 'EU', 'currency': 'EUR', 'current_price': '10', 'off_percent': 5},
+    {'category_name': 'Shoes', 'shop_name': 'B', 'region': 'US', 'currency': 'USD', 'current_price': '25.5'},
+    {'category_name': 'Bags', 'shop_name': 'A', 'region': 'EU', 'currency': 'EUR', 'current_price': 'n/a', 'off_percent': 30},
+    {'category_name': 'Hats', 'shop_name': 'C', 'region': 'EU', 'currency': 'EUR', 'current_price': 40, 'off_percent': 20},
+    None,
+]
+
+
+class MetadataStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.store = MetadataStore(initial_capacity=2)
+        for row, metadata in enumerate(ROWS):
+            self.store.set_row(row, metadata)
+
+    def rows(self, filters):
+        return np.flatnonzero(self.store.compile(filters)).tolist()
+
+    def test_no_filters(self):
+        """Test an empty filter compiles to None"""
+        self.assertEqual(len(self.store), 5)
+        self.assertIsNone(self.store.compile({}))
+        self.assertIsNone(self.store.compile(None))
+
+    def test_categorical_filters(self):
+        """Test any-of and equality filters on the dictionary-encoded columns"""
+        self.assertEqual(self.rows({'category': ['Shoes', 'Hats']}), [0, 1, 3])
+        self.assertEqual(self.rows({'category': 'Bags'}), [2])
+        self.assertEqual(self.rows({'shop': ['A'], 'region': 'EU'}), [0, 2])
+        self.assertEqual(self.rows({'region': 'Mars'}), [])
+        self.assertEqual(self.rows({'category': ['Unknown']}), [])
+
+    def test_price_filter(self):
+        """Test the price range applies in the given currency and skips unparsable prices"""
+        self.assertEqual(self.rows({'price': {'currency': 'EUR', 'min': 5}}), [0, 3])
+        self.assertEqual(self.rows({'price': {'currency': 'EUR', 'max': 20}}), [0])
+        self.assertEqual(self.rows({'price': {'currency': 'USD', 'min': 20, 'max': 30}}), [1])
+
+    def test_discount_filter(self):
+        """Test rows without a discount never match a discount filter"""
+        self.assertEqual(self.rows({'discount': 20}), [0, 3])
+
+    def test_overwrite_row(self):
+        """Test set_row replaces the values of an existing row"""
+        self.store.set_row(1, {'category_name': 'Bags'})
+        self.assertEqual(self.rows({'category': 'Bags'}), [1, 2])
+        self.assertEqual(self.rows({'region': 'US'}), [])
+
+    def test_set_row_past_end(self):
+        """Test rows can only be appended at the end"""
+        with self.assertRaises(IndexError):
+            self.store.set_row(7, {})
+
+    def test_allocate(self):
+        """Test allocated rows start with every value missing and can be set in any order"""
+        store = MetadataStore(initial_capacity=1)
+        store.allocate(4)
+        store.set_row(3, {'region': 'EU'})
+        store.set_row(0, {'region': 'EU'})
+        self.assertEqual(len(store), 4)
+        self.assertEqual(np.flatnonzero(store.compile({'region': 'EU'})).tolist(), [0, 3])
+
+
+if __name__ == '__main__':
+    unittest.main()
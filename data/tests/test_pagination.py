@@ -0,0 +1,55 @@
+import base64
+import time
+import unittest
+
+from pagination import SnapshotStore, decode_cursor, encode_cursor
+
+
+class CursorTest(unittest.TestCase):
+    def test_round_trip(self):
+        """Test a cursor decodes to the position it was made from"""
+        position = {'s': 'abc', 'o': 40}
+        cursor = encode_cursor(position)
+        self.assertNotIn('=', cursor)
+        self.assertEqual(decode_cursor(cursor), position)
+
+    def test_invalid_cursors(self):
+        """Test malformed, tampered and out of range cursors are rejected"""
+        invalid = [
+            '',
+            'not a cursor!',
+            base64.urlsafe_b64encode(b'[1, 2]').decode(),
+            encode_cursor({'s': 'abc'}),
+            encode_cursor({'o': -1}),
+            encode_cursor({'o': '10'}),
+        ]
+        for cursor in invalid:
+            with self.subTest(cursor=cursor), self.assertRaises(ValueError):
+                decode_cursor(cursor)
+
+
+class SnapshotStoreTest(unittest.TestCase):
+    def test_create_and_get(self):
+        """Test a snapshot keeps its ranking, unaffected by later changes to the input list"""
+        store = SnapshotStore()
+        ranking = ['p1', 'p2', 'p3']
+        snapshot_id = store.create(ranking)
+        ranking.append('p4')
+        self.assertEqual(store.get(snapshot_id), ['p1', 'p2', 'p3'])
+        self.assertIsNone(store.get('unknown'))
+
+    def test_expiry_and_capacity(self):
+        """Test snapshots expire after the TTL and the oldest are dropped past the limit"""
+        store = SnapshotStore(max_snapshots=2, ttl=0.05)
+        first = store.create(['a'])
+        store.create(['b'])
+        store.create(['c'])
+        self.assertIsNone(store.get(first))
+
+        snapshot_id = store.create(['d'])
+        time.sleep(0.1)
+        self.assertIsNone(store.get(snapshot_id))
+
+
+if __name__ == '__main__':
+    unittest.main()
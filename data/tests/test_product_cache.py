@@ -0,0 +1,70 @@
+import unittest
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from models import ProductModel
+from product_cache import ProductCache
+
+
+class ProductCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        ProductModel.__table__.create(self.engine)
+        self.session = Session(self.engine)
+        self.session.add_all([ProductModel(id=f'p{i}', meta_data={'title': f'Product {i}'}) for i in range(5)])
+        self.session.commit()
+
+    def tearDown(self):
+        self.session.close()
+        self.engine.dispose()
+
+    def test_lookup_and_load(self):
+        """Test lookup serves only cached products and load reads the misses in one query and caches them"""
+        cache = ProductCache(max_entries=10)
+        payloads, misses = cache.lookup(['p1', 'p2', 'p1'])
+        self.assertEqual((payloads, misses), ({}, ['p1', 'p2']))
+
+        loaded = cache.load(self.session, ['p1', 'p2', 'missing'])
+        self.assertEqual(loaded, {'p1': {'title': 'Product 1'}, 'p2': {'title': 'Product 2'}})
+        self.assertEqual(cache.queries, 1)
+
+        payloads, misses = cache.lookup(['p2', 'p3', 'p1'])
+        self.assertEqual(payloads, {'p1': {'title': 'Product 1'}, 'p2': {'title': 'Product 2'}})
+        self.assertEqual(misses, ['p3'])
+
+    def test_get_many_keeps_order(self):
+        """Test hydrated payloads follow the requested order, skip unknown ids and query only the misses"""
+        cache = ProductCache(max_entries=10)
+        cache.get_many(self.session, ['p3'])
+        payloads = cache.get_many(self.session, ['p4', 'missing', 'p3', 'p0'])
+        self.assertEqual([payload['title'] for payload in payloads], ['Product 4', 'Product 3', 'Product 0'])
+        self.assertEqual(cache.queries, 2)
+
+    def test_invalidate(self):
+        """Test invalidated products are read again, and a load racing an invalidation is not cached"""
+        cache = ProductCache(max_entries=10)
+        cache.load(self.session, ['p1', 'p2'])
+        cache.invalidate(['p1'])
+        self.assertEqual(cache.lookup(['p1', 'p2'])[1], ['p1'])
+
+        execute = self.session.execute
+
+        def execute_during_write(*args, **kwargs):
+            result = execute(*args, **kwargs)
+            cache.invalidate(['p3'])
+            return result
+        self.session.execute = execute_during_write
+        self.assertEqual(cache.load(self.session, ['p3']), {'p3': {'title': 'Product 3'}})
+        self.assertEqual(cache.lookup(['p3'])[1], ['p3'])
+
+    def test_disabled(self):
+        """Test a cache without entries misses every lookup but still loads"""
+        cache = ProductCache(max_entries=0)
+        cache.load(self.session, ['p1'])
+        self.assertEqual(cache.lookup(['p1']), ({}, ['p1']))
+        self.assertEqual(cache.stats(), {'queries': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
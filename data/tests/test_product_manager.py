@@ -0,0 +1,76 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from product_manager import iter_products_data
+
+
+PRODUCTS = [
+    {'id': 1, 'title': 'Shoe, "red"', 'price': 10.5, 'discount': None},
+    {'id': 22, 'title': 'Bag [large]', 'tags': ['a', {'b': ']'}]},
+    {'id': 333, 'title': 'Hat', 'price': 1e3},
+]
+
+
+class IterProductsDataTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'products.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def parse(self, content, chunk_size=1024 * 1024):
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return list(iter_products_data(self.path, chunk_size=chunk_size))
+
+    def expected(self):
+        return [{k: v for k, v in product.items() if v is not None} for product in PRODUCTS]
+
+    def test_chunk_boundaries(self):
+        """Test every chunk size, down to one character, gives the same products"""
+        for content in (json.dumps(PRODUCTS), json.dumps(PRODUCTS, indent=4)):
+            for chunk_size in (1, 2, 3, 7, 64, 1024 * 1024):
+                with self.subTest(chunk_size=chunk_size, indented='\n' in content):
+                    self.assertEqual(self.parse(content, chunk_size), self.expected())
+
+    def test_whitespace_longer_than_chunk(self):
+        """Test runs of whitespace spanning several chunks are skipped"""
+        content = '  \n\t ' * 20 + '[' + ' ' * 50 + json.dumps(PRODUCTS[0]) + '\n' * 30 + ',' + ' ' * 40 \
+                  + json.dumps(PRODUCTS[2]) + ' ' * 25 + ']' + '\n' * 30
+        self.assertEqual(self.parse(content, chunk_size=4), [self.expected()[0], self.expected()[2]])
+
+    def test_empty_array(self):
+        """Test an empty array gives no products"""
+        self.assertEqual(self.parse('[]', chunk_size=1), [])
+        self.assertEqual(self.parse(' [ \n ] \n', chunk_size=1), [])
+
+    def test_non_objects_are_skipped(self):
+        """Test array items that are not products are skipped"""
+        self.assertEqual(self.parse('[1, {"id": 5}, "x", null]', chunk_size=2), [{'id': 5}])
+
+    def test_malformed(self):
+        """Test malformed input is refused, whatever the chunk size"""
+        cases = {
+            'missing comma': '[{"id": 1} {"id": 2}]',
+            'leading comma': '[, {"id": 1}]',
+            'double comma': '[{"id": 1},, {"id": 2}]',
+            'trailing comma': '[{"id": 1},]',
+            'trailing data': '[{"id": 1}] {"id": 2}',
+            'not an array': '{"id": 1}',
+            'truncated array': '[{"id": 1}, ',
+            'truncated product': '[{"id": 1}, {"id": ',
+            'empty file': '',
+        }
+        for name, content in cases.items():
+            for chunk_size in (1, 3, 1024):
+                with self.subTest(name, chunk_size=chunk_size):
+                    with self.assertRaises(ValueError):
+                        self.parse(content, chunk_size)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,168 @@
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from quantization import create_quantizer, evaluate, load_quantizer, normalize_rows, save_quantizer
+from quantized_index import QuantizedIndex
+from vector_store import VectorStore
+
+
+DIMENSION = 64
+
+
+def clustered_vectors(n, seed=0):
+    """Embedding-like data: points around a few dozen centres"""
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(50, DIMENSION))
+    return (centres[rng.integers(0, 50, n)] + 0.5 * rng.normal(size=(n, DIMENSION))).astype(np.float32)
+
+
+class QuantizerTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.vectors = normalize_rows(clustered_vectors(2000))
+
+    def test_adc_matches_decoded_inner_products(self):
+        """Test ADC scores equal the inner products with the decoded vectors"""
+        query = self.vectors[0]
+        for kind in ['sq8', 'pq']:
+            with self.subTest(kind=kind):
+                quantizer = create_quantizer(kind, DIMENSION, pq_subspaces=16)
+                quantizer.train(self.vectors, seed=0)
+                codes = quantizer.encode(self.vectors)
+                self.assertEqual(codes.shape, (len(self.vectors), quantizer.code_size))
+                self.assertEqual(codes.dtype, np.uint8)
+                np.testing.assert_allclose(quantizer.scores(query, codes), quantizer.decode(codes) @ query, atol=1e-4)
+
+    def test_save_and_load(self):
+        """Test a saved quantizer encodes like the original"""
+        path = tempfile.mkdtemp()
+        try:
+            for kind in ['sq8', 'pq']:
+                with self.subTest(kind=kind):
+                    quantizer = create_quantizer(kind, DIMENSION, pq_subspaces=16)
+                    quantizer.train(self.vectors, seed=0)
+                    save_quantizer(quantizer, f'{path}/{kind}.npz')
+                    loaded = load_quantizer(f'{path}/{kind}.npz')
+                    self.assertEqual(loaded.code_size, quantizer.code_size)
+                    np.testing.assert_array_equal(loaded.encode(self.vectors[:50]), quantizer.encode(self.vectors[:50]))
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def test_recall(self):
+        """Test recall@10 of ADC alone and after exact rescoring"""
+        reports = {report['kind']: report for report in evaluate(
+            clustered_vectors(4000), ['sq8', 'pq'], k=10, queries=100, train_size=2000, pq_subspaces=16, seed=0)}
+
+        self.assertEqual(reports['sq8']['compression'], 4)
+        self.assertGreaterEqual(reports['sq8']['recall@10_adc'], 0.9)
+        self.assertGreaterEqual(reports['sq8']['recall@10_rescored'], 0.98)
+        self.assertEqual(reports['pq']['compression'], 16)
+        self.assertGreaterEqual(reports['pq']['recall@10_rescored'], 0.85)
+        self.assertGreater(reports['pq']['recall@10_rescored'], reports['pq']['recall@10_adc'])
+
+
+class QuantizedIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.vectors = clustered_vectors(1500, seed=1)
+        self.normalized = normalize_rows(self.vectors)
+        self.stores = []
+
+    def tearDown(self):
+        for store in self.stores:
+            store.close()
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def open_index(self, **kwargs):
+        store = VectorStore(self.path, DIMENSION)
+        self.stores.append(store)
+        return QuantizedIndex('test', DIMENSION, store=store, kind='sq8', train_size=1000, seed=0, **kwargs)
+
+    def elements(self, start, end):
+        return [{'id': f'p{i}', 'embedding': self.vectors[i], 'metadata': {'region': 'EU' if i % 2 else 'US'}}
+                for i in range(start, end)]
+
+    def recall(self, index, rows, filters=None):
+        hits = 0
+        for query in self.normalized[:30]:
+            truth = {f'p{i}' for i in rows[np.argsort(-(self.normalized[rows] @ query))[:10]]}
+            hits += len(truth & set(index.query(query, 10, filters)))
+        return hits / 300
+
+    def test_exact_until_trained(self):
+        """Test rows are searched exactly in full precision before the quantizer is trained"""
+        index = self.open_index()
+        index.upsert_embeddings(self.elements(0, 500))
+        self.assertIsNone(index.quantizer)
+        self.assertEqual(self.recall(index, np.arange(500)), 1.0)
+
+    def test_rescored_recall(self):
+        """Test the quantized index keeps its recall with rescoring, also filtered and after a reload"""
+        index = self.open_index()
+        index.upsert_embeddings(self.elements(0, 1500))
+        self.assertIsNotNone(index.quantizer)
+        self.assertIsNone(index._raw)
+        self.assertGreaterEqual(self.recall(index, np.arange(1500)), 0.95)
+
+        eu_rows = np.arange(1, 1500, 2)
+        for record_id in index.query(self.normalized[0], 10, {'region': 'EU'}):
+            self.assertEqual(int(record_id[1:]) % 2, 1)
+        self.assertGreaterEqual(self.recall(index, eu_rows, {'region': 'EU'}), 0.95)
+
+        scores = [score for _, score in index.query_with_scores(self.normalized[3], 5)]
+        self.assertAlmostEqual(scores[0], 1.0, places=5)
+
+        self.stores.pop().close()
+        reloaded = self.open_index()
+        self.assertEqual(len(reloaded), 1500)
+        self.assertIsNotNone(reloaded.quantizer)
+        self.assertGreaterEqual(self.recall(reloaded, np.arange(1500)), 0.95)
+
+    def test_upserts_during_training(self):
+        """Test searches and upserts run while the quantizer trains, and rows written meanwhile are encoded"""
+        index = self.open_index()
+        index.upsert_embeddings(self.elements(0, 999))
+        real_create = create_quantizer
+        results = {}
+
+        def create(*args):
+            quantizer = real_create(*args)
+            train = quantizer.train
+
+            def train_while_writing(vectors, seed=None):
+                # In another thread: it would block if the lock were held during training
+                def write():
+                    results['search'] = index.query(self.normalized[5], 1)
+                    index.upsert_embeddings(self.elements(1000, 1500))
+                    index.upsert_embeddings([{'id': 'p0', 'embedding': self.vectors[7], 'metadata': {}}])
+                thread = threading.Thread(target=write)
+                thread.start()
+                thread.join(timeout=10)
+                self.assertFalse(thread.is_alive())
+                train(vectors, seed=seed)
+            quantizer.train = train_while_writing
+            return quantizer
+
+        with mock.patch('quantized_index.create_quantizer', create):
+            index.upsert_embeddings(self.elements(999, 1000))
+
+        self.assertEqual(results['search'], ['p5'])
+        self.assertIsNotNone(index.quantizer)
+        self.assertEqual(len(index), 1500)
+        np.testing.assert_array_equal(index._codes[:1500], index.quantizer.encode(
+            np.vstack([self.normalized[7], self.normalized[1:1500]])))
+        self.assertGreaterEqual(self.recall(index, np.arange(1, 1500)), 0.95)
+
+    def test_requires_store(self):
+        """Test the index refuses to run without a vector store"""
+        with self.assertRaises(ValueError):
+            QuantizedIndex('test', DIMENSION)
+
+
+if __name__ == '__main__':
+    unittest.main()
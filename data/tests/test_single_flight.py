@@ -0,0 +1,69 @@
+import asyncio
+import unittest
+
+from single_flight import SingleFlight
+
+
+class SingleFlightTest(unittest.IsolatedAsyncioTestCase):
+    async def test_concurrent_calls_are_coalesced(self):
+        """Test concurrent calls with the same key share one execution"""
+        flight = SingleFlight()
+        runs = []
+
+        async def compute(value):
+            runs.append(value)
+            await asyncio.sleep(0.01)
+            return value
+
+        results = await asyncio.gather(*(flight.do('a', lambda: compute('a')) for _ in range(5)),
+                                       flight.do('b', lambda: compute('b')))
+        self.assertEqual(results, ['a'] * 5 + ['b'])
+        self.assertEqual(sorted(runs), ['a', 'b'])
+        self.assertEqual(flight.stats(), {'calls': 6, 'executions': 2, 'coalesced': 4, 'in_flight': 0})
+
+    async def test_nothing_is_cached(self):
+        """Test a call after the previous one finished runs again"""
+        flight = SingleFlight()
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            return len(calls)
+
+        self.assertEqual(await flight.do('a', compute), 1)
+        self.assertEqual(await flight.do('a', compute), 2)
+
+    async def test_exception_is_shared(self):
+        """Test every waiting caller gets the exception of the shared execution"""
+        flight = SingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise RuntimeError('boom')
+
+        results = await asyncio.gather(flight.do('a', fail), flight.do('a', fail), return_exceptions=True)
+        self.assertTrue(all(isinstance(result, RuntimeError) for result in results))
+        self.assertEqual(flight.stats()['executions'], 1)
+
+    async def test_cancelled_caller_does_not_cancel_others(self):
+        """Test a caller going away leaves the execution running for the others"""
+        flight = SingleFlight()
+        release = asyncio.Event()
+
+        async def compute():
+            await release.wait()
+            return 'done'
+
+        first = asyncio.ensure_future(flight.do('a', compute))
+        second = asyncio.ensure_future(flight.do('a', compute))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+
+        self.assertEqual(await second, 'done')
+        self.assertTrue(first.cancelled())
+
+
+if __name__ == '__main__':
+    unittest.main()
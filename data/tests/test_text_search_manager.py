@@ -0,0 +1,29 @@
+import unittest
+
+from text_search_manager import TextSearchManager
+
+
+class IndexFilterStringTest(unittest.TestCase):
+    def test_filters(self):
+        """Test vector index filters translate into the equivalent Meilisearch filter"""
+        filters = {
+            'category': ['Shoes', 'Bags'],
+            'price': {'currency': 'EUR', 'min': 10, 'max': 50},
+            'region': 'EU',
+            'discount': 30,
+        }
+        self.assertEqual(TextSearchManager._index_filter_string(filters),
+                         "(category_name = 'Shoes' OR category_name = 'Bags') AND currency = 'EUR' "
+                         "AND current_price >= 10.0 AND current_price <= 50.0 AND region = 'EU' "
+                         "AND off_percent <= 30.0")
+        self.assertIsNone(TextSearchManager._index_filter_string({}))
+
+    def test_quotes_are_escaped(self):
+        """Test a quote in a value stays inside its string literal"""
+        filters = {'shop': ["Levi's"], 'status': "x' OR status = 'y"}
+        self.assertEqual(TextSearchManager._index_filter_string(filters),
+                         "(shop_name = 'Levi\\'s') AND status = 'x\\' OR status = \\'y'")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import math
+import unittest
+
+from utils import aggregate_product_scores, fuse_rankings
+
+
+class FuseRankingsTest(unittest.TestCase):
+    def test_reciprocal_rank_scores(self):
+        """Test each list adds weight / (k + rank) to the ids it ranks"""
+        fused = dict(fuse_rankings([['a', 'b'], ['b', 'c']], k=60))
+        self.assertAlmostEqual(fused['a'], 1 / 61)
+        self.assertAlmostEqual(fused['b'], 1 / 62 + 1 / 61)
+        self.assertAlmostEqual(fused['c'], 1 / 62)
+
+    def test_ids_in_both_lists_win(self):
+        """Test an id ranked by both lists beats ids ranked higher by only one of them"""
+        fused = fuse_rankings([['a', 'b', 'c'], ['d', 'e', 'b']])
+        self.assertEqual(fused[0][0], 'b')
+
+    def test_weights(self):
+        """Test a heavier list decides between ids each list ranks first"""
+        self.assertEqual(fuse_rankings([['a'], ['b']], weights=[1.0, 2.0])[0][0], 'b')
+        self.assertEqual(fuse_rankings([['a'], ['b']], weights=[2.0, 1.0])[0][0], 'a')
+
+    def test_missing_list(self):
+        """Test a failed leg (None or empty) contributes nothing"""
+        self.assertEqual([pid for pid, _ in fuse_rankings([None, ['b', 'a']])], ['b', 'a'])
+        self.assertEqual(fuse_rankings([None, []]), [])
+
+    def test_ties_keep_first_seen_order(self):
+        """Test ids with equal scores keep the order they were first seen in"""
+        fused = fuse_rankings([['a', 'x'], ['b', 'y']])
+        self.assertEqual([pid for pid, _ in fused], ['a', 'b', 'x', 'y'])
+
+    def test_duplicates_within_a_list(self):
+        """Test an id repeated within a list is ranked once, at its average position"""
+        fused = fuse_rankings([['a', 'b', 'a', 'c', 'a']], k=0)
+        self.assertEqual([pid for pid, _ in fused], ['b', 'a', 'c'])
+        self.assertAlmostEqual(fused[1][1], 1 / 2)
+
+
+
+class AggregateProductScoresTest(unittest.TestCase):
+    image_ids = ['p1#a', 'p2#a', 'p1#b', 'p3#a']
+    scores = [0.9, 0.8, 0.7, 0.85]
+
+    def test_max(self):
+        """Test a product scores as its best image"""
+        self.assertEqual(aggregate_product_scores(self.image_ids, self.scores),
+                         [('p1', 0.9), ('p3', 0.85), ('p2', 0.8)])
+
+    def test_mean(self):
+        """Test a product scores as the mean of its matched images"""
+        products = aggregate_product_scores(self.image_ids, self.scores, method='mean')
+        self.assertEqual([pid for pid, _ in products], ['p3', 'p1', 'p2'])
+        self.assertAlmostEqual(dict(products)['p1'], 0.8)
+
+    def test_softmax(self):
+        """Test the softmax is a smooth maximum that rewards several good images"""
+        products = dict(aggregate_product_scores(['p1#a', 'p1#b', 'p2#a'], [0.8, 0.8, 0.81],
+                                                 method='softmax', temperature=0.05))
+        self.assertAlmostEqual(products['p1'], 0.8 + 0.05 * math.log(2))
+        self.assertAlmostEqual(products['p2'], 0.81)
+        self.assertGreater(products['p1'], products['p2'])
+
+    def test_ties_keep_rank_order(self):
+        """Test products with equal scores keep the order of their best-ranked image"""
+        products = aggregate_product_scores(['p9#a', 'p1#a', 'p5#a'], [0.5, 0.5, 0.5])
+        self.assertEqual([pid for pid, _ in products], ['p9', 'p1', 'p5'])
+
+    def test_empty_and_unknown_method(self):
+        """Test no matches give no products and an unknown method is refused"""
+        self.assertEqual(aggregate_product_scores([], []), [])
+        with self.assertRaises(ValueError):
+            aggregate_product_scores(self.image_ids, self.scores, method='median')
+
+
+if __name__ == '__main__':
+    unittest.main()
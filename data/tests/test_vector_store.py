@@ -0,0 +1,196 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from vector_store import RECORDS_FILE, TOMBSTONES_FILE, VECTORS_FILE, StoreLockedError, VectorStore
+
+
+DIMENSION = 8
+
+
+def make_elements(start, end, tag=''):
+    return [{
+        'id': f'p{i}',
+        'embedding': np.full(DIMENSION, i, dtype=np.float32),
+        'metadata': {'k': i, 'tag': tag},
+    } for i in range(start, end)]
+
+
+class VectorStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.stores = []
+
+    def tearDown(self):
+        for store in self.stores:
+            store.close()
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def open(self, **kwargs):
+        store = VectorStore(self.path, DIMENSION, **kwargs)
+        self.stores.append(store)
+        return store
+
+    def reopen(self, store, **kwargs):
+        store.close()
+        return self.open(**kwargs)
+
+    def test_upsert_get_and_supersede(self):
+        """Test upserted records are returned and a later upsert of an id wins"""
+        store = self.open()
+        store.upsert(make_elements(0, 10))
+        store.upsert(make_elements(3, 5, tag='new'))
+        self.assertEqual(len(store), 10)
+
+        records = store.get(['p3', 'p7', 'missing'])
+        self.assertEqual(records.keys(), {'p3', 'p7'})
+        self.assertEqual(records['p3']['metadata'], {'k': 3, 'tag': 'new'})
+        np.testing.assert_array_equal(records['p7']['values'], np.full(DIMENSION, 7))
+
+        vectors = store.get_vectors(['p3', 'missing'])
+        self.assertEqual(vectors.keys(), {'p3'})
+        np.testing.assert_array_equal(vectors['p3'], np.full(DIMENSION, 3))
+
+    def test_reload(self):
+        """Test records, supersessions and deletions survive a reopen across several segments"""
+        store = self.open(max_tail_rows=4)
+        store.upsert(make_elements(0, 10))
+        store.upsert(make_elements(0, 2, tag='new'))
+        store.delete(['p5'])
+
+        store = self.reopen(store, max_tail_rows=4)
+        self.assertGreater(len(store._segments), 1)
+        self.assertEqual(len(store), 9)
+        self.assertNotIn('p5', store)
+        self.assertEqual(store.get(['p1'])['p1']['metadata']['tag'], 'new')
+        self.assertEqual(dict(store.records())['p9'], {'k': 9, 'tag': ''})
+
+    def test_torn_tail(self):
+        """Test a torn write at the end of the tail segment is dropped and later appends stay aligned"""
+        store = self.open()
+        store.upsert(make_elements(0, 5))
+        tail = store._segments[-1]
+        store.close()
+
+        records_path = os.path.join(tail.path, RECORDS_FILE)
+        vectors_path = os.path.join(tail.path, VECTORS_FILE)
+        with open(records_path, 'ab') as f:
+            f.write(b'{"id": "torn", "meta')
+        # The last record lost its vector row
+        with open(vectors_path, 'r+b') as f:
+            f.truncate(os.path.getsize(vectors_path) - DIMENSION * 4)
+
+        store = self.open()
+        self.assertEqual(len(store), 4)
+        self.assertNotIn('p4', store)
+        self.assertEqual(os.path.getsize(records_path), store._segments[-1]._offsets[-1])
+        self.assertEqual(os.path.getsize(vectors_path), 4 * DIMENSION * 4)
+
+        store.upsert(make_elements(10, 12))
+        store = self.reopen(store)
+        self.assertEqual(len(store), 6)
+        self.assertEqual(store.get(['p11'])['p11']['metadata']['k'], 11)
+        np.testing.assert_array_equal(store.get(['p11'])['p11']['values'], np.full(DIMENSION, 11))
+
+    def test_stale_tombstones_are_dropped(self):
+        """Test tombstones of rows lost to a torn write do not delete the rows appended in their place"""
+        store = self.open()
+        store.upsert(make_elements(0, 3))
+        store.delete(['p2'])
+        tail = store._segments[-1]
+        store.close()
+
+        vectors_path = os.path.join(tail.path, VECTORS_FILE)
+        with open(vectors_path, 'r+b') as f:
+            f.truncate(2 * DIMENSION * 4)
+
+        store = self.open()
+        store.upsert(make_elements(5, 6))
+        store = self.reopen(store)
+        self.assertIn('p5', store)
+        with open(os.path.join(tail.path, TOMBSTONES_FILE)) as f:
+            self.assertEqual(f.read(), '')
+
+    def test_compact(self):
+        """Test compaction merges the sealed segments and keeps only the live rows"""
+        store = self.open(max_tail_rows=5)
+        store.upsert(make_elements(0, 20))
+        store.upsert(make_elements(0, 5, tag='new'))
+        store.delete(['p10'])
+        store.compact()
+
+        self.assertEqual(len(store._segments), 2)
+        self.assertEqual(len(store._segments[0]), 19)
+        self.assertEqual(len(store), 19)
+        self.assertEqual(store.get(['p2'])['p2']['metadata']['tag'], 'new')
+
+        store = self.reopen(store, max_tail_rows=5)
+        self.assertEqual(len(store), 19)
+        self.assertEqual(sorted(os.listdir(self.path)), sorted(['manifest.json', 'readers.lock', 'writer.lock'] + [s.name for s in store._segments]))
+
+    def test_single_writer(self):
+        """Test a second writer of the same directory is refused until the first is closed"""
+        store = self.open()
+        with self.assertRaises(StoreLockedError):
+            VectorStore(self.path, DIMENSION)
+        store.close()
+        self.open()
+
+    def test_readers_next_to_writer(self):
+        """Test read-only opens coexist with the writer, see what was stored and refuse writes"""
+        store = self.open()
+        store.upsert(make_elements(0, 5))
+        first = self.open(read_only=True)
+        second = self.open(read_only=True)
+        store.upsert(make_elements(5, 6))
+
+        self.assertEqual(len(first), 5)
+        self.assertEqual(second.get(['p3'])['p3']['metadata']['k'], 3)
+        with self.assertRaises(PermissionError):
+            first.upsert(make_elements(7, 8))
+        with self.assertRaises(PermissionError):
+            first.compact()
+
+    def test_reader_leaves_torn_tail(self):
+        """Test a read-only open ignores a torn tail without truncating it"""
+        store = self.open()
+        store.upsert(make_elements(0, 3))
+        records_path = os.path.join(store._segments[-1].path, RECORDS_FILE)
+        with open(records_path, 'ab') as f:
+            f.write(b'{"id": "torn"')
+        size = os.path.getsize(records_path)
+
+        reader = self.open(read_only=True)
+        self.assertEqual(len(reader), 3)
+        self.assertEqual(os.path.getsize(records_path), size)
+
+    def test_compaction_waits_for_readers(self):
+        """Test compacted segments are kept while a reader is open and deleted once it closes"""
+        store = self.open(max_tail_rows=5)
+        for start in range(0, 20, 5):
+            store.upsert(make_elements(start, start + 5))
+        reader = self.open(read_only=True)
+        sealed = [segment.path for segment in store._segments[:-1]]
+        store.compact()
+
+        self.assertTrue(all(os.path.exists(path) for path in sealed))
+        np.testing.assert_array_equal(reader.get(['p2'])['p2']['values'], np.full(DIMENSION, 2))
+
+        reader.close()
+        store.compact()
+        self.assertFalse(any(os.path.exists(path) for path in sealed))
+
+    def test_dimension_mismatch(self):
+        """Test opening a store with another dimension is refused"""
+        store = self.open()
+        store.upsert(make_elements(0, 1))
+        store.close()
+        with self.assertRaises(ValueError):
+            VectorStore(self.path, DIMENSION * 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
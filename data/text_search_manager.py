@@ -1,4 +1,5 @@
 from meilisearch import Client
+from meilisearch.errors import MeilisearchApiError
 from typing import List, Dict, Optional, Any
 import os
 from dotenv import load_dotenv
@@ -6,6 +7,20 @@ from product import Product
 
 load_dotenv()
 
+
+def _quote(value: Any) -> str:
+    """A Meilisearch filter string literal; quotes in the value are escaped, the only escape the filter syntax has"""
+    return "'" + str(value).replace("'", "\\'") + "'"
+
+
+def _equals(attribute: str, value: Any) -> str:
+    return f"{attribute} = {_quote(value)}"
+
+
+def _any_of(attribute: str, values: List[Any]) -> str:
+    return '(' + ' OR '.join(_equals(attribute, value) for value in values) + ')'
+
+
 class TextSearchManager:
     def __init__(self):
         # Initialize MeiliSearch client with cloud credentials
@@ -14,6 +29,7 @@ class TextSearchManager:
             os.environ.get('MEILISEARCH_API_KEY')
         )
         self.index = self.client.index('products')
+        self.task_timeout_ms = int(os.environ.get('MEILISEARCH_TASK_TIMEOUT_MS', '60000'))
         
         # Set up filterable attributes
         self.index.update_filterable_attributes([
@@ -27,29 +43,136 @@ class TextSearchManager:
             'off_percent'
         ])
 
-    def index_products(self, products) -> None:
-        """Index a single product if not already indexed."""
-        # Prepare document for indexing
-        documents = []
-        for product in products:
-            documents.append({
-                'id': product.id,
-                'name': product.meta_data.get('name', ''),
-                'description': product.meta_data.get('description', ''),
-                'category_name': product.meta_data.get('category_name', ''),
-                'currency': product.meta_data.get('currency'),
-                'current_price': float(product.meta_data.get('current_price', 0)),
-                'update_date': product.meta_data.get('update_date'),
-                'shop_name': product.meta_data.get('shop_name', ''),
-                'status': product.meta_data.get('status'),
-                'region': product.meta_data.get('region'),
-                'off_percent': float(product.meta_data.get('off_percent', 0))
-            })
-        
-        # Add document to index
-        self.index.add_documents(documents)
-
-    def search_products(self, keyword: str, filters: Dict[str, Any]) -> Dict[str, Any]:
+    def _to_document(self, product) -> Dict[str, Any]:
+        return {
+            'id': product.id,
+            'name': product.meta_data.get('name', ''),
+            'description': product.meta_data.get('description', ''),
+            'category_name': product.meta_data.get('category_name', ''),
+            'currency': product.meta_data.get('currency'),
+            'current_price': float(product.meta_data.get('current_price', 0)),
+            'update_date': product.meta_data.get('update_date'),
+            'shop_name': product.meta_data.get('shop_name', ''),
+            'status': product.meta_data.get('status'),
+            'region': product.meta_data.get('region'),
+            'off_percent': float(product.meta_data.get('off_percent', 0))
+        }
+
+    def index_products(self, products, wait: bool = False) -> None:
+        """Index a batch of products (adding or replacing them)."""
+        documents = [self._to_document(product) for product in products]
+        if not documents:
+            return
+        
+        # Add documents to index
+        task = self.index.add_documents(documents)
+        if wait:
+            self._wait_for_task(task.task_uid)
+
+    def index_product(self, product) -> None:
+        """Index a single product."""
+        self.index_products([product])
+
+    def delete_products(self, product_ids: List[str], wait: bool = False) -> None:
+        if not product_ids:
+            return
+        
+        task = self.index.delete_documents(product_ids)
+        if wait:
+            self._wait_for_task(task.task_uid)
+
+    def _wait_for_task(self, task_uid: int) -> None:
+        """Wait until Meilisearch has processed the task; raise unless it succeeded"""
+        task = self.client.wait_for_task(task_uid, timeout_in_ms=self.task_timeout_ms)
+        if task.status != 'succeeded':
+            raise Exception(f"Meilisearch task {task_uid} {task.status}: {task.error}")
+
+    def document_count(self) -> int:
+        """Number of documents in the index (0 if it does not exist)"""
+        try:
+            return self.index.get_stats().number_of_documents
+        except MeilisearchApiError as e:
+            if e.code == 'index_not_found':
+                return 0
+            raise
+
+    def sync_products(self, product_manager, chunk_size: int = 1000) -> Dict[str, int]:
+        """
+        Push only the products added, changed or deleted since the last sync, in chunks streamed
+        from Postgres. A chunk is marked as synced only once Meilisearch has applied it; a failed
+        task raises, leaving that chunk and the following ones for the next sync.
+        
+        If the index holds fewer documents than were recorded as synced (it was emptied, deleted
+        or recreated), the records are dropped and every product is pushed again.
+        """
+        pushed = 0
+        deleted = 0
+        
+        synced = product_manager.count_search_synced()
+        if synced and self.document_count() < synced:
+            print(f"Text search index holds fewer documents than the {synced} synced products, pushing all products")
+            product_manager.clear_search_synced()
+        
+        for rows in product_manager.iter_search_sync_changes(chunk_size):
+            self.index_products([Product(meta_data) for meta_data, _ in rows], wait=True)
+            product_manager.mark_search_synced([(str(meta_data['id']), content_hash) for meta_data, content_hash in rows])
+            pushed += len(rows)
+        
+        for product_ids in product_manager.iter_search_sync_deletions(chunk_size):
+            self.delete_products(product_ids, wait=True)
+            product_manager.unmark_search_synced(product_ids)
+            deleted += len(product_ids)
+        
+        return {'pushed': pushed, 'deleted': deleted}
+
+    @staticmethod
+    def _index_filter_string(filters: Optional[Dict[str, Any]]) -> Optional[str]:
+        """Translate filters in the vector index format (as sent to /semantic_search) into a Meilisearch filter"""
+        if not filters:
+            return None
+        
+        conditions = []
+        if filters.get('category'):
+            conditions.append(_any_of('category_name', filters['category']))
+        
+        if filters.get('price'):
+            conditions.append(_equals('currency', filters['price']['currency']))
+            if filters['price'].get('min') is not None:
+                conditions.append(f"current_price >= {float(filters['price']['min'])}")
+            if filters['price'].get('max') is not None:
+                conditions.append(f"current_price <= {float(filters['price']['max'])}")
+        
+        if filters.get('update_date'):
+            conditions.append(_equals('update_date', filters['update_date']))
+        
+        if filters.get('shop'):
+            conditions.append(_any_of('shop_name', filters['shop']))
+        
+        if filters.get('status'):
+            conditions.append(_equals('status', filters['status']))
+        
+        if filters.get('region'):
+            conditions.append(_equals('region', filters['region']))
+        
+        if filters.get('discount') is not None:
+            conditions.append(f"off_percent <= {float(filters['discount'])}")
+        
+        return ' AND '.join(conditions) if conditions else None
+
+    def search_ids(self, keyword: str, filters: Optional[Dict[str, Any]] = None, limit: int = 30) -> List[str]:
+        """Ids of the best keyword matches, best first. Takes filters in the vector index format."""
+        search_results = self.index.search(
+            keyword,
+            {
+                'filter': self._index_filter_string(filters),
+                'attributesToRetrieve': ['id'],
+                'limit': limit
+            }
+        )
+        return [str(hit['id']) for hit in search_results['hits']]
+
+    def search_products(self, keyword: str, filters: Dict[str, Any],
+                        offset: Optional[int] = None, limit: Optional[int] = None) -> Dict[str, Any]:
         """Search products with keyword and filters."""
         # Build filter string
         filter_conditions = []
@@ -57,17 +180,15 @@ class TextSearchManager:
         if filters.get('category_name'):
             categories = filters['category_name']
             if isinstance(categories, list) and categories[0]:  # Check if list is not empty
-                category_conditions = [f"category_name = '{cat}'" for cat in categories]
-                filter_conditions.append(f"({' OR '.join(category_conditions)})")
+                filter_conditions.append(_any_of('category_name', categories))
         
         if filters.get('shop_name'):
             shops = filters['shop_name']
             if isinstance(shops, list) and shops[0]:  # Check if list is not empty
-                shop_conditions = [f"shop_name = '{shop}'" for shop in shops]
-                filter_conditions.append(f"({' OR '.join(shop_conditions)})")
+                filter_conditions.append(_any_of('shop_name', shops))
 
         if filters.get('currency'):
-            filter_conditions.append(f"currency = '{filters['currency']}'")
+            filter_conditions.append(_equals('currency', filters['currency']))
             
         if filters.get('min_current_price'):
             filter_conditions.append(
@@ -80,13 +201,13 @@ class TextSearchManager:
             )
             
         if filters.get('update_date'):
-            filter_conditions.append(f"update_date = '{filters['update_date']}'")
+            filter_conditions.append(_equals('update_date', filters['update_date']))
             
         if filters.get('status'):
-            filter_conditions.append(f"status = '{filters['status']}'")
+            filter_conditions.append(_equals('status', filters['status']))
             
         if filters.get('region'):
-            filter_conditions.append(f"region = '{filters['region']}'")
+            filter_conditions.append(_equals('region', filters['region']))
             
         if filters.get('off_percent'):
             filter_conditions.append(
@@ -101,7 +222,10 @@ class TextSearchManager:
             keyword,
             {
                 'filter': filter_string,
-                'attributesToRetrieve': ['*']
+                'attributesToRetrieve': ['*'],
+                # Meilisearch defaults (offset 0, limit 20) unless a page is requested
+                **({'offset': offset} if offset is not None else {}),
+                **({'limit': limit} if limit is not None else {})
             }
         )
         
@@ -4,6 +4,7 @@ from dotenv import load_dotenv
 import os
 import matplotlib.pyplot as plt # type: ignore
 from collections import defaultdict
+import numpy as np
 import requests # type: ignore
 from io import BytesIO
 from PIL import Image
@@ -17,6 +18,57 @@ def rank_products(product_ids):
         
     return sorted(all_ids, key=lambda x: sum(rank_sum[x]) / len(rank_sum[x]))
 
+def aggregate_product_scores(image_ids, scores, method='max', temperature=0.05):
+    """
+    Aggregate image-level similarities into one score per product (image ids are "<product id>#<url>").
+
+    method is 'max' (best image), 'mean' (all matched images) or 'softmax', a smooth maximum
+    (temperature * log-sum-exp) that rewards products with several good images. Returns
+    (product id, score) pairs, best first.
+    """
+    if not len(image_ids):
+        return []
+    
+    product_ids, inverse = np.unique([image_id.split('#')[0] for image_id in image_ids], return_inverse=True)
+    scores = np.asarray(scores, dtype=np.float64)
+    
+    if method == 'mean':
+        aggregated = np.bincount(inverse, weights=scores) / np.bincount(inverse)
+    elif method == 'softmax':
+        # Shifted by the global max for numerical stability
+        shift = scores.max()
+        aggregated = temperature * np.log(np.bincount(inverse, weights=np.exp((scores - shift) / temperature))) + shift
+    elif method == 'max':
+        aggregated = np.full(len(product_ids), -np.inf)
+        np.maximum.at(aggregated, inverse, scores)
+    else:
+        raise ValueError(f"Unknown aggregation method: {method}")
+    
+    # Stable sort keeps ties in order of the products' best-ranked image
+    first_seen = np.full(len(product_ids), len(inverse))
+    np.minimum.at(first_seen, inverse, np.arange(len(inverse)))
+    order = np.lexsort((first_seen, -aggregated))
+    return [(str(product_ids[i]), float(aggregated[i])) for i in order]
+
+def fuse_rankings(rankings, weights=None, k=60):
+    """
+    Weighted reciprocal-rank fusion of several ranked id lists (best first).
+
+    Each list adds weight / (k + rank) to the score of its ids; ids missing from a list
+    get nothing from it. Returns (id, score) pairs, best first.
+    """
+    weights = weights or [1.0] * len(rankings)
+    scores = defaultdict(float)
+    first_seen = {}
+    
+    for ranking, weight in zip(rankings, weights):
+        for rank, pid in enumerate(rank_products(ranking) if ranking else []):
+            scores[pid] += weight / (k + rank + 1)
+            first_seen.setdefault(pid, len(first_seen))
+    
+    # Ties keep the order in which the ids were first seen
+    return sorted(scores.items(), key=lambda item: (-item[1], first_seen[item[0]]))
+
 def show_image(image):
     image = image.squeeze(0)
     image = image.permute(1, 2, 0)
@@ -45,8 +97,8 @@ def init_pinecone(index_name, dimension):
     return pc
 
     
-def fetch_image(image_url, verbose=False):
-    response = requests.get(image_url)
+def fetch_image(image_url, verbose=False, timeout=10):
+    response = requests.get(image_url, timeout=timeout)
         
     if response.status_code == 200:
         return Image.open(BytesIO(response.content))
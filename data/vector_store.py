@@ -0,0 +1,454 @@
+import fcntl
+import json
+import os
+import shutil
+import sys
+import threading
+from array import array
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+MANIFEST_FILE = 'manifest.json'
+VECTORS_FILE = 'vectors.bin'
+RECORDS_FILE = 'records.jsonl'
+TOMBSTONES_FILE = 'tombstones.jsonl'
+LOCK_FILE = 'writer.lock'
+# Held shared by read-only processes; the writer only deletes segments when it can take it exclusively
+READERS_LOCK_FILE = 'readers.lock'
+COPY_CHUNK_ROWS = 10000
+
+
+class Segment:
+    """
+    One directory of the vector store:
+        vectors.bin      raw row-major vector block, read through numpy.memmap
+        records.jsonl    id table, one {"id", "metadata"} line per row
+        tombstones.jsonl indices of rows that were deleted or superseded
+    
+    Only the ids and the byte offsets of the record lines are kept in memory; metadata is
+    read from records.jsonl when asked for. A read-only segment never changes its files, it
+    ignores a torn tail instead of cutting it off.
+    """
+    
+    def __init__(self, path, dimension, dtype, read_only=False):
+        self.path = path
+        self.read_only = read_only
+        self.name = os.path.basename(path)
+        self.dimension = dimension
+        self.dtype = np.dtype(dtype)
+        self.ids: List[str] = []
+        # Start of each row's line in records.jsonl, followed by the end of the last one
+        self._offsets = array('q', [0])
+        self.tombstones = set()
+        self._vectors = None
+        self._reader = None
+        
+        if not read_only:
+            os.makedirs(path, exist_ok=True)
+        self._load()
+    
+    def __len__(self):
+        return len(self.ids)
+    
+    @property
+    def row_bytes(self):
+        return self.dimension * self.dtype.itemsize
+    
+    @property
+    def vectors(self):
+        if self._vectors is None and self.ids:
+            self._vectors = np.memmap(os.path.join(self.path, VECTORS_FILE), dtype=self.dtype,
+                                      mode='r', shape=(len(self.ids), self.dimension))
+        return self._vectors
+    
+    def live_rows(self):
+        return [row for row in range(len(self.ids)) if row not in self.tombstones]
+    
+    def read_metadata(self, rows):
+        """Metadata of the given rows, read from records.jsonl"""
+        if self._reader is None:
+            self._reader = open(os.path.join(self.path, RECORDS_FILE), 'rb')
+        fd = self._reader.fileno()
+        offsets = self._offsets
+        return [json.loads(os.pread(fd, offsets[row + 1] - offsets[row], offsets[row])).get('metadata') or {}
+                for row in rows]
+    
+    def memory_bytes(self):
+        """Estimated bytes held in memory for this segment (id strings included)"""
+        return (sys.getsizeof(self.ids) + sum(sys.getsizeof(record_id) for record_id in self.ids)
+                + len(self._offsets) * self._offsets.itemsize + sys.getsizeof(self.tombstones))
+    
+    def append(self, ids, vectors, metadata):
+        vectors = np.ascontiguousarray(vectors, dtype=self.dtype).reshape(len(ids), self.dimension)
+        
+        # Vectors first: on load, rows without a matching id line are discarded
+        with open(os.path.join(self.path, VECTORS_FILE), 'ab') as f:
+            f.write(vectors.tobytes())
+        lines = [(json.dumps({'id': record_id, 'metadata': meta}) + '\n').encode('utf-8')
+                 for record_id, meta in zip(ids, metadata)]
+        with open(os.path.join(self.path, RECORDS_FILE), 'ab') as f:
+            f.write(b''.join(lines))
+        for line in lines:
+            self._offsets.append(self._offsets[-1] + len(line))
+        
+        start = len(self.ids)
+        self.ids.extend(ids)
+        self._vectors = None
+        return range(start, len(self.ids))
+    
+    def tombstone(self, rows):
+        rows = [row for row in rows if row not in self.tombstones]
+        if not rows:
+            return
+        
+        with open(os.path.join(self.path, TOMBSTONES_FILE), 'a', encoding='utf-8') as f:
+            for row in rows:
+                f.write(f"{row}\n")
+        self.tombstones.update(rows)
+    
+    def _load(self):
+        records_path = os.path.join(self.path, RECORDS_FILE)
+        vectors_path = os.path.join(self.path, VECTORS_FILE)
+        tombstones_path = os.path.join(self.path, TOMBSTONES_FILE)
+        
+        if os.path.exists(records_path):
+            with open(records_path, 'rb') as f:
+                for line in f:
+                    # Torn write at the end of the file (not valid JSON, or no line break yet)
+                    if not line.endswith(b'\n'):
+                        break
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break
+                    self.ids.append(record['id'])
+                    self._offsets.append(self._offsets[-1] + len(line))
+        
+        stored_rows = os.path.getsize(vectors_path) // self.row_bytes if os.path.exists(vectors_path) else 0
+        rows = min(stored_rows, len(self.ids))
+        del self.ids[rows:]
+        del self._offsets[rows + 1:]
+        
+        # Drop any partially written tail of either file so later appends stay aligned
+        if not self.read_only:
+            if os.path.exists(vectors_path) and os.path.getsize(vectors_path) != rows * self.row_bytes:
+                with open(vectors_path, 'r+b') as f:
+                    f.truncate(rows * self.row_bytes)
+            if os.path.exists(records_path) and os.path.getsize(records_path) != self._offsets[rows]:
+                with open(records_path, 'r+b') as f:
+                    f.truncate(self._offsets[rows])
+        
+        if os.path.exists(tombstones_path):
+            with open(tombstones_path, 'r', encoding='utf-8') as f:
+                # A line the writer is still appending has no line break yet
+                tombstones = {int(line) for line in f if line.endswith('\n') and line.strip()}
+            self.tombstones = {row for row in tombstones if row < rows}
+            if len(self.tombstones) != len(tombstones) and not self.read_only:
+                # Rows dropped above would otherwise tombstone the rows appended in their place
+                with open(tombstones_path, 'w', encoding='utf-8') as f:
+                    f.writelines(f"{row}\n" for row in sorted(self.tombstones))
+
+
+class StoreLockedError(RuntimeError):
+    """Raised when another process already has the vector store open"""
+
+
+class VectorStore:
+    """
+    Persistent, segment-based store for image embeddings keyed by "{product_id}#{image_url}".
+    
+    Sealed segments are immutable and memory-mapped read-only, so startup only reads the id
+    tables and the OS page cache is shared between worker processes. New upserts are appended to
+    the tail segment, which is sealed once it holds `max_tail_rows` rows. `compact` merges the
+    sealed segments into one and drops tombstoned rows. A single writer process is enforced
+    with an exclusive lock on the directory, held until `close` (or the process exits).
+    
+    With `read_only=True` the store takes a shared lock instead, so any number of readers
+    (other workers, the evaluation scripts) can open it next to the writer. A reader sees the
+    records that were on disk when it was opened and never writes; the writer keeps the
+    segments it compacted away until no reader is left.
+    """
+    
+    def __init__(self, path, dimension=512, dtype='float32', max_tail_rows=50000, read_only=False):
+        self.path = path
+        self.read_only = read_only
+        self.dimension = dimension
+        self.dtype = np.dtype(dtype)
+        self.max_tail_rows = max_tail_rows
+        
+        self._lock = threading.RLock()
+        self._compaction_lock = threading.Lock()
+        self._segments: List[Segment] = []
+        # id -> (segment, row) of the live copy
+        self._locations: Dict[str, tuple] = {}
+        self._next_segment = 0
+        # Compacted segments still waiting for the readers to go away
+        self._retired: List[str] = []
+        
+        if read_only:
+            if not os.path.isdir(path):
+                raise FileNotFoundError(f"Vector store at {path} does not exist")
+            # Blocks only while the writer is deleting segments
+            self._lock_file = open(os.path.join(path, READERS_LOCK_FILE), 'a')
+            fcntl.flock(self._lock_file, fcntl.LOCK_SH)
+        else:
+            os.makedirs(path, exist_ok=True)
+            self._lock_file = open(os.path.join(path, LOCK_FILE), 'a')
+            try:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                self._lock_file.close()
+                raise StoreLockedError(f"Vector store at {path} is already open in another process (single writer only)")
+        self._load()
+    
+    def close(self):
+        """Release the writer (or reader) lock"""
+        if self._lock_file.closed:
+            return
+        if not self.read_only:
+            with self._compaction_lock:
+                self._remove_segments([])
+        self._lock_file.close()
+    
+    def __len__(self):
+        return len(self._locations)
+    
+    def __contains__(self, record_id):
+        return record_id in self._locations
+    
+    def get(self, ids):
+        """Return the stored records for the given ids as {'id', 'values', 'metadata'} dicts, keyed by id"""
+        records = {}
+        with self._lock:
+            for record_id in ids:
+                location = self._locations.get(record_id)
+                if location is None:
+                    continue
+                segment, row = location
+                records[record_id] = {
+                    'id': record_id,
+                    'values': np.asarray(segment.vectors[row], dtype=np.float32),
+                    'metadata': segment.read_metadata([row])[0],
+                }
+        return records
+    
+    def get_vectors(self, ids):
+        """Return the stored vectors for the given ids keyed by id, without reading their metadata"""
+        vectors = {}
+        with self._lock:
+            for record_id in ids:
+                location = self._locations.get(record_id)
+                if location is not None:
+                    segment, row = location
+                    vectors[record_id] = np.asarray(segment.vectors[row], dtype=np.float32)
+        return vectors
+    
+    def items(self):
+        """Yield (id, vector, metadata) for every live record, segment by segment"""
+        with self._lock:
+            locations = list(self._locations.items())
+        
+        for record_id, (segment, row) in locations:
+            yield record_id, np.asarray(segment.vectors[row], dtype=np.float32), segment.read_metadata([row])[0]
+    
+    def memory_bytes(self):
+        """Estimated bytes held in memory: id tables, record offsets and the id -> location map"""
+        with self._lock:
+            # One (segment, row) tuple and row int per live id
+            total = sys.getsizeof(self._locations) + len(self._locations) * (sys.getsizeof((None, 0)) + sys.getsizeof(2 ** 20))
+            return total + sum(segment.memory_bytes() for segment in self._segments)
+    
+    def records(self):
+        """Yield (id, metadata) for every live record, without reading the vectors"""
+        with self._lock:
+            locations = list(self._locations.items())
+        
+        for record_id, (segment, row) in locations:
+            yield record_id, segment.read_metadata([row])[0]
+    
+    def upsert(self, elements):
+        """Append elements of the form {'id', 'embedding', 'metadata'}, superseding older copies"""
+        self._check_writable()
+        if not elements:
+            return
+        
+        ids = [el['id'] for el in elements]
+        vectors = np.stack([np.asarray(el['embedding'], dtype=np.float32).reshape(-1) for el in elements])
+        metadata = [el.get('metadata') or {} for el in elements]
+        
+        with self._lock:
+            self.delete(ids)
+            tail = self._tail()
+            rows = tail.append(ids, vectors, metadata)
+            for record_id, row in zip(ids, rows):
+                self._locations[record_id] = (tail, row)
+            
+            if len(tail) >= self.max_tail_rows:
+                self._seal_tail()
+    
+    def delete(self, ids):
+        self._check_writable()
+        with self._lock:
+            by_segment = {}
+            for record_id in ids:
+                location = self._locations.pop(record_id, None)
+                if location is not None:
+                    by_segment.setdefault(location[0], []).append(location[1])
+            
+            for segment, rows in by_segment.items():
+                segment.tombstone(rows)
+    
+    def compact(self):
+        """Merge every sealed segment into a single one, dropping tombstoned rows"""
+        self._check_writable()
+        with self._compaction_lock:
+            # Segments compacted away while readers were open
+            self._remove_segments([])
+            with self._lock:
+                self._seal_tail()
+                sealed = self._segments[:-1]
+                if len(sealed) <= 1 and not any(segment.tombstones for segment in sealed):
+                    return
+                merged = Segment(self._new_segment_path(), self.dimension, self.dtype)
+            
+            # Copy outside the lock; upserts meanwhile only touch the tail
+            copied = []
+            for segment in sealed:
+                live_rows = segment.live_rows()
+                for start in range(0, len(live_rows), COPY_CHUNK_ROWS):
+                    rows = live_rows[start:start + COPY_CHUNK_ROWS]
+                    merged.append([segment.ids[row] for row in rows],
+                                  segment.vectors[rows],
+                                  segment.read_metadata(rows))
+                    copied.extend((segment, row) for row in rows)
+            
+            with self._lock:
+                stale = []
+                for merged_row, (segment, row) in enumerate(copied):
+                    record_id = segment.ids[row]
+                    if self._locations.get(record_id) == (segment, row):
+                        self._locations[record_id] = (merged, merged_row)
+                    else:
+                        # Deleted or superseded while the merge was running
+                        stale.append(merged_row)
+                merged.tombstone(stale)
+                
+                self._segments = [merged] + [s for s in self._segments if s not in sealed]
+                self._write_manifest()
+            
+            self._remove_segments([segment.name for segment in sealed])
+    
+    def start_compaction(self, interval=600):
+        """Run `compact` every `interval` seconds on a daemon thread"""
+        self._check_writable()
+        stop = threading.Event()
+        
+        def run():
+            while not stop.wait(interval):
+                try:
+                    self.compact()
+                except Exception as e:
+                    print(f"Vector store compaction failed: {str(e)}")
+        
+        thread = threading.Thread(target=run, name='vector-store-compaction', daemon=True)
+        thread.start()
+        return stop
+    
+    def _check_writable(self):
+        if self.read_only:
+            raise PermissionError(f"Vector store at {self.path} is open read-only")
+    
+    def _remove_segments(self, names):
+        """Delete segment directories, or retire them while a reader may still map them"""
+        self._retired.extend(names)
+        if not self._retired:
+            return
+        
+        with open(os.path.join(self.path, READERS_LOCK_FILE), 'a') as readers:
+            try:
+                fcntl.flock(readers, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return
+            # New readers wait here, so none of them can load the manifest that still lists these
+            for name in self._retired:
+                shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+            self._retired = []
+    
+    def _tail(self):
+        if not self._segments:
+            self._segments.append(Segment(self._new_segment_path(), self.dimension, self.dtype))
+            self._write_manifest()
+        return self._segments[-1]
+    
+    def _seal_tail(self):
+        if self._segments and len(self._segments[-1]) == 0:
+            return
+        self._segments.append(Segment(self._new_segment_path(), self.dimension, self.dtype))
+        self._write_manifest()
+    
+    def _new_segment_path(self):
+        self._next_segment += 1
+        return os.path.join(self.path, f"segment-{self._next_segment:06d}")
+    
+    def _write_manifest(self):
+        manifest = {
+            'dimension': self.dimension,
+            'dtype': self.dtype.name,
+            'segments': [segment.name for segment in self._segments],
+        }
+        tmp_path = os.path.join(self.path, MANIFEST_FILE + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, os.path.join(self.path, MANIFEST_FILE))
+    
+    def _load(self):
+        manifest_path = os.path.join(self.path, MANIFEST_FILE)
+        if not os.path.exists(manifest_path):
+            return
+        
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        
+        if manifest['dimension'] != self.dimension:
+            raise ValueError(f"Vector store at {self.path} has dimension {manifest['dimension']}, expected {self.dimension}")
+        self.dtype = np.dtype(manifest['dtype'])
+        
+        for name in manifest['segments']:
+            segment = Segment(os.path.join(self.path, name), self.dimension, self.dtype, self.read_only)
+            self._segments.append(segment)
+            self._next_segment = max(self._next_segment, int(name.split('-')[-1]))
+            
+            for row, record_id in enumerate(segment.ids):
+                if row in segment.tombstones:
+                    continue
+                # Later segments win over earlier copies of the same id
+                self._locations[record_id] = (segment, row)
+        
+        if self.read_only:
+            return
+        
+        # Leftovers of an interrupted compaction are not referenced by the manifest. They may
+        # outlive this call while a reader is open, so new segments are numbered past them.
+        listed = set(manifest['segments'])
+        leftovers = [name for name in os.listdir(self.path) if name.startswith('segment-') and name not in listed]
+        for name in leftovers:
+            self._next_segment = max(self._next_segment, int(name.split('-')[-1]))
+        self._remove_segments(leftovers)
+
+
+def open_vector_store(path, dimension=512, dtype='float32', mode='auto'):
+    """
+    Open the store for writing ('write'), reading ('read'), or for writing unless another
+    process already writes to it ('auto', the mode of every worker after the first)
+    """
+    if mode == 'read':
+        return VectorStore(path, dimension, dtype, read_only=True)
+    try:
+        return VectorStore(path, dimension, dtype)
+    except StoreLockedError:
+        if mode != 'auto':
+            raise
+        print(f"Vector store at {path} is written by another process, opening it read-only")
+        return VectorStore(path, dimension, dtype, read_only=True)
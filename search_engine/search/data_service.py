@@ -0,0 +1,191 @@
+import asyncio
+import threading
+import time
+
+import httpx
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from .utils.logger import logger
+
+
+class DataServiceUnavailable(requests.RequestException):
+    """Raised without calling the data service while the circuit breaker is open"""
+
+
+# Everything the sync and async clients raise when the data service call fails
+DATA_SERVICE_ERRORS = (requests.RequestException, httpx.HTTPError)
+
+
+class CircuitBreaker:
+    """
+    Tracks data service health from real request outcomes.
+
+    After `failure_threshold` consecutive failures the breaker opens and calls fail fast for
+    `reset_timeout` seconds. Then a single trial call is let through (half-open): success
+    closes the breaker, failure opens it again. Every call let through must be settled by
+    record_success, record_failure or, if it ended without an outcome, release.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self.state = self.CLOSED
+
+    def release(self) -> None:
+        """Settle a call that ended without an outcome (e.g. cancelled), so a half-open trial can be retried"""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f"Data service circuit breaker opened after {self._failures} failures")
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+class DataServiceClient:
+    """Shared HTTP client for the data service: pooled keep-alive connections, timeouts and a circuit breaker"""
+
+    def __init__(self,
+                 base_url: str,
+                 connect_timeout: float = 2,
+                 read_timeout: float = 10,
+                 pool_size: int = 20,
+                 breaker: CircuitBreaker = None):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.breaker = breaker or CircuitBreaker()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        return self.request('POST', path, **kwargs)
+
+    def request(self, method: str, path: str, **kwargs) -> requests.Response:
+        if not self.breaker.allow():
+            raise DataServiceUnavailable("Data service is unavailable (circuit open)")
+
+        kwargs.setdefault('timeout', self.timeout)
+        try:
+            response = self.session.request(method, f"{self.base_url}{path}", **kwargs)
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            self.breaker.release()
+            raise
+
+        # Client errors are the caller's problem, not a sign of an unhealthy service
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+
+class AsyncDataServiceClient:
+    """
+    Async counterpart of DataServiceClient for the ASGI views, sharing its circuit breaker.
+
+    httpx clients are bound to the event loop they were first used on, so one client is kept
+    per running loop (a single one under an ASGI server).
+    """
+
+    def __init__(self,
+                 base_url: str,
+                 connect_timeout: float = 2,
+                 read_timeout: float = 10,
+                 pool_size: int = 100,
+                 breaker: CircuitBreaker = None):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        self.breaker = breaker or CircuitBreaker()
+        self._client = None
+        self._loop = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._client = httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout, limits=self.limits)
+            self._loop = loop
+        return self._client
+
+    async def get(self, path: str, **kwargs) -> httpx.Response:
+        return await self.request('GET', path, **kwargs)
+
+    async def post(self, path: str, **kwargs) -> httpx.Response:
+        return await self.request('POST', path, **kwargs)
+
+    async def request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        if not self.breaker.allow():
+            raise DataServiceUnavailable("Data service is unavailable (circuit open)")
+
+        try:
+            response = await self._get_client().request(method, path, **kwargs)
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            # Cancelled before an outcome: hand a half-open trial back instead of wedging the breaker
+            self.breaker.release()
+            raise
+
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+
+data_service = DataServiceClient(
+    settings.DATA_SERVICE_URL,
+    connect_timeout=getattr(settings, 'DATA_SERVICE_CONNECT_TIMEOUT', 2),
+    read_timeout=getattr(settings, 'DATA_SERVICE_READ_TIMEOUT', 10),
+    pool_size=getattr(settings, 'DATA_SERVICE_POOL_SIZE', 20),
+    breaker=CircuitBreaker(
+        failure_threshold=getattr(settings, 'DATA_SERVICE_BREAKER_THRESHOLD', 5),
+        reset_timeout=getattr(settings, 'DATA_SERVICE_BREAKER_RESET', 30),
+    ),
+)
+
+async_data_service = AsyncDataServiceClient(
+    settings.DATA_SERVICE_URL,
+    connect_timeout=getattr(settings, 'DATA_SERVICE_CONNECT_TIMEOUT', 2),
+    read_timeout=getattr(settings, 'DATA_SERVICE_READ_TIMEOUT', 10),
+    pool_size=getattr(settings, 'DATA_SERVICE_ASYNC_POOL_SIZE', 100),
+    breaker=data_service.breaker,
+)
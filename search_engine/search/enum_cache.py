@@ -0,0 +1,127 @@
+import threading
+import time
+from typing import Dict, FrozenSet, List, Optional
+
+import requests
+from django.conf import settings
+
+from .data_service import DATA_SERVICE_ERRORS, async_data_service, data_service
+from .utils.logger import logger
+
+
+ENUM_NAMES = ['categories', 'currencies', 'shops', 'regions']
+
+
+class EnumSnapshot:
+    """One version of the enum values: sorted lists for the templates, frozensets for validation"""
+
+    def __init__(self, data: Dict, etag: Optional[str] = None):
+        self.etag = etag
+        self.values: Dict[str, List[str]] = {name: list(data.get(name) or []) for name in ENUM_NAMES}
+        self.sets: Dict[str, FrozenSet[str]] = {name: frozenset(values) for name, values in self.values.items()}
+        self.counts: Dict[str, Dict[str, int]] = data.get('counts') or {}
+        self.fetched_at = time.monotonic()
+
+
+class EnumCache:
+    """
+    Process-local cache of the data service's /enums.
+
+    Within `ttl` seconds the cached values are served as is. After that, up to `stale_ttl`
+    seconds, the stale values are still served while one background thread revalidates them
+    with If-None-Match, so an unchanged enum set costs a 304 and no request waits on it.
+    Past `stale_ttl` (or before the first load) the caller refreshes synchronously.
+    """
+
+    def __init__(self, ttl: float = 60, stale_ttl: float = 600):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._snapshot: Optional[EnumSnapshot] = None
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def get(self) -> EnumSnapshot:
+        snapshot = self._snapshot
+        if snapshot is not None:
+            age = time.monotonic() - snapshot.fetched_at
+            if age < self.ttl:
+                return snapshot
+            if age < self.stale_ttl:
+                self._refresh_in_background()
+                return snapshot
+
+        try:
+            return self.refresh()
+        except requests.RequestException:
+            if snapshot is not None:
+                logger.warning("Could not refresh enums, serving stale values")
+                return snapshot
+            raise
+
+    async def aget(self) -> EnumSnapshot:
+        """Same as get() for async views: only a missing or expired snapshot awaits the data service"""
+        snapshot = self._snapshot
+        if snapshot is not None:
+            age = time.monotonic() - snapshot.fetched_at
+            if age < self.ttl:
+                return snapshot
+            if age < self.stale_ttl:
+                self._refresh_in_background()
+                return snapshot
+
+        try:
+            return await self.arefresh()
+        except DATA_SERVICE_ERRORS:
+            if snapshot is not None:
+                logger.warning("Could not refresh enums, serving stale values")
+                return snapshot
+            raise
+
+    def refresh(self) -> EnumSnapshot:
+        current = self._snapshot
+        response = data_service.get('/enums', headers=self._headers(current))
+        return self._update(current, response)
+
+    async def arefresh(self) -> EnumSnapshot:
+        current = self._snapshot
+        response = await async_data_service.get('/enums', headers=self._headers(current))
+        return self._update(current, response)
+
+    @staticmethod
+    def _headers(current: Optional[EnumSnapshot]) -> Dict[str, str]:
+        return {'If-None-Match': current.etag} if current is not None and current.etag else {}
+
+    def _update(self, current: Optional[EnumSnapshot], response) -> EnumSnapshot:
+        if response.status_code == 304 and current is not None:
+            current.fetched_at = time.monotonic()
+            return current
+
+        response.raise_for_status()
+        snapshot = EnumSnapshot(response.json(), response.headers.get('ETag'))
+        self._snapshot = snapshot
+        return snapshot
+
+    def invalidate(self) -> None:
+        self._snapshot = None
+
+    def _refresh_in_background(self) -> None:
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.warning(f"Background enum refresh failed: {str(e)}")
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, name='enum-refresh', daemon=True).start()
+
+
+enum_cache = EnumCache(
+    ttl=getattr(settings, 'ENUM_CACHE_TTL', 60),
+    stale_ttl=getattr(settings, 'ENUM_CACHE_STALE_TTL', 600),
+)
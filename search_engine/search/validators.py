@@ -1,22 +1,22 @@
 from datetime import datetime
-from typing import Dict, Any, List
+from typing import Dict, Any, List, FrozenSet, Union
 from rest_framework.exceptions import ValidationError
 
 class FilterValidator:
-    VALID_STATUSES = ['IN_STOCK', 'OUT_OF_STOCK']
+    VALID_STATUSES = frozenset(['IN_STOCK', 'OUT_OF_STOCK'])
     
     @staticmethod
-    def validate_category(category_name: List[str], valid_categories: List[str]) -> None:
-        if set(category_name) - set(valid_categories):
+    def validate_category(category_name: List[str], valid_categories: FrozenSet[str]) -> None:
+        if not valid_categories.issuperset(category_name):
             raise ValidationError({
-                'category_name': f'Invalid category. Must be one of: {", ".join(valid_categories)}'
+                'category_name': f'Invalid category. Must be one of: {", ".join(sorted(valid_categories))}'
             })
 
     @staticmethod
-    def validate_currency(currency: str, valid_currencies: List[str]) -> None:
+    def validate_currency(currency: str, valid_currencies: FrozenSet[str]) -> None:
         if currency not in valid_currencies:
             raise ValidationError({
-                'currency': f'Invalid currency. Must be one of: {", ".join(valid_currencies)}'
+                'currency': f'Invalid currency. Must be one of: {", ".join(sorted(valid_currencies))}'
             })
 
     @staticmethod
@@ -48,24 +48,26 @@ class FilterValidator:
             })
 
     @staticmethod
-    def validate_shop(shop_name: str, valid_shops: List[str]) -> None:
-        if shop_name not in valid_shops:
+    def validate_shop(shop_name: Union[str, List[str]], valid_shops: FrozenSet[str]) -> None:
+        # The serializer delivers a list of shops
+        shop_names = [shop_name] if isinstance(shop_name, str) else shop_name
+        if not valid_shops.issuperset(shop_names):
             raise ValidationError({
-                'shop_name': f'Invalid shop name. Must be one of: {", ".join(valid_shops)}'
+                'shop_name': f'Invalid shop name. Must be one of: {", ".join(sorted(valid_shops))}'
             })
 
     @staticmethod
     def validate_status(status: str) -> None:
         if status and status not in FilterValidator.VALID_STATUSES:
             raise ValidationError({
-                'status': f'Invalid status. Must be one of: {", ".join(FilterValidator.VALID_STATUSES)}'
+                'status': f'Invalid status. Must be one of: {", ".join(sorted(FilterValidator.VALID_STATUSES))}'
             })
 
     @staticmethod
-    def validate_region(region: str, valid_regions: List[str]) -> None:
+    def validate_region(region: str, valid_regions: FrozenSet[str]) -> None:
         if region not in valid_regions:
             raise ValidationError({
-                'region': f'Invalid region. Must be one of: {", ".join(valid_regions)}'
+                'region': f'Invalid region. Must be one of: {", ".join(sorted(valid_regions))}'
             })
 
     @staticmethod
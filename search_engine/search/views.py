@@ -1,21 +1,19 @@
-from rest_framework.views import APIView
+from django.http import JsonResponse
+from django.views import View
 from django.views.generic import TemplateView
-from rest_framework.response import Response
 from rest_framework import status
 from .serializers import SearchRequestSerializer
-import requests
 import json
-from django.conf import settings
 from .utils.logger import log_search_request
 from .validators import FilterValidator
+from .enum_cache import EnumSnapshot, enum_cache
+from .data_service import DATA_SERVICE_ERRORS, async_data_service
 from rest_framework.exceptions import ValidationError
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 
 def get_enums() -> Dict[str, List[str]]:
-    # Implement fetching enums from backend
-    response = requests.get(f"{settings.DATA_SERVICE_URL}/enums")
-    response.raise_for_status()
-    return response.json()
+    # Served from the process-local cache, revalidated against the data service with ETags
+    return enum_cache.get().values
 
 class SearchPageView(TemplateView):
     template_name = 'search/page.html'
@@ -71,18 +69,16 @@ def prepare_filters_for_data_service(validated_data: Dict[str, Any]) -> Dict[str
     return prepared_filters
 
 
-def validate_fields(validated_data: Dict[str, Any]) -> None:
+def validate_fields(validated_data: Dict[str, Any], snapshot: Optional[EnumSnapshot] = None) -> None:
     """Validate individual fields against backend data"""
     errors = {}
 
     # Get valid options from backend
-    
-    
-    enums = get_enums()
-    valid_categories = enums.get('categories')
-    valid_currencies = enums.get('currencies')
-    valid_shops = enums.get('shops')
-    valid_regions = enums.get('regions')
+    enums = (snapshot or enum_cache.get()).sets
+    valid_categories = enums['categories']
+    valid_currencies = enums['currencies']
+    valid_shops = enums['shops']
+    valid_regions = enums['regions']
 
     if category_name := validated_data.get('category_name'):
         try:
@@ -157,8 +153,26 @@ def get_filters_data_from_request(request):
     
     return data
 
-class SemanticSearchAPI(APIView):
-    def get(self, request):
+async def search_with_validation(path: str, payload: Dict[str, Any], validated_data: Dict[str, Any]):
+    """
+    Validate the request fields against the cached enums, then send the search to the data service.
+
+    The enums are usually served from the cache without a round trip, so validating first
+    costs nothing and an invalid request never reaches the data service.
+    """
+    validate_fields(validated_data, await enum_cache.aget())
+
+    response = await async_data_service.post(path, json=payload)
+    response.raise_for_status()
+    return response.json()
+
+
+class SemanticSearchAPI(View):
+    """
+    Async view: the data service round trip is awaited, so an ASGI worker keeps serving
+    other searches meanwhile.
+    """
+    async def get(self, request):
         try:
             # Extract query parameters
             query = request.GET.get('query')
@@ -166,7 +180,7 @@ class SemanticSearchAPI(APIView):
             # Test handling
             if query == 'test':
                 with open("test_products.json") as f:
-                    return Response(json.load(f))
+                    return JsonResponse(json.load(f), safe=False)
             
             filters_data = get_filters_data_from_request(request)
             
@@ -175,7 +189,7 @@ class SemanticSearchAPI(APIView):
             serializer = SearchRequestSerializer(data=filters_data)
             
             if not serializer.is_valid():
-                return Response(
+                return JsonResponse(
                     serializer.errors, 
                     status=status.HTTP_400_BAD_REQUEST
                 )
@@ -183,56 +197,50 @@ class SemanticSearchAPI(APIView):
             # Get validated data 
             validated_data = serializer.validated_data
             
-            # Validate individual fields against backend data
-            validate_fields(validated_data)
-            
             # Prepare filters for data service
             data_service_filters = prepare_filters_for_data_service(validated_data)
             
-            # Call the data service
-            requests.get(f"{settings.DATA_SERVICE_URL}/health")
-            
-            response = requests.post(
-                f"{settings.DATA_SERVICE_URL}/semantic_search",
-                json={
+            # Validate individual fields against the cached backend enums, then call the data service
+            results = await search_with_validation(
+                '/semantic_search',
+                {
                     "query": validated_data['query'],
                     "filters": data_service_filters
-                }
+                },
+                validated_data
             )
-        
-            response.raise_for_status()
-            results = response.json()['results']
             
-            return Response(results)
+            return JsonResponse(results['results'], safe=False)
             
         except ValidationError as e:
-            return Response(
+            return JsonResponse(
                 e.detail,
-                status=status.HTTP_400_BAD_REQUEST
+                status=status.HTTP_400_BAD_REQUEST,
+                safe=False
             )
-        except requests.RequestException as e:
-            return Response(
+        except DATA_SERVICE_ERRORS as e:
+            return JsonResponse(
                 {"error": f"Data service error: {str(e)}"},
                 status=status.HTTP_503_SERVICE_UNAVAILABLE
             )
         except Exception as e:
-            return Response(
+            return JsonResponse(
                 {"error": f"Unexpected error: {str(e)}"},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
 
-class KeywordSearchAPI(APIView):
+class KeywordSearchAPI(View):
     """
     API endpoint for keyword-based search functionality.
     """
-    def get(self, request):
+    async def get(self, request):
         try:
             # Extract query parameters
             keyword = request.GET.get('keyword', '').strip()
             
             if not keyword:
-                return Response(
+                return JsonResponse(
                     {"error": "Keyword parameter is required"}, 
                     status=status.HTTP_400_BAD_REQUEST
                 )
@@ -243,7 +251,7 @@ class KeywordSearchAPI(APIView):
             serializer = SearchRequestSerializer(data=filters_data)
             
             if not serializer.is_valid():
-                return Response(
+                return JsonResponse(
                     serializer.errors, 
                     status=status.HTTP_400_BAD_REQUEST
                 )
@@ -251,9 +259,6 @@ class KeywordSearchAPI(APIView):
             # Get validated data
             validated_data = serializer.validated_data
             
-            # Validate individual fields against backend data
-            validate_fields(validated_data)
-            
             # Prepare filters for data service
             data_service_filters = prepare_filters_for_data_service(validated_data)
             
@@ -264,29 +269,23 @@ class KeywordSearchAPI(APIView):
                 'filters': data_service_filters
             }
 
-            # Send request to data service
-            response = requests.post(
-                f"{settings.DATA_SERVICE_URL}/keyword_search",
-                json=search_data
-            )
-            
-            response.raise_for_status()
-            results = response.json()
+            # Validate individual fields against the cached backend enums, then send the request to the data service
+            results = await search_with_validation('/keyword_search', search_data, validated_data)
             
-            return Response(results)
+            return JsonResponse(results, safe=False)
 
         except ValidationError as e:
-            return Response(
+            return JsonResponse(
                 {'error': str(e)}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
-        except requests.RequestException as e:
-            return Response(
+        except DATA_SERVICE_ERRORS as e:
+            return JsonResponse(
                 {'error': f"Data service error: {str(e)}"}, 
                 status=status.HTTP_503_SERVICE_UNAVAILABLE
             )
         except Exception as e:
-            return Response(
+            return JsonResponse(
                 {'error': f"Unexpected error: {str(e)}"}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
\ No newline at end of file
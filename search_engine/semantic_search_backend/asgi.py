@@ -9,8 +9,11 @@ https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 
 import os
 
+from django.contrib.staticfiles.handlers import ASGIStaticFilesHandler
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'semantic_search_backend.settings')
 
-application = get_asgi_application()
+# Nothing sits in front of the ASGI workers to serve STATIC_URL (runserver used to), so the
+# search page's static files are served here from the app directories
+application = ASGIStaticFilesHandler(get_asgi_application())
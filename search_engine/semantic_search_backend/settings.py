@@ -142,6 +142,21 @@ DATABASES = {
 
 DATA_SERVICE_URL = os.getenv('DATA_SERVICE_URL', 'http://localhost:5000')
 
+# Pooled HTTP client to the data service (search/data_service.py)
+DATA_SERVICE_CONNECT_TIMEOUT = float(os.getenv('DATA_SERVICE_CONNECT_TIMEOUT', '2'))
+DATA_SERVICE_READ_TIMEOUT = float(os.getenv('DATA_SERVICE_READ_TIMEOUT', '10'))
+DATA_SERVICE_POOL_SIZE = int(os.getenv('DATA_SERVICE_POOL_SIZE', '20'))
+# Connections of the async client used by the search API views under ASGI
+DATA_SERVICE_ASYNC_POOL_SIZE = int(os.getenv('DATA_SERVICE_ASYNC_POOL_SIZE', '100'))
+# Consecutive failures that open the circuit breaker, and seconds before it lets a trial call through
+DATA_SERVICE_BREAKER_THRESHOLD = int(os.getenv('DATA_SERVICE_BREAKER_THRESHOLD', '5'))
+DATA_SERVICE_BREAKER_RESET = float(os.getenv('DATA_SERVICE_BREAKER_RESET', '30'))
+
+# Seconds the enum values fetched from the data service are served without revalidation,
+# and up to which stale values are still served while they are refreshed in the background
+ENUM_CACHE_TTL = float(os.getenv('ENUM_CACHE_TTL', '60'))
+ENUM_CACHE_STALE_TTL = float(os.getenv('ENUM_CACHE_STALE_TTL', '600'))
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -0,0 +1,179 @@
+import asyncio
+import time
+import unittest
+from unittest import mock
+
+import httpx
+import requests
+
+from search.data_service import AsyncDataServiceClient, CircuitBreaker, DataServiceClient, DataServiceUnavailable
+
+
+def trip(breaker):
+    for _ in range(breaker.failure_threshold):
+        breaker.allow()
+        breaker.record_failure()
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def test_opens_after_consecutive_failures(self):
+        """Test the breaker opens only after failure_threshold failures in a row"""
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+        breaker.record_failure()
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(breaker.allow())
+
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow())
+
+    def test_half_open_trial(self):
+        """Test a single trial call is let through after the reset timeout"""
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+        trip(breaker)
+        self.assertFalse(breaker.allow())
+        time.sleep(0.06)
+
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertFalse(breaker.allow())
+
+    def test_half_open_success_closes(self):
+        """Test a successful trial closes the breaker"""
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        trip(breaker)
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(breaker.allow())
+
+    def test_half_open_failure_reopens(self):
+        """Test a failed trial opens the breaker for another reset timeout"""
+        breaker = CircuitBreaker(failure_threshold=5, reset_timeout=0.05)
+        trip(breaker)
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow())
+
+    def test_release_hands_back_the_trial(self):
+        """Test releasing an unsettled trial reopens the breaker so a later call can retry"""
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        trip(breaker)
+        self.assertTrue(breaker.allow())
+        breaker.release()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertTrue(breaker.allow())
+
+    def test_release_when_closed(self):
+        """Test release does not change a closed breaker"""
+        breaker = CircuitBreaker()
+        breaker.release()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+
+class DataServiceClientTest(unittest.TestCase):
+    def setUp(self):
+        self.client = DataServiceClient('http://data:5000/', breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60))
+
+    def respond(self, status_code):
+        response = requests.Response()
+        response.status_code = status_code
+        return mock.patch.object(self.client.session, 'request', return_value=response)
+
+    def test_request(self):
+        """Test requests go to the base URL with the default timeouts"""
+        with self.respond(200) as request:
+            self.assertEqual(self.client.get('/enums').status_code, 200)
+        request.assert_called_once_with('GET', 'http://data:5000/enums', timeout=(2, 10))
+
+    def test_server_errors_open_the_breaker(self):
+        """Test 5xx responses and connection errors count as failures, 4xx do not"""
+        with self.respond(400):
+            self.client.post('/semantic_search')
+            self.client.post('/semantic_search')
+        self.assertEqual(self.client.breaker.state, CircuitBreaker.CLOSED)
+
+        with self.respond(503):
+            self.client.post('/semantic_search')
+        with mock.patch.object(self.client.session, 'request', side_effect=requests.ConnectionError()):
+            with self.assertRaises(requests.ConnectionError):
+                self.client.post('/semantic_search')
+        self.assertEqual(self.client.breaker.state, CircuitBreaker.OPEN)
+
+        with self.respond(200) as request, self.assertRaises(DataServiceUnavailable):
+            self.client.get('/enums')
+        request.assert_not_called()
+
+    def test_unexpected_errors_settle_the_trial(self):
+        """Test an error outside the request library still settles a half-open trial"""
+        breaker = self.client.breaker
+        breaker.reset_timeout = 0
+        trip(breaker)
+        with mock.patch.object(self.client.session, 'request', side_effect=ValueError('bad url')):
+            with self.assertRaises(ValueError):
+                self.client.get('/enums')
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        with self.respond(200):
+            self.client.get('/enums')
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+
+class AsyncDataServiceClientTest(unittest.IsolatedAsyncioTestCase):
+    def client_with(self, handler, breaker):
+        client = AsyncDataServiceClient('http://data:5000', breaker=breaker)
+        transport = httpx.MockTransport(handler)
+        client._get_client = lambda: httpx.AsyncClient(base_url=client.base_url, transport=transport)
+        return client
+
+    async def test_breaker_outcomes(self):
+        """Test the async client records successes and failures on the shared breaker"""
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+        statuses = iter([200, 500, 500])
+        client = self.client_with(lambda request: httpx.Response(next(statuses)), breaker)
+
+        self.assertEqual((await client.get('/enums')).status_code, 200)
+        await client.post('/semantic_search')
+        await client.post('/semantic_search')
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        with self.assertRaises(DataServiceUnavailable):
+            await client.get('/enums')
+
+    async def test_cancelled_trial_is_released(self):
+        """Test a half-open trial cancelled mid-request does not wedge the breaker"""
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        trip(breaker)
+
+        async def hang(request):
+            await asyncio.sleep(10)
+
+        client = self.client_with(hang, breaker)
+        task = asyncio.ensure_future(client.get('/enums'))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertTrue(breaker.allow())
+
+    async def test_transport_errors_count_as_failures(self):
+        """Test connection errors are recorded as failures"""
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+
+        def refuse(request):
+            raise httpx.ConnectError('refused', request=request)
+
+        client = self.client_with(refuse, breaker)
+        with self.assertRaises(httpx.ConnectError):
+            await client.get('/enums')
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import time
+import unittest
+from unittest import mock
+
+import requests
+
+from search import enum_cache as enum_cache_module
+from search.enum_cache import EnumCache
+
+
+ENUMS = {'categories': ['Bags', 'Shoes'], 'currencies': ['EUR'], 'shops': ['A'], 'regions': ['EU'],
+         'counts': {'regions': {'EU': 3}}}
+
+
+def response(status_code=200, data=None, etag=None):
+    result = mock.Mock(status_code=status_code, headers={'ETag': etag} if etag else {})
+    result.json.return_value = data
+    if status_code >= 400:
+        result.raise_for_status.side_effect = requests.HTTPError(str(status_code))
+    return result
+
+
+class EnumCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.get = mock.Mock(return_value=response(data=ENUMS, etag='"1.4"'))
+        patch = mock.patch.object(enum_cache_module.data_service, 'get', self.get)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def age(self, cache, seconds):
+        cache._snapshot.fetched_at = time.monotonic() - seconds
+
+    def test_first_load_and_fresh_hits(self):
+        """Test the first call fetches the enums without a validator and fresh calls do not fetch"""
+        cache = EnumCache(ttl=60, stale_ttl=600)
+        snapshot = cache.get()
+        self.assertEqual(snapshot.values['categories'], ['Bags', 'Shoes'])
+        self.assertIn('Shoes', snapshot.sets['categories'])
+        self.assertEqual(snapshot.counts, {'regions': {'EU': 3}})
+        self.assertEqual(snapshot.etag, '"1.4"')
+        self.get.assert_called_once_with('/enums', headers={})
+
+        self.assertIs(cache.get(), snapshot)
+        self.assertEqual(self.get.call_count, 1)
+
+    def test_not_modified_keeps_snapshot(self):
+        """Test a refresh sends the ETag and a 304 keeps the snapshot, renewing its age"""
+        cache = EnumCache(ttl=60, stale_ttl=600)
+        snapshot = cache.get()
+        self.age(cache, 1000)
+        self.get.return_value = response(304)
+
+        self.assertIs(cache.get(), snapshot)
+        self.get.assert_called_with('/enums', headers={'If-None-Match': '"1.4"'})
+        self.assertLess(time.monotonic() - snapshot.fetched_at, 1)
+
+    def test_changed_enums_replace_snapshot(self):
+        """Test a 200 with a new ETag replaces the snapshot"""
+        cache = EnumCache(ttl=60, stale_ttl=600)
+        cache.get()
+        self.age(cache, 1000)
+        self.get.return_value = response(data=dict(ENUMS, regions=['EU', 'US']), etag='"1.5"')
+
+        snapshot = cache.get()
+        self.assertEqual(snapshot.etag, '"1.5"')
+        self.assertEqual(snapshot.values['regions'], ['EU', 'US'])
+
+    def test_stale_served_while_revalidating(self):
+        """Test a stale snapshot is returned at once while one background thread revalidates it"""
+        cache = EnumCache(ttl=60, stale_ttl=600)
+        snapshot = cache.get()
+        self.age(cache, 120)
+        self.get.return_value = response(304)
+
+        with mock.patch.object(enum_cache_module.threading, 'Thread') as thread:
+            self.assertIs(cache.get(), snapshot)
+            self.assertIs(cache.get(), snapshot)
+        thread.assert_called_once()
+        self.assertEqual(self.get.call_count, 1)
+
+    def test_stale_served_when_data_service_fails(self):
+        """Test an expired snapshot is still served when the refresh fails, and errors without one"""
+        cache = EnumCache(ttl=60, stale_ttl=600)
+        self.get.side_effect = requests.ConnectionError('down')
+        with self.assertRaises(requests.ConnectionError):
+            cache.get()
+
+        self.get.side_effect = None
+        snapshot = cache.get()
+        self.age(cache, 1000)
+        self.get.return_value = response(500)
+        self.assertIs(cache.get(), snapshot)
+
+
+class AsyncEnumCacheTest(unittest.IsolatedAsyncioTestCase):
+    async def test_not_modified(self):
+        """Test the async refresh also revalidates with the ETag and keeps the snapshot on a 304"""
+        get = mock.AsyncMock(side_effect=[response(data=ENUMS, etag='"2.0"'), response(304)])
+        with mock.patch.object(enum_cache_module.async_data_service, 'get', get):
+            cache = EnumCache(ttl=60, stale_ttl=600)
+            snapshot = await cache.aget()
+            self.assertIs(await cache.aget(), snapshot)
+            self.assertEqual(get.await_count, 1)
+
+            cache._snapshot.fetched_at = time.monotonic() - 1000
+            self.assertIs(await cache.aget(), snapshot)
+        get.assert_awaited_with('/enums', headers={'If-None-Match': '"2.0"'})
+
+
+if __name__ == '__main__':
+    unittest.main()
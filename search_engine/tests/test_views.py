@@ -0,0 +1,48 @@
+import unittest
+from unittest import mock
+
+from rest_framework.exceptions import ValidationError
+
+from search import views
+from search.enum_cache import EnumSnapshot
+
+
+SNAPSHOT = EnumSnapshot({
+    'categories': ['Shoes', 'Bags'],
+    'currencies': ['USD'],
+    'shops': ['A'],
+    'regions': ['EU'],
+})
+
+
+class SearchWithValidationTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.response = mock.Mock()
+        self.response.json.return_value = {'results': ['p1']}
+        self.post = mock.AsyncMock(return_value=self.response)
+        patches = [
+            mock.patch.object(views.enum_cache, 'aget', mock.AsyncMock(return_value=SNAPSHOT)),
+            mock.patch.object(views.async_data_service, 'post', self.post),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    async def test_valid_request_is_sent(self):
+        """Test a valid request is posted to the data service and its results returned"""
+        payload = {'query': 'shoes', 'filters': {'category': ['Shoes']}}
+        result = await views.search_with_validation('/semantic_search', payload, {'category_name': ['Shoes'], 'region': 'EU'})
+
+        self.assertEqual(result, {'results': ['p1']})
+        self.post.assert_awaited_once_with('/semantic_search', json=payload)
+        self.response.raise_for_status.assert_called_once()
+
+    async def test_invalid_request_is_not_sent(self):
+        """Test a request failing validation never reaches the data service"""
+        with self.assertRaises(ValidationError):
+            await views.search_with_validation('/semantic_search', {'query': 'x'}, {'region': 'Mars'})
+        self.post.assert_not_awaited()
+
+
+if __name__ == '__main__':
+    unittest.main()